@@ -1,7 +1,21 @@
 import os
 from flask import Flask
+from .bulk import bulk_writer
+from .cache import response_cache
+from .compression import compressor
+from .counts import row_counts
+from .credentials import credential_cache, token_generations
+from .export import todo_exporter
+from .hit_counter import hit_counter
+from .metrics import metrics
 from .models import db
+from .profiler import profiler
+from .rate_limit import local_limiter
+from .search import todo_search
+from .serializer import serializer
+from .store import redis_store
 from .tasks import celery
+from .write_behind import write_behind
 
 
 def create_app(config_module=None):
@@ -11,11 +25,30 @@ def create_app(config_module=None):
                          'config')
   celery.config_from_object(app.config)
 
+  serializer.init_app(app)
+  metrics.init_app(app)
+  profiler.init_app(app)
   db.init_app(app)
+  redis_store.init_app(app)
+  local_limiter.init_app(app)
+  hit_counter.init_app(app)
+  response_cache.init_app(app)
+  compressor.init_app(app)
+  credential_cache.init_app(app)
+  token_generations.init_app(app)
+  bulk_writer.init_app(app)
+  todo_exporter.init_app(app)
+  write_behind.init_app(app)
+  todo_search.init_app(app)
+  row_counts.init_app(app)
 
   from api.v1_0 import api as api_blueprint
   app.register_blueprint(api_blueprint, url_prefix='/api/v1.0')
 
+  if app.config['METRICS']:
+    from api.prometheus import prometheus as prometheus_blueprint
+    app.register_blueprint(prometheus_blueprint)
+
   if app.config['USE_TOKEN_AUTH']:
     from api.token import token as token_blueprint
     app.register_blueprint(token_blueprint, url_prefix='/auth')
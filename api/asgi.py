@@ -0,0 +1,244 @@
+"""ASGI serving mode for the API.
+
+:func:`create_asgi_app` wraps the application returned by
+:func:`api.app.create_app` for asyncio servers such as uvicorn. Sockets,
+request bodies and response writes are handled on the event loop, so
+idle and slow connections do not hold a thread. Views run unchanged in
+a bounded pool of ``ASGI_WORKERS`` threads, which keeps every decorator
+(auth, rate limiting, ETags, pagination, caching) exactly as it is in
+WSGI mode. Request bodies are handed to the view as they arrive and
+responses are streamed back chunk by chunk, both with backpressure, so
+neither an import nor the NDJSON export is ever held in memory whole. A
+client that disconnects stops its response at the next chunk.
+
+uvicorn's ``WSGIMiddleware`` and asgiref's ``WsgiToAsgi`` both read the
+whole request body before calling the app, which is why the adapter is
+kept here.
+"""
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import ClientDisconnected
+from .app import create_app
+
+_done = object()
+
+
+class RequestBody:
+  """``wsgi.input`` reading the request body from the event loop.
+
+  Runs in the worker thread; every read that needs more data waits for
+  the next ``http.request`` message, and raises
+  :class:`~werkzeug.exceptions.ClientDisconnected` when the client left
+  before sending all of it.
+  """
+  def __init__(self, loop, queue, disconnected):
+    self.loop = loop
+    self.queue = queue
+    self.disconnected = disconnected
+    self.buffer = bytearray()
+    self.eof = False
+
+  def fill(self):
+    if self.eof:
+      return False
+    chunk = asyncio.run_coroutine_threadsafe(self.queue.get(),
+                                             self.loop).result()
+    if chunk is _done:
+      if self.disconnected.is_set():
+        raise ClientDisconnected()
+      self.eof = True
+      return False
+    self.buffer += chunk
+    return True
+
+  def take(self, size):
+    data = bytes(self.buffer[:size])
+    del self.buffer[:size]
+    return data
+
+  def read(self, size=-1):
+    while (size is None or size < 0 or len(self.buffer) < size) and \
+        self.fill():
+      pass
+    return self.take(len(self.buffer) if size is None or size < 0 else size)
+
+  def readline(self, size=-1):
+    while b'\n' not in self.buffer and \
+        (size is None or size < 0 or len(self.buffer) < size) and self.fill():
+      pass
+    end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+    if size is not None and size >= 0:
+      end = min(end, size)
+    return self.take(end)
+
+  def __iter__(self):
+    line = self.readline()
+    while line:
+      yield line
+      line = self.readline()
+
+
+def build_environ(scope, body):
+  """Translate an ASGI HTTP ``scope`` into a WSGI environ."""
+  server = scope.get('server') or ('localhost', 80)
+  client = scope.get('client') or ('', 0)
+  environ = {
+      'REQUEST_METHOD': scope['method'],
+      'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode(
+          'latin-1'),
+      'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+      'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+      'SERVER_NAME': server[0],
+      'SERVER_PORT': str(server[1]),
+      'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+      'REMOTE_ADDR': client[0],
+      'REMOTE_PORT': str(client[1]),
+      'wsgi.version': (1, 0),
+      'wsgi.url_scheme': scope.get('scheme', 'http'),
+      'wsgi.input': body,
+      'wsgi.input_terminated': True,
+      'wsgi.errors': sys.stderr,
+      'wsgi.multithread': True,
+      'wsgi.multiprocess': False,
+      'wsgi.run_once': False
+  }
+  for name, value in scope.get('headers', []):
+    name = name.decode('latin-1').upper().replace('-', '_')
+    value = value.decode('latin-1')
+    if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+      name = 'HTTP_' + name
+    if name in environ:
+      value = environ[name] + ',' + value
+    environ[name] = value
+  return environ
+
+
+class AsyncApp:
+  """ASGI application that runs a WSGI app in a bounded thread pool."""
+  def __init__(self, app, workers=32, buffer=8):
+    self.app = app
+    self.executor = ThreadPoolExecutor(workers, thread_name_prefix='asgi')
+    self.buffer = buffer
+
+  async def __call__(self, scope, receive, send):
+    if scope['type'] == 'lifespan':
+      return await self.lifespan(receive, send)
+    if scope['type'] != 'http':  # pragma: no cover
+      raise ValueError('Unsupported ASGI scope: ' + scope['type'])
+    loop = asyncio.get_running_loop()
+    body = asyncio.Queue(self.buffer)
+    disconnected = threading.Event()
+    receiving = loop.create_task(self.receive(receive, body, disconnected))
+    environ = build_environ(scope, RequestBody(loop, body, disconnected))
+    chunks = asyncio.Queue(self.buffer)
+    task = loop.run_in_executor(self.executor, self.call, environ, loop,
+                                chunks, disconnected)
+    chunk = None
+    started = False
+    try:
+      while True:
+        chunk = await chunks.get()
+        if chunk is _done:
+          break
+        if disconnected.is_set():
+          continue
+        if not started:
+          status, headers = chunk
+          await send({'type': 'http.response.start', 'status': status,
+                      'headers': headers})
+          started = True
+        elif chunk:
+          await send({'type': 'http.response.body', 'body': chunk,
+                      'more_body': True})
+      if not disconnected.is_set():
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+      receiving.cancel()
+      if chunk is not _done:
+        # the response was cut short; the worker stops at its next read
+        # or write, and its queue is drained until it has let go of it
+        disconnected.set()
+        self.end_body(body)
+        while chunk is not _done:
+          chunk = await chunks.get()
+    await task
+
+  async def receive(self, receive, body, disconnected):
+    """Feed the request body to ``body`` and watch for a disconnect."""
+    more_body = True
+    while True:
+      message = await receive()
+      if message['type'] == 'http.disconnect':
+        disconnected.set()
+        self.end_body(body)
+        return
+      if more_body:
+        more_body = message.get('more_body', False)
+        await body.put(message.get('body', b''))
+        if not more_body:
+          await body.put(_done)
+
+  def end_body(self, body):
+    """Wake a worker waiting for more of the body of a gone client."""
+    while not body.empty():
+      body.get_nowait()
+    body.put_nowait(_done)
+
+  def call(self, environ, loop, chunks, disconnected):
+    """Run the WSGI app in a worker thread, feeding ``chunks``.
+
+    The whole response is iterated in the same thread, as views that
+    stream with the request context rely on thread-local state. Writes
+    raise :class:`~werkzeug.exceptions.ClientDisconnected` once the
+    client is gone, which ends the iteration and closes the iterable.
+    """
+    def deliver(item):
+      asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+    def put(item):
+      if disconnected.is_set():
+        raise ClientDisconnected()
+      deliver(item)
+
+    response = []
+
+    def start_response(status, headers, exc_info=None):
+      response[:] = [int(status.split(' ', 1)[0]), [
+          (name.lower().encode('latin-1'), value.encode('latin-1'))
+          for name, value in headers]]
+
+    try:
+      iterable = self.app(environ, start_response)
+      try:
+        for data in iterable:
+          if response:
+            put(tuple(response))
+            response = None
+          put(data)
+        if response:
+          put(tuple(response))
+      finally:
+        if hasattr(iterable, 'close'):
+          iterable.close()
+    except ClientDisconnected:
+      pass
+    finally:
+      deliver(_done)
+
+  async def lifespan(self, receive, send):
+    while True:
+      message = await receive()
+      if message['type'] == 'lifespan.startup':
+        await send({'type': 'lifespan.startup.complete'})
+      elif message['type'] == 'lifespan.shutdown':
+        self.executor.shutdown(wait=False)
+        await send({'type': 'lifespan.shutdown.complete'})
+        return
+
+
+def create_asgi_app(config_module=None):
+  app = create_app(config_module)
+  app.config.setdefault('ASGI_WORKERS', 32)
+  return AsyncApp(app, app.config['ASGI_WORKERS'])
@@ -1,21 +1,43 @@
 from flask import current_app, g
 from flask_httpauth import HTTPBasicAuth
+from .credentials import credential_cache
 from .models import User
 from .errors import unauthorized
+from .metrics import metrics
 
 auth = HTTPBasicAuth()
 
 
+def authenticate(username, password):
+  """Return the user these credentials belong to, or ``None``.
+
+  Successful checks are remembered for a short while, which saves the
+  deliberately slow password hash on repeated requests.
+  """
+  cache = credential_cache.cache
+  user_id = cache.get(username, password)
+  if user_id is not None:
+    user = User.query.get(user_id)
+    if user is not None:
+      return user
+  user = User.query.filter_by(username=username).first()
+  if user is None or not user.verify_password(password):
+    return None
+  cache.add(username, password, user.id)
+  return user
+
+
 @auth.verify_password
 def verify_password(username_or_token, password):
-  if current_app.config['USE_TOKEN_AUTH']:
-    # token authentication
-    g.user = User.verify_auth_token(username_or_token)
-    return g.user is not None
-  else:
-    # username/password authentication
-    g.user = User.query.filter_by(username=username_or_token).first()
-    return g.user is not None and g.user.verify_password(password)
+  with metrics.stage('auth'):
+    if current_app.config['USE_TOKEN_AUTH']:
+      # token authentication
+      g.user = User.verify_auth_token(username_or_token)
+      return g.user is not None
+    else:
+      # username/password authentication
+      g.user = authenticate(username_or_token, password)
+      return g.user is not None
 
 
 @auth.error_handler
@@ -0,0 +1,52 @@
+import atexit
+import threading
+
+
+class PeriodicWorker:
+  """Daemon thread that calls ``func`` every ``interval`` seconds.
+
+  :meth:`wake` runs ``func`` early, and :meth:`stop` (also registered to
+  run at interpreter exit) makes a final call so buffered work is not
+  lost when the worker process shuts down.
+  """
+  def __init__(self, func, interval, name=None):
+    self.func = func
+    self.interval = interval
+    self.name = name
+    self.event = threading.Event()
+    self.stopped = False
+    self.thread = None
+
+  def start(self):
+    if self.thread is None:
+      self.thread = threading.Thread(target=self.run, name=self.name)
+      self.thread.daemon = True
+      self.thread.start()
+      atexit.register(self.stop)
+    return self
+
+  def run(self):
+    while not self.stopped:
+      self.event.wait(self.interval)
+      self.event.clear()
+      if not self.stopped:
+        self.call()
+
+  def call(self):
+    try:
+      self.func()
+    except Exception:  # pragma: no cover
+      import logging
+      logging.getLogger(__name__).exception('%s failed', self.name)
+
+  def wake(self):
+    self.event.set()
+
+  def stop(self):
+    if self.stopped:
+      return
+    self.stopped = True
+    self.event.set()
+    if self.thread is not None:
+      self.thread.join(self.interval + 1)
+    self.call()
@@ -0,0 +1,118 @@
+"""Batched writes of todos.
+
+Rows are written in chunks and each chunk is committed in its own
+transaction, so thousands of todos cost a handful of fsyncs instead of
+one per row. Updates and deletes are one statement per chunk, and so are
+the inserts of :meth:`BulkWriter.insert_many` on SQLite and on databases
+with ``RETURNING``.
+"""
+from flask import current_app
+from sqlalchemy import bindparam
+from . import events
+from .errors import ValidationError
+from .models import db, Todo
+
+todos = Todo.__table__
+
+
+def chunks(items, size):
+  for i in range(0, len(items), size):
+    yield items[i:i + size]
+
+
+def validate(item, with_id=False):
+  """Validate one todo with :meth:`Todo.from_json` and return its row."""
+  if not isinstance(item, dict):
+    raise ValidationError('Invalid todo: not an object')
+  todo = Todo().from_json(item)
+  row = {'name': todo.name, 'task': todo.task}
+  if with_id:
+    if not isinstance(item.get('id'), int):
+      raise ValidationError('Invalid todo: missing id')
+    row['id'] = item['id']
+  return row
+
+
+def existing_ids(ids):
+  found = set()
+  for chunk in chunks(list(ids), 500):
+    found.update(id for id, in db.session.query(Todo.id).filter(
+        Todo.id.in_(chunk)))
+  return found
+
+
+class BulkWriter:
+  """Extension that writes todos in chunks of ``BULK_CHUNK_SIZE`` rows."""
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('BULK_MAX_ITEMS', 10000)
+    app.config.setdefault('BULK_CHUNK_SIZE', 1000)
+
+  @property
+  def chunk_size(self):
+    return current_app.config['BULK_CHUNK_SIZE']
+
+  def insert(self, rows, chunk_size=None):
+    """Insert ``rows`` and return their new ids, in order."""
+    ids = []
+    for chunk in chunks(rows, chunk_size or self.chunk_size):
+      chunk = [dict(row) for row in chunk]
+      db.session.bulk_insert_mappings(Todo, chunk, return_defaults=True)
+      events.record(db.session, created=[row['id'] for row in chunk])
+      db.session.commit()
+      ids.extend(row['id'] for row in chunk)
+    return ids
+
+  def insert_many(self, rows, chunk_size=None):
+    """Insert ``rows`` with one statement a chunk, return how many.
+
+    On databases with ``RETURNING`` a chunk is one multi-row ``INSERT``
+    that hands back the new ids. On SQLite it is one executemany, and the
+    ids are read back from ``last_insert_rowid()``: the transaction holds
+    the write lock, so the chunk got the ids right below the last one.
+    Other databases insert the rows one by one. Either way the ids
+    reported to the change listeners are the ones the insert produced.
+    """
+    count = 0
+    for chunk in chunks(rows, chunk_size or self.chunk_size):
+      connection = db.session.connection(mapper=Todo.__mapper__)
+      dialect = connection.dialect
+      if dialect.implicit_returning:
+        ids = [id for id, in connection.execute(
+            todos.insert().values(chunk).returning(todos.c.id))]
+      elif dialect.name == 'sqlite':
+        connection.execute(todos.insert(), chunk)
+        last = connection.execute('SELECT last_insert_rowid()').scalar()
+        ids = list(range(last - len(chunk) + 1, last + 1))
+      else:
+        chunk = [dict(row) for row in chunk]
+        db.session.bulk_insert_mappings(Todo, chunk, return_defaults=True)
+        ids = [row['id'] for row in chunk]
+      events.record(db.session, created=ids)
+      db.session.commit()
+      count += len(chunk)
+    return count
+
+  def update(self, rows):
+    statement = todos.update().where(todos.c.id == bindparam('_id')).values(
+        name=bindparam('_name'), task=bindparam('_task'))
+    for chunk in chunks(rows, self.chunk_size):
+      db.session.execute(statement, [{
+          '_id': row['id'],
+          '_name': row['name'],
+          '_task': row['task']
+      } for row in chunk])
+      events.record(db.session, updated=[row['id'] for row in chunk])
+      db.session.commit()
+
+  def delete(self, ids):
+    for chunk in chunks(list(ids), self.chunk_size):
+      db.session.execute(todos.delete().where(todos.c.id.in_(chunk)))
+      events.record(db.session, deleted=chunk)
+      db.session.commit()
+
+
+bulk_writer = BulkWriter()
@@ -0,0 +1,228 @@
+import functools
+import json
+import threading
+from collections import OrderedDict
+from flask import current_app, make_response, request
+from .database import reads_from_replica
+from .decorators import check_conditions
+from .events import on_commit
+from .store import redis_store
+from .versions import changed_generations, generations
+
+
+class CacheEntry:
+  """A rendered response: status, headers, body bytes and its ETag."""
+  def __init__(self, status, headers, body, etag, tags):
+    self.status = status
+    self.headers = headers
+    self.body = body
+    self.etag = etag
+    self.tags = tags
+
+  def dumps(self):
+    meta = json.dumps([self.status, self.headers, self.etag, self.tags])
+    return meta.encode('utf-8') + b'\n' + self.body
+
+  @classmethod
+  def loads(cls, data):
+    meta, body = data.split(b'\n', 1)
+    status, headers, etag, tags = json.loads(meta.decode('utf-8'))
+    return cls(status, [tuple(h) for h in headers], body, etag, tags)
+
+  def to_response(self):
+    return current_app.response_class(self.body, status=self.status,
+                                      headers=self.headers)
+
+
+class LRUCache:
+  """Thread-safe LRU of cache entries bounded by count and total bytes.
+
+  Keys are also indexed by tag so that :meth:`invalidate` can drop every
+  entry that depends on a changed resource.
+  """
+  def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.lock = threading.Lock()
+    self.entries = OrderedDict()
+    self.tags = {}
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.invalidations = 0
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        self.misses += 1
+        return None
+      self.entries.move_to_end(key)
+      self.hits += 1
+      return entry
+
+  def set(self, key, entry):
+    if len(entry.body) > self.max_bytes:
+      return
+    with self.lock:
+      self._remove(key)
+      self.entries[key] = entry
+      self.bytes += len(entry.body)
+      for tag in entry.tags:
+        self.tags.setdefault(tag, set()).add(key)
+      while len(self.entries) > self.max_entries or \
+          self.bytes > self.max_bytes:
+        self._remove(next(iter(self.entries)))
+        self.evictions += 1
+
+  def _remove(self, key):
+    entry = self.entries.pop(key, None)
+    if entry is not None:
+      self.bytes -= len(entry.body)
+      for tag in entry.tags:
+        keys = self.tags.get(tag)
+        if keys is not None:
+          keys.discard(key)
+          if not keys:
+            del self.tags[tag]
+    return entry
+
+  def invalidate(self, tags):
+    with self.lock:
+      for tag in tags:
+        for key in list(self.tags.get(tag, ())):
+          if self._remove(key) is not None:
+            self.invalidations += 1
+
+  def stats(self):
+    with self.lock:
+      lookups = self.hits + self.misses
+      return {
+          'hits': self.hits,
+          'misses': self.misses,
+          'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+          'entries': len(self.entries),
+          'bytes': self.bytes,
+          'evictions': self.evictions,
+          'invalidations': self.invalidations
+      }
+
+
+class ResponseCache:
+  """Server-side cache of rendered GET responses.
+
+  Entries live in a per-worker :class:`LRUCache` and, with
+  ``RESPONSE_CACHE_REDIS`` enabled, in a shared Redis tier. Every entry
+  is tagged with the generations it was rendered from (``todo:<id>``,
+  ``todos:membership``, ``todos:content``) and the current generations
+  are part of its key. A commit that touches a resource bumps its
+  generation, which retires the entry in every worker at once, and also
+  drops the entries from the local and Redis tiers straight away.
+  """
+  key_prefix = 'response-cache/'
+  tag_prefix = 'response-cache-tag/'
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('RESPONSE_CACHE', False)
+    app.config.setdefault('RESPONSE_CACHE_SIZE', 1024)
+    app.config.setdefault('RESPONSE_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+    app.config.setdefault('RESPONSE_CACHE_REDIS', False)
+    app.config.setdefault('RESPONSE_CACHE_TTL', 300)
+    app.extensions['response_cache'] = LRUCache(
+        app.config['RESPONSE_CACHE_SIZE'],
+        app.config['RESPONSE_CACHE_MAX_BYTES'])
+    app.extensions['response_cache_redis'] = {'hits': 0, 'misses': 0}
+
+  @property
+  def local(self):
+    return current_app.extensions['response_cache']
+
+  def cached(self, tags):
+    """Cache the response of a GET view.
+
+    ``tags`` is called with the view arguments and returns the names of
+    the generations the response depends on. Place it above ``etag``.
+    Responses rendered from a read replica are served but never stored,
+    since the replica may not have caught up with those generations yet.
+    """
+    def decorator(f):
+      @functools.wraps(f)
+      def wrapped(*args, **kwargs):
+        if not current_app.config['RESPONSE_CACHE']:
+          return f(*args, **kwargs)
+        names = tags(*args, **kwargs)
+        key = '%s#%s' % (request.url, '.'.join(
+            str(g) for g in generations.get(*names)))
+        entry = self.get(key)
+        if entry is not None:
+          return check_conditions(entry.etag) or entry.to_response()
+        rv = make_response(f(*args, **kwargs))
+        if rv.status_code == 200 and 'ETag' in rv.headers and \
+            not reads_from_replica():
+          self.set(key, CacheEntry(
+              rv.status_code,
+              [(k, v) for k, v in rv.headers if k != 'Content-Length'],
+              rv.get_data(), rv.headers['ETag'], names))
+        return rv
+
+      return wrapped
+
+    return decorator
+
+  def get(self, key):
+    entry = self.local.get(key)
+    if entry is None and current_app.config['RESPONSE_CACHE_REDIS']:
+      data = redis_store.client.get(self.key_prefix + key)
+      stats = current_app.extensions['response_cache_redis']
+      if data is None:
+        stats['misses'] += 1
+      else:
+        stats['hits'] += 1
+        entry = CacheEntry.loads(data)
+        self.local.set(key, entry)
+    return entry
+
+  def set(self, key, entry):
+    self.local.set(key, entry)
+    if current_app.config['RESPONSE_CACHE_REDIS']:
+      ttl = current_app.config['RESPONSE_CACHE_TTL']
+      p = redis_store.client.pipeline()
+      p.set(self.key_prefix + key, entry.dumps(), ex=ttl)
+      for tag in entry.tags:
+        p.sadd(self.tag_prefix + tag, key)
+        p.expire(self.tag_prefix + tag, ttl)
+      p.execute()
+
+  def invalidate(self, *tags):
+    self.local.invalidate(tags)
+    if current_app.config['RESPONSE_CACHE_REDIS']:
+      redis = redis_store.client
+      p = redis.pipeline()
+      for tag in tags:
+        p.smembers(self.tag_prefix + tag)
+      keys = set()
+      for members in p.execute():
+        keys.update(self.key_prefix + k.decode('utf-8') for k in members)
+      redis.delete(*(list(keys) + [self.tag_prefix + tag for tag in tags]))
+
+  def stats(self):
+    stats = self.local.stats()
+    if current_app.config['RESPONSE_CACHE_REDIS']:
+      redis_stats = current_app.extensions['response_cache_redis']
+      stats['redis_hits'] = redis_stats['hits']
+      stats['redis_misses'] = redis_stats['misses']
+    return stats
+
+
+response_cache = ResponseCache()
+
+
+@on_commit
+def _invalidate_todos(changes):
+  if current_app.config['RESPONSE_CACHE']:
+    response_cache.invalidate(*changed_generations(changes))
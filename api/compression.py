@@ -0,0 +1,94 @@
+"""Compression of response bodies negotiated with ``Accept-Encoding``.
+
+Responses of the types in ``COMPRESS_MIMETYPES`` and of at least
+``COMPRESS_MIN_SIZE`` bytes are sent with brotli, when the ``brotli``
+package is installed, or gzip, whichever the client prefers. Compressed
+bodies are kept in an LRU keyed by the ETag of the response and the
+encoding, so a hot response is compressed once per encoding instead of
+on every request. The ETag of a compressed response gets the encoding
+as a suffix (``"<tag>-gzip"``), so caches never mix the representations,
+and conditional requests strip it again, see
+:func:`api.decorators.check_conditions`.
+"""
+import gzip
+from flask import current_app, request
+from .cache import CacheEntry, LRUCache
+from .helpers import encoded_etag
+from .metrics import metrics
+
+try:
+  import brotli
+except ImportError:  # pragma: no cover
+  brotli = None
+
+
+class Compressor:
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('COMPRESS', False)
+    app.config.setdefault('COMPRESS_MIMETYPES', ['application/json'])
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', 5)
+    app.config.setdefault('COMPRESS_CACHE_SIZE', 1024)
+    app.config.setdefault('COMPRESS_CACHE_MAX_BYTES', 8 * 1024 * 1024)
+    app.extensions['compress_cache'] = LRUCache(
+        app.config['COMPRESS_CACHE_SIZE'],
+        app.config['COMPRESS_CACHE_MAX_BYTES'])
+    app.after_request(self.after_request)
+
+  @property
+  def cache(self):
+    return current_app.extensions['compress_cache']
+
+  @property
+  def encodings(self):
+    """The supported encodings, in order of preference."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+  def compress(self, data, encoding):
+    config = current_app.config
+    if encoding == 'br':
+      return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, config['COMPRESS_LEVEL'], mtime=0)
+
+  def after_request(self, response):
+    config = current_app.config
+    if not config['COMPRESS'] or response.direct_passthrough or \
+        response.is_streamed or 'Content-Encoding' in response.headers:
+      return response
+    if response.mimetype not in config['COMPRESS_MIMETYPES']:
+      return response
+    # the body depends on the header even when it is not compressed
+    response.vary.add('Accept-Encoding')
+    if response.status_code in (204, 304):
+      return response
+    encoding = request.accept_encodings.best_match(self.encodings)
+    data = response.get_data()
+    if encoding is None or len(data) < config['COMPRESS_MIN_SIZE']:
+      return response
+    with metrics.stage('compress'):
+      etag = response.headers.get('ETag')
+      key = None
+      if etag is not None and response.status_code == 200:
+        key = '%s %s %s' % (etag, encoding, response.mimetype)
+      entry = self.cache.get(key) if key is not None else None
+      if entry is None:
+        entry = CacheEntry(response.status_code, [],
+                           self.compress(data, encoding), etag, ())
+        if key is not None:
+          self.cache.set(key, entry)
+      response.set_data(entry.body)
+      response.headers['Content-Encoding'] = encoding
+      if etag is not None:
+        response.headers['ETag'] = encoded_etag(etag, encoding)
+    return response
+
+  def stats(self):
+    return self.cache.stats()
+
+
+compressor = Compressor()
@@ -0,0 +1,104 @@
+"""Row counts kept up to date by the writes themselves.
+
+Paginating a list needs its total, and ``COUNT(*)`` reads the whole table
+even though the total of an unfiltered list only changes when todos are
+created or deleted. The ``row_counts`` table holds the number of rows of
+each counted table. A flush listener adjusts it in the same transaction
+as the rows it counts, so it is exact as long as every write reports its
+changes, see :mod:`api.events`. Writes that bypass the events, such as
+raw SQL run from a shell, are corrected by :meth:`RowCounts.reconcile`,
+run periodically by the :func:`api.tasks.reconcile_counts` task.
+
+Filtered queries are still counted. With ``ROW_COUNTS_APPROXIMATE`` the
+count stops ``ROW_COUNTS_APPROXIMATE_LIMIT`` rows past the end of the
+requested page, so large results give a lower bound instead of a scan.
+"""
+from flask import current_app
+from sqlalchemy import event, func, literal, select
+from .bulk import todos
+from .events import on_flush
+from .models import db
+
+counters = db.Table('row_counts',
+                    db.Column('name', db.String(64), primary_key=True),
+                    db.Column('count', db.Integer, nullable=False))
+
+counted = (todos, )
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _seed(target, connection, tables=(), **kwargs):
+  if counters in tables:
+    for table in counted:
+      rows = select([literal(table.name), func.count()]).select_from(table)
+      connection.execute(counters.insert().from_select(['name', 'count'],
+                                                       rows))
+
+
+class RowCounts:
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('ROW_COUNTS', True)
+    app.config.setdefault('ROW_COUNTS_APPROXIMATE', False)
+    app.config.setdefault('ROW_COUNTS_APPROXIMATE_LIMIT', 1000)
+
+  def get(self, table):
+    """The maintained row count of ``table``, ``None`` if it has none."""
+    return db.session.query(counters.c.count).filter(
+        counters.c.name == table.name).scalar()
+
+  def count(self, query, seen=0, table=None):
+    """Count the rows of ``query``, returns ``(total, exact)``.
+
+    ``seen`` is the number of rows up to the end of the page being shown,
+    an approximate count always looks past them. ``table`` is given when
+    the caller knows ``query`` returns every row of that table.
+    """
+    config = current_app.config
+    if table in counted and config['ROW_COUNTS']:
+      total = self.get(table)
+      if total is not None:
+        return total, True
+    query = query.order_by(None)
+    if table is None and config['ROW_COUNTS_APPROXIMATE']:
+      limit = seen + config['ROW_COUNTS_APPROXIMATE_LIMIT']
+      total = db.session.query(func.count()).select_from(
+          query.limit(limit).subquery()).scalar()
+      return total, total < limit
+    return query.count(), True
+
+  def reconcile(self):
+    """Recount the counted tables, return the drift found in each."""
+    drift = {}
+    for table in counted:
+      # touching the counter first takes the lock writers need to change
+      # it, so no write can land between the count and the update
+      touched = db.session.execute(counters.update().where(
+          counters.c.name == table.name).values(
+              count=counters.c.count)).rowcount
+      actual = db.session.query(func.count()).select_from(table).scalar()
+      if touched:
+        stored = self.get(table)
+        db.session.execute(counters.update().where(
+            counters.c.name == table.name).values(count=actual))
+      else:
+        stored = 0
+        db.session.execute(counters.insert().values(name=table.name,
+                                                    count=actual))
+      drift[table.name] = actual - stored
+    db.session.commit()
+    return drift
+
+
+row_counts = RowCounts()
+
+
+@on_flush
+def _count_todos(session, changes):
+  delta = len(changes.created) - len(changes.deleted)
+  if delta:
+    session.connection().execute(counters.update().where(
+        counters.c.name == todos.name).values(count=counters.c.count + delta))
@@ -0,0 +1,145 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from .store import redis_store
+
+
+class CredentialCache:
+  """Short-lived cache of successful username/password verifications.
+
+  Entries are keyed on an HMAC of the credentials under a random
+  per-process key, so neither the password nor a plain hash of it is
+  ever kept in memory. At most ``size`` entries are kept, each for
+  ``ttl`` seconds.
+  """
+  def __init__(self, ttl=60, size=4096):
+    self.ttl = ttl
+    self.size = size
+    self.key = os.urandom(32)
+    self.lock = threading.Lock()
+    self.entries = OrderedDict()
+    self.users = {}
+    self.hits = 0
+    self.misses = 0
+
+  def digest(self, username, password):
+    message = '%d:%s%s' % (len(username), username, password)
+    return hmac.new(self.key, message.encode('utf-8'),
+                    hashlib.sha256).digest()
+
+  def get(self, username, password):
+    """Return the id of the user these credentials were verified for."""
+    if not self.ttl:
+      return None
+    digest = self.digest(username, password)
+    with self.lock:
+      entry = self.entries.get(digest)
+      if entry is None or entry[1] < time.time():
+        self.misses += 1
+        return None
+      self.hits += 1
+      return entry[0]
+
+  def add(self, username, password, user_id):
+    if not self.ttl:
+      return
+    digest = self.digest(username, password)
+    with self.lock:
+      self._remove(digest)
+      self.entries[digest] = (user_id, time.time() + self.ttl)
+      self.users.setdefault(user_id, set()).add(digest)
+      while len(self.entries) > self.size:
+        self._remove(next(iter(self.entries)))
+
+  def _remove(self, digest):
+    entry = self.entries.pop(digest, None)
+    if entry is not None:
+      digests = self.users.get(entry[0])
+      digests.discard(digest)
+      if not digests:
+        del self.users[entry[0]]
+
+  def invalidate_user(self, user_id):
+    with self.lock:
+      for digest in list(self.users.get(user_id, ())):
+        self._remove(digest)
+
+  def stats(self):
+    with self.lock:
+      return {'hits': self.hits, 'misses': self.misses,
+              'entries': len(self.entries)}
+
+
+class CredentialCaches:
+  """Extension that gives every app its own :class:`CredentialCache`."""
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('AUTH_CACHE_TTL', 60)
+    app.config.setdefault('AUTH_CACHE_SIZE', 4096)
+    app.extensions['credential_cache'] = CredentialCache(
+        app.config['AUTH_CACHE_TTL'], app.config['AUTH_CACHE_SIZE'])
+
+  @property
+  def cache(self):
+    return current_app.extensions['credential_cache']
+
+  def invalidate_user(self, user_id):
+    if user_id is not None and has_app_context():
+      cache = current_app.extensions.get('credential_cache')
+      if cache is not None:
+        cache.invalidate_user(user_id)
+
+
+credential_cache = CredentialCaches()
+
+
+class TokenGenerations:
+  """Per-user token generation numbers used to revoke auth tokens.
+
+  Every token carries the generation of its user at the time it was
+  issued and stops verifying once the generation moves on. Generations
+  live in Redis and are cached in process for ``TOKEN_GENERATION_TTL``
+  seconds. A missing generation starts from the current time, so losing
+  the Redis data revokes every outstanding token rather than reviving
+  revoked ones.
+  """
+  key_prefix = 'token-generation/'
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('STATELESS_TOKENS', True)
+    app.config.setdefault('TOKEN_GENERATION_TTL', 5)
+    app.extensions['token_generations'] = {}
+
+  def get(self, user_id):
+    cache = current_app.extensions['token_generations']
+    entry = cache.get(user_id)
+    if entry is not None and entry[1] > time.time():
+      return entry[0]
+    key = self.key_prefix + str(user_id)
+    p = redis_store.client.pipeline()
+    p.set(key, int(time.time() * 1000), nx=True)
+    p.get(key)
+    generation = int(p.execute()[-1])
+    cache[user_id] = (
+        generation, time.time() + current_app.config['TOKEN_GENERATION_TTL'])
+    return generation
+
+  def bump(self, user_id):
+    generation = redis_store.client.incr(self.key_prefix + str(user_id))
+    current_app.extensions['token_generations'][user_id] = (
+        generation, time.time() + current_app.config['TOKEN_GENERATION_TTL'])
+    return generation
+
+
+token_generations = TokenGenerations()
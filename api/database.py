@@ -0,0 +1,145 @@
+"""Connection pools and read replica routing for Flask-SQLAlchemy.
+
+:class:`RoutingSQLAlchemy` adds ``SQLALCHEMY_POOL_PRE_PING`` to the pool
+settings Flask-SQLAlchemy already reads, and registers every URI of
+``SQLALCHEMY_REPLICAS`` as a ``replica-<n>`` bind. Its sessions send the
+queries of views marked with :func:`api.decorators.read_only` to one of
+the replicas, picked once per request, and everything else, including
+any flush, to the primary. A client whose request committed to the
+primary reads from it for the next ``SQLALCHEMY_REPLICA_STICKY`` seconds
+so it always sees its own writes. The marker is kept in Redis, where all
+workers see it.
+"""
+import random
+import threading
+import weakref
+from flask import current_app, g, request
+from flask.globals import _request_ctx_stack
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from .helpers import fast_hash
+from .store import PoolStats, redis_store
+
+sticky_key = 'db-sticky/'
+
+# SQLite connections are not shared between threads, so Flask-SQLAlchemy
+# gives in-memory databases a static pool and files no pool at all
+_sizing_options = ('pool_size', 'max_overflow', 'pool_timeout')
+
+_pool_stats = weakref.WeakKeyDictionary()
+_pool_lock = threading.Lock()
+
+
+def _client_key():
+  auth = request.authorization
+  client = auth.username if auth else request.remote_addr or ''
+  return sticky_key + fast_hash(client.encode('utf-8'))
+
+
+def _use_replica():
+  if not g.get('db_read_only'):
+    return False
+  sticky = g.get('db_sticky')
+  if sticky is None:
+    sticky = g.db_sticky = bool(redis_store.client.exists(_client_key()))
+  return not sticky
+
+
+def reads_from_replica():
+  """Whether the queries of the current request go to a read replica.
+
+  A replica may lag behind the generations bumped by commits to the
+  primary, so what is rendered from it must not be cached or tagged with
+  them.
+  """
+  return bool(current_app.config['SQLALCHEMY_REPLICA_BINDS']) and \
+      _use_replica()
+
+
+class RoutingSession(SignallingSession):
+  """Session that reads from a replica inside read-only views."""
+  def __init__(self, db, **options):
+    self.db = db
+    self.replica = None
+    super().__init__(db, **options)
+
+  def get_bind(self, mapper=None, clause=None):
+    if mapper is not None and \
+        getattr(mapper.local_table, 'info', {}).get('bind_key') is not None:
+      return super().get_bind(mapper, clause)
+    if not self._flushing and reads_from_replica():
+      if self.replica is None:
+        self.replica = random.choice(
+            self.app.config['SQLALCHEMY_REPLICA_BINDS'])
+      return self.db.get_engine(self.app, bind=self.replica)
+    return super().get_bind(mapper, clause)
+
+
+def _after_commit(session):
+  config = session.app.config
+  if not config['SQLALCHEMY_REPLICA_BINDS'] or \
+      not config['SQLALCHEMY_REPLICA_STICKY'] or \
+      _request_ctx_stack.top is None or g.get('db_read_only'):
+    return
+  redis_store.client.set(_client_key(), 1,
+                         ex=config['SQLALCHEMY_REPLICA_STICKY'])
+  g.db_sticky = True
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    event.listen(self.session, 'after_commit', _after_commit)
+
+  def init_app(self, app):
+    app.config.setdefault('SQLALCHEMY_POOL_PRE_PING', False)
+    app.config.setdefault('SQLALCHEMY_REPLICAS', [])
+    app.config.setdefault('SQLALCHEMY_REPLICA_STICKY', 5)
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    names = []
+    for i, uri in enumerate(app.config['SQLALCHEMY_REPLICAS']):
+      names.append('replica-%d' % i)
+      binds[names[-1]] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds or None
+    app.config['SQLALCHEMY_REPLICA_BINDS'] = names
+    super().init_app(app)
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+  def apply_pool_defaults(self, app, options):
+    super().apply_pool_defaults(app, options)
+    if app.config['SQLALCHEMY_POOL_PRE_PING']:
+      options['pool_pre_ping'] = True
+
+  def apply_driver_hacks(self, app, info, options):
+    if info.drivername == 'sqlite':
+      for name in _sizing_options:
+        options.pop(name, None)
+    super().apply_driver_hacks(app, info, options)
+
+  def get_engine(self, app=None, bind=None):
+    engine = super().get_engine(app, bind)
+    if engine not in _pool_stats:
+      with _pool_lock:
+        if engine not in _pool_stats:
+          stats = _pool_stats[engine] = PoolStats()
+          event.listen(engine, 'checkout', lambda *args: stats.checkout(0.0))
+          event.listen(engine, 'checkin', lambda *args: stats.release())
+    return engine
+
+  def pool_stats(self, app=None):
+    """Checkout counters and pool sizes of the primary and each bind."""
+    app = self.get_app(app)
+    result = {}
+    for bind in [None] + sorted(app.config['SQLALCHEMY_BINDS'] or ()):
+      engine = self.get_engine(app, bind)
+      stats = _pool_stats[engine].as_dict()
+      stats = dict((name, stats[name])
+                   for name in ('checkouts', 'in_use', 'max_in_use'))
+      pool = engine.pool
+      if hasattr(pool, 'size'):
+        stats.update(size=pool.size(), overflow=pool.overflow(),
+                     checked_in=pool.checkedin())
+      result[bind or 'primary'] = stats
+    return result
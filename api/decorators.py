@@ -1,8 +1,18 @@
 import functools
-import hashlib
-from flask import jsonify, request, url_for, current_app, make_response, g
-from .rate_limit import RateLimit
-from .errors import too_many_requests, precondition_failed, not_modified
+from flask import abort, request, current_app, make_response, g
+from flask_sqlalchemy import Pagination
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+from .counts import row_counts
+from .database import reads_from_replica
+from .rate_limit import RateLimit, local_limiter
+from .hit_counter import hit_counter
+from .errors import ValidationError, too_many_requests, precondition_failed, \
+    not_modified
+from .helpers import decode_cursor, decoded_etag, encode_cursor, \
+    external_url, fast_hash
+from .metrics import metrics
+from .serializer import serializer
 
 
 def json(f):
@@ -15,9 +25,10 @@ def json(f):
       rv, status_or_headers, headers = rv + (None, ) * (3 - len(rv))
     if isinstance(status_or_headers, (dict, list)):
       headers, status_or_headers = status_or_headers, None
-    if not isinstance(rv, dict):
-      rv = rv.to_json()
-    rv = jsonify(rv)
+    with metrics.stage('serialize'):
+      if not isinstance(rv, dict):
+        rv = rv.to_json()
+      rv = serializer.response(rv)
     if status_or_headers is not None:
       rv.status_code = status_or_headers
     if headers is not None:
@@ -31,35 +42,40 @@ def hit_count(f):
   @functools.wraps(f)
   def wrapped(*args, **kwargs):
     rv = f(*args, **kwargs)
-
-    if current_app.config['TESTING']:
-      from .rate_limit import FakeRedis
-      redis = FakeRedis()
-    else:  # pragma: no cover
-      from redis import Redis
-      redis_host = current_app.config.get("REDIS_HOST", "localhost")
-      redis_port = current_app.config.get("REDIS_PORT", 6379)
-      redis_db = current_app.config.get("REDIS_DB", 0)
-      redis = Redis(host=redis_host, port=redis_port, db=redis_db)
-
-    key = 'hit-count%s' % (request.path)
-    redis.incr(key)
+    with metrics.stage('hit_count'):
+      hit_counter.incr(request.path)
     return rv
 
   return wrapped
 
 
-def rate_limit(limit, per, scope_func=lambda: request.remote_addr):
+def rate_limit(limit, per, scope_func=lambda: request.remote_addr,
+               algorithm=None):
   def decorator(f):
     @functools.wraps(f)
     def wrapped(*args, **kwargs):
       if current_app.config['USE_RATE_LIMITS']:
-        key = 'rate-limit/%s/%s/' % (f.__name__, scope_func())
-        limiter = RateLimit(key, limit, per)
+        with metrics.stage('rate_limit'):
+          key = 'rate-limit/%s/%s/' % (f.__name__, scope_func())
+          tier = local_limiter.tier
+          reset = tier.shed(key, limit, per) if tier is not None else None
+          if reset is None:
+            limiter = RateLimit(
+                key, limit, per, algorithm or
+                current_app.config.get('RATE_LIMIT_ALGORITHM', 'fixed-window'))
+            if tier is not None:
+              tier.update(key, limiter)
+        if reset is not None:
+          g.headers = {
+              'X-RateLimit-Remaining': '0',
+              'X-RateLimit-Limit': str(limit),
+              'X-RateLimit-Reset': str(reset)
+          }
+          return too_many_requests()
         if not limiter.over_limit:
           rv = f(*args, **kwargs)
         else:
-          rv = too_many_requests('You have exceeded your request rate')
+          rv = too_many_requests()
         # rv = make_response(rv)
         g.headers = {
             'X-RateLimit-Remaining': str(limiter.remaining),
@@ -75,55 +91,179 @@ def rate_limit(limit, per, scope_func=lambda: request.remote_addr):
   return decorator
 
 
-def paginate(max_per_page=10):
+def _keyset_filter(columns, values, direction):
+  # (a, b) > (x, y) expanded to a >= x AND (a > x OR (a = x AND b > y));
+  # the redundant leading bound lets every database answer it with a
+  # range scan on the (a, b) index instead of walking it from the start
+  clauses = []
+  for i, column in enumerate(columns):
+    seek = column > values[i] if direction == 'next' else column < values[i]
+    clauses.append(and_(*[c == v for c, v in zip(columns[:i], values[:i])] +
+                        [seek]))
+  if direction == 'next':
+    bound = columns[0] >= values[0]
+  else:
+    bound = columns[0] <= values[0]
+  return and_(bound, or_(*clauses))
+
+
+def keyset_page(query, columns, cursor, per_page, descending=False):
+  """Fetch one page of ``query`` by seeking past ``cursor`` on ``columns``.
+
+  Unlike ``query.paginate`` this never scans the skipped rows or counts
+  the query, so every page costs the same. Returns the page items and
+  the cursors of the previous and next pages (``None`` at either end).
+  With ``descending`` the pages run from the largest keys down.
+  """
+  direction = 'next'
+  if cursor:
+    values, direction = decode_cursor(cursor, columns)
+  seek = direction
+  if descending:
+    seek = 'prev' if direction == 'next' else 'next'
+  if cursor:
+    query = query.filter(_keyset_filter(columns, values, seek))
+  order = [c.asc() if seek == 'next' else c.desc() for c in columns]
+  items = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+  more = len(items) > per_page
+  items = items[:per_page]
+  if direction == 'prev':
+    items.reverse()
+  has_next = more if direction == 'next' else bool(cursor)
+  has_prev = bool(cursor) if direction == 'next' else more
+  next_cursor = prev_cursor = None
+  if items and has_next:
+    next_cursor = encode_cursor([getattr(items[-1], c.key) for c in columns])
+  if items and has_prev:
+    prev_cursor = encode_cursor([getattr(items[0], c.key) for c in columns],
+                                'prev')
+  return items, prev_cursor, next_cursor
+
+
+def _projection(query, keyset=None):
+  """Return the fields requested with ``expand`` or ``fields``.
+
+  The query is narrowed to the columns those fields need. ``None`` means
+  only the item URLs were asked for.
+  """
+  model = query.column_descriptions[0]['entity']
+  if request.args.get('fields'):
+    fields = [field.strip() for field in request.args['fields'].split(',')]
+    unknown = set(fields) - set(model.json_fields)
+    if unknown:
+      raise ValidationError('Invalid fields: ' + ', '.join(sorted(unknown)))
+    fields = ['url'] + [field for field in fields if field != 'url']
+  elif request.args.get('expand', 0, type=int):
+    fields = list(model.json_fields)
+  else:
+    return None, query
+  columns = model.json_columns(fields) + [c.key for c in keyset or ()]
+  return fields, query.options(load_only(*set(columns)))
+
+
+def _page_url(kwargs, **page):
+  """Link to another page of this collection, keeping the other arguments."""
+  view_args = request.view_args or {}
+  page.update((arg, value) for arg, value in kwargs.items()
+              if arg not in view_args)
+  return external_url(request.endpoint, view_args, **page)
+
+
+def paginate(max_per_page=10, keyset=None, args=(), unfiltered=None):
+  """Paginate the query returned by the view.
+
+  ``keyset`` is a tuple of columns, or a function returning the columns
+  of the order the request asked for and whether it is descending.
+  ``args`` names the query string arguments of the view, which are kept
+  in the links to the other pages. ``unfiltered`` is a function telling
+  whether the query returns every row of its model, whose total is then
+  read from the maintained row count, see :mod:`api.counts`.
+  """
   def decorator(f):
     @functools.wraps(f)
-    def wrapped(*args, **kwargs):
+    def wrapped(*view_args, **kwargs):
+      query = f(*view_args, **kwargs)
+      columns, descending = keyset() if callable(keyset) else (keyset, False)
+      kwargs = dict(kwargs, **dict((arg, request.args[arg]) for arg in args
+                                   if arg in request.args))
+      fields, query = _projection(query, columns)
+      model = query.column_descriptions[0]['entity']
+      table = model.__table__ if unfiltered is not None and unfiltered() \
+          else None
+      limit = max_per_page
+      if fields is not None:
+        # narrow projections are cheaper per item, so allow more of them
+        limit = max_per_page * len(model.json_fields) // len(fields)
+        kwargs = dict(kwargs, **dict((arg, request.args[arg])
+                                     for arg in ('expand', 'fields')
+                                     if arg in request.args))
+      per_page = min(request.args.get('per_page', limit, type=int), limit)
+      if per_page < 1:
+        abort(404)
+      if columns is not None and 'cursor' in request.args:
+        items, pages = _keyset_pages(query, table, columns, descending,
+                                     per_page, kwargs)
+      else:
+        items, pages = _offset_pages(query, table, per_page, kwargs)
+      with metrics.stage('serialize'):
+        rv = {'urls': [item.get_url() for item in items], 'meta': pages}
+        if fields is not None:
+          rv['items'] = [item.to_json(fields) for item in items]
+        return serializer.response(rv)
+
+    def _offset_pages(query, table, per_page, kwargs):
       page = request.args.get('page', 1, type=int)
-      per_page = min(
-          request.args.get('per_page', max_per_page, type=int), max_per_page)
-      query = f(*args, **kwargs)
-      p = query.paginate(page, per_page)
+      if page < 1:
+        abort(404)
+      start = (page - 1) * per_page
+      items = query.limit(per_page).offset(start).all()
+      if not items and page != 1:
+        abort(404)
+      if page == 1 and len(items) < per_page:
+        total, exact = len(items), True
+      else:
+        total, exact = row_counts.count(query, start + per_page, table)
+      p = Pagination(query, page, per_page, total, items)
       pages = {
           'page': page,
           'per_page': per_page,
           'total': p.total,
           'pages': p.pages
       }
+      if not exact:
+        pages['approximate'] = True
       if p.has_prev:
-        pages['prev'] = url_for(
-            request.endpoint,
-            page=p.prev_num,
-            per_page=per_page,
-            _external=True,
-            **kwargs)
+        pages['prev'] = _page_url(kwargs, page=p.prev_num, per_page=per_page)
       else:
         pages['prev'] = None
       if p.has_next:
-        pages['next'] = url_for(
-            request.endpoint,
-            page=p.next_num,
-            per_page=per_page,
-            _external=True,
-            **kwargs)
+        pages['next'] = _page_url(kwargs, page=p.next_num, per_page=per_page)
       else:
         pages['next'] = None
-      pages['first'] = url_for(
-          request.endpoint,
-          page=1,
-          per_page=per_page,
-          _external=True,
-          **kwargs)
-      pages['last'] = url_for(
-          request.endpoint,
-          page=p.pages,
-          per_page=per_page,
-          _external=True,
-          **kwargs)
-      return jsonify({
-          'urls': [item.get_url() for item in p.items],
-          'meta': pages
-      })
+      pages['first'] = _page_url(kwargs, page=1, per_page=per_page)
+      pages['last'] = _page_url(kwargs, page=p.pages, per_page=per_page)
+      return p.items, pages
+
+    def _keyset_pages(query, table, columns, descending, per_page, kwargs):
+      count = request.args.get('count', 0, type=int)
+      if count:
+        kwargs = dict(kwargs, count=count)
+      items, prev_cursor, next_cursor = keyset_page(
+          query, columns, request.args['cursor'], per_page, descending)
+      pages = {
+          'per_page': per_page,
+          'prev_cursor': prev_cursor,
+          'next_cursor': next_cursor
+      }
+      for name, cursor in (('prev', prev_cursor), ('next', next_cursor),
+                           ('first', '')):
+        pages[name] = None if cursor is None else _page_url(
+            kwargs, cursor=cursor, per_page=per_page)
+      if count:
+        pages['total'], exact = row_counts.count(query, table=table)
+        if not exact:
+          pages['approximate'] = True
+      return items, pages
 
     return wrapped
 
@@ -148,26 +288,71 @@ def no_cache(f):
   return cache_control('no-cache', 'no-store', 'max-age=0')(f)
 
 
-def etag(f):
+def read_only(f):
+  """Send the queries of a view to a read replica, if any is configured."""
+  @functools.wraps(f)
+  def wrapped(*args, **kwargs):
+    if current_app.config['SQLALCHEMY_REPLICAS']:
+      g.db_read_only = True
+    return f(*args, **kwargs)
+
+  return wrapped
+
+
+def check_conditions(etag_str):
+  """Return the 412 or 304 response owed for ``etag_str``, if any.
+
+  Tags of compressed representations match the uncompressed ``etag_str``.
+  """
+  if_match = request.headers.get('If-Match')
+  if_none_match = request.headers.get('If-None-Match')
+  if if_match:
+    etag_list = [decoded_etag(tag.strip()) for tag in if_match.split(',')]
+    if etag_str not in etag_list and '*' not in etag_list:
+      return precondition_failed()
+  elif if_none_match:
+    etag_list = [decoded_etag(tag.strip())
+                 for tag in if_none_match.split(',')]
+    if etag_str in etag_list or '*' in etag_list:
+      return not_modified()
+  return None
+
+
+def etag(f=None, validator=None):
+  """Add an ETag to the response and honour conditional requests.
+
+  ``validator`` is called with the view arguments before the view runs
+  and returns a cheap version token, or ``None`` when it has none. The
+  ETag is then derived from that token and the request URL, so a 304 or
+  412 is answered without loading or rendering anything. Otherwise, and
+  for bodies rendered from a read replica that may lag behind the
+  token, the ETag is a hash of the rendered body.
+  """
+  if f is None:
+    return functools.partial(etag, validator=validator)
+
   @functools.wraps(f)
   def wrapped(*args, **kwargs):
     # only for HEAD and GET requests
     assert request.method in ['HEAD', 'GET'],\
         '@etag is only supported for GET requests'
+    with metrics.stage('etag'):
+      token = validator(*args, **kwargs) if validator is not None else None
+      if token is not None:
+        etag_str = '"%s"' % fast_hash(
+            ('%s %s' % (token, request.url)).encode('utf-8'))
+        rv = check_conditions(etag_str)
+        if rv is not None:
+          return rv
+    if token is not None and not reads_from_replica():
+      rv = make_response(f(*args, **kwargs))
+      rv.headers['ETag'] = etag_str
+      return rv
     rv = f(*args, **kwargs)
     rv = make_response(rv)
-    etag_str = '"' + hashlib.md5(rv.get_data()).hexdigest() + '"'
-    rv.headers['ETag'] = etag_str
-    if_match = request.headers.get('If-Match')
-    if_none_match = request.headers.get('If-None-Match')
-    if if_match:
-      etag_list = [tag.strip() for tag in if_match.split(',')]
-      if etag_str not in etag_list and '*' not in etag_list:
-        rv = precondition_failed()
-    elif if_none_match:
-      etag_list = [tag.strip() for tag in if_none_match.split(',')]
-      if etag_str in etag_list or '*' in etag_list:
-        rv = not_modified()
-    return rv
+    with metrics.stage('etag'):
+      etag_str = '"' + fast_hash(rv.get_data()) + '"'
+      rv.headers['ETag'] = etag_str
+      return check_conditions(etag_str) or rv
 
   return wrapped
@@ -1,52 +1,68 @@
-from flask import jsonify
+from flask import current_app
+from .serializer import serializer
+
+RATE_EXCEEDED = 'You have exceeded your request rate'
 
 
 class ValidationError(ValueError):
   pass
 
 
+def error_json(status, error, message=None):
+  body = {'status': status, 'error': error}
+  if message is not None:
+    body['message'] = message
+  return body
+
+
+def error_body(status, error, message=None):
+  return serializer.dumps(error_json(status, error, message))
+
+
+# the bodies that never change are encoded once by every app
+serializer.register('error/304', error_json(304, 'not modified'))
+serializer.register('error/412', error_json(412, 'precondition failed'))
+serializer.register('error/429', error_json(429, 'too many requests',
+                                            RATE_EXCEEDED))
+
+
+def error_response(status, error, message=None):
+  return current_app.response_class(error_body(status, error, message),
+                                    status=status,
+                                    mimetype='application/json')
+
+
 def not_modified():
-  response = jsonify({'status': 304, 'error': 'not modified'})
-  response.status_code = 304
-  return response
+  return current_app.response_class(serializer.encoded('error/304'),
+                                    status=304,
+                                    mimetype='application/json')
 
 
 def bad_request(message):
-  response = jsonify({'status': 400, 'error': 'bad request',
-                      'message': message})
-  response.status_code = 400
-  return response
+  return error_response(400, 'bad request', message)
 
 
 def unauthorized(message):
-  response = jsonify({'status': 401, 'error': 'unauthorized',
-                      'message': message})
-  response.status_code = 401
-  return response
+  return error_response(401, 'unauthorized', message)
 
 
 def forbidden(message):  # pragma: no cover
-  response = jsonify({'status': 403, 'error': 'forbidden',
-                      'message': message})
-  response.status_code = 403
-  return response
+  return error_response(403, 'forbidden', message)
 
 
 def not_found(message):  # pragma: no cover
-  response = jsonify({'status': 404, 'error': 'not found',
-                      'message': message})
-  response.status_code = 404
-  return response
+  return error_response(404, 'not found', message)
 
 
 def precondition_failed():
-  response = jsonify({'status': 412, 'error': 'precondition failed'})
-  response.status_code = 412
-  return response
+  return current_app.response_class(serializer.encoded('error/412'),
+                                    status=412,
+                                    mimetype='application/json')
 
 
-def too_many_requests(message, limit=None):
-  response = jsonify({'status': 429, 'error': 'too many requests',
-                      'message': message})
-  response.status_code = 429
-  return response
+def too_many_requests(message=RATE_EXCEEDED, limit=None):
+  if message != RATE_EXCEEDED:
+    return error_response(429, 'too many requests', message)
+  return current_app.response_class(serializer.encoded('error/429'),
+                                    status=429,
+                                    mimetype='application/json')
@@ -0,0 +1,75 @@
+"""Notifications about changes to the todos table.
+
+Changes to :class:`Todo` rows made through the session are collected
+after every flush. Flush listeners run inside the transaction, and
+commit listeners run once it is committed, each receiving a
+:class:`Changes` instance. Writes that bypass the unit of work, such as
+bulk inserts, report their rows with :func:`record`.
+"""
+from sqlalchemy import event
+from .models import db, Todo
+
+flush_listeners = []
+commit_listeners = []
+
+
+class Changes:
+  """Ids of the todos created, updated and deleted by a transaction."""
+  def __init__(self, created=(), updated=(), deleted=()):
+    self.created = set(created)
+    self.updated = set(updated)
+    self.deleted = set(deleted)
+
+  def __bool__(self):
+    return bool(self.created or self.updated or self.deleted)
+
+  def merge(self, other):
+    self.created |= other.created
+    self.deleted |= other.deleted
+    self.updated |= other.updated - self.created - self.deleted
+    self.created -= self.deleted
+
+
+def on_flush(func):
+  flush_listeners.append(func)
+  return func
+
+
+def on_commit(func):
+  commit_listeners.append(func)
+  return func
+
+
+def record(session, created=(), updated=(), deleted=()):
+  """Report todo ids written behind the back of the unit of work."""
+  _flushed(session, Changes(created, updated, deleted))
+
+
+def _flushed(session, changes):
+  if not changes:
+    return
+  for listener in flush_listeners:
+    listener(session, changes)
+  session.info.setdefault('todo_changes', Changes()).merge(changes)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _after_flush(session, flush_context):
+  _flushed(session, Changes(
+      created=[obj.id for obj in session.new if isinstance(obj, Todo)],
+      updated=[obj.id for obj in session.dirty
+               if isinstance(obj, Todo) and session.is_modified(obj)],
+      deleted=[obj.id for obj in session.deleted if isinstance(obj, Todo)]))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _after_commit(session):
+  changes = session.info.pop('todo_changes', None)
+  if changes:
+    for listener in commit_listeners:
+      listener(changes)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _after_rollback(session):
+  session.info.pop('todo_changes', None)
@@ -0,0 +1,53 @@
+"""Streaming export of the todos table.
+
+Rows are read in keyset batches ordered by id, each one a short indexed
+query, and serialized one line at a time, so memory use does not grow
+with the size of the table and an interrupted export can be resumed
+from the last id it produced.
+"""
+from flask import current_app
+from .helpers import url_template
+from .models import db, Todo
+from .serializer import serializer
+
+
+class Exporter:
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('EXPORT_BATCH_SIZE', 1000)
+
+  def rows(self, since=None, until=None, after_id=None):
+    """Yield the todos in id order as ``to_json`` dicts plus their id."""
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    query = db.session.query(Todo.id, Todo.name, Todo.task, Todo.timestamp)
+    if since is not None:
+      query = query.filter(Todo.timestamp >= since)
+    if until is not None:
+      query = query.filter(Todo.timestamp < until)
+    last_id = after_id or 0
+    template = url_template('api.get_todo', 'id')
+    while True:
+      batch = query.filter(Todo.id > last_id).order_by(Todo.id).limit(
+          batch_size).all()
+      for id, name, task, timestamp in batch:
+        yield {
+            'id': id,
+            'url': template % id,
+            'name': name,
+            'task': task,
+            'timestamp': timestamp
+        }
+      if len(batch) < batch_size:
+        return
+      last_id = batch[-1][0]
+
+  def ndjson(self, **filters):
+    """Yield the todos as newline delimited JSON, one line per todo."""
+    for row in self.rows(**filters):
+      yield serializer.dumps(row) + b'\n'
+
+
+todo_exporter = Exporter()
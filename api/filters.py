@@ -0,0 +1,127 @@
+"""Whitelisted filters and sort orders for collections.
+
+A collection only accepts the filters and orders an index can answer:
+the columns filtered by equality lead the index, followed by the sort
+column and the primary key, and a range may only bound the column right
+after them. Any other combination would scan the table and is rejected
+with a ``400`` before a query is run.
+"""
+import operator
+from datetime import datetime
+from flask import request
+from .errors import ValidationError
+from .helpers import parse_timestamp
+from .models import Todo
+
+
+def parse_id(value, name='id'):
+  """Parse a positive integer ``value`` given for the ``name`` argument."""
+  if not value.isdigit():
+    raise ValidationError('Invalid %s: %s' % (name, value))
+  return int(value)
+
+
+class Filters:
+  """Filters and sort orders accepted by a collection of ``model``.
+
+  ``equal`` names the columns that can be filtered by equality, ``ranges``
+  maps each range argument to a ``(column, operator)`` bound and
+  ``sorts`` names the columns the collection can be sorted by, in
+  descending order when prefixed with ``-``. Every order ends with the
+  primary key, so it is total and can be used as a keyset.
+  """
+  def __init__(self, model, equal=(), ranges=None, sorts=(),
+               default_sort=None):
+    self.model = model
+    table = model.__table__
+    self.key = table.primary_key.columns.values()[0].name
+    self.equal = tuple(equal)
+    self.ranges = ranges or {}
+    self.sorts = tuple(sorts)
+    self.default_sort = default_sort or self.key
+    self.indexes = [[c.name for c in table.primary_key.columns]] + \
+        [[c.name for c in index.columns] for index in table.indexes]
+
+  @property
+  def args(self):
+    """Names of the query string arguments the filters read."""
+    return self.equal + tuple(self.ranges) + ('sort', )
+
+  def unfiltered(self):
+    """Whether the request leaves every row of the collection in."""
+    return not any(arg in request.args
+                   for arg in self.equal + tuple(self.ranges))
+
+  def order(self, sort):
+    """Names of the columns of the order by ``sort``."""
+    return [sort] if sort == self.key else [sort, self.key]
+
+  def indexed(self, equal, bounded, sort):
+    """Whether an index answers these filters in the order of ``sort``."""
+    trailing = [name for name in self.order(sort) if name not in equal]
+    if bounded - set(trailing[:1]):
+      return False
+    size = len(equal)
+    return any(set(columns[:size]) == set(equal) and
+               columns[size:size + len(trailing)] == trailing
+               for columns in self.indexes)
+
+  def parse(self, args=None):
+    """Validate the filters of ``args``, the request's by default.
+
+    Returns ``(equal, bounds, sort, descending)``, where ``equal`` maps
+    column names to values and ``bounds`` is a list of ``(column,
+    operator, value)`` tuples.
+    """
+    args = request.args if args is None else args
+    equal = dict((name, args[name]) for name in self.equal if name in args)
+    bounds = []
+    for arg, (name, op) in self.ranges.items():
+      if arg in args:
+        column = getattr(self.model, name)
+        parse = parse_timestamp if column.type.python_type is datetime \
+            else parse_id
+        bounds.append((name, op, parse(args[arg], arg)))
+    bounded = set(name for name, _, _ in bounds)
+
+    sort = args.get('sort')
+    descending = False
+    if sort:
+      descending = sort.startswith('-')
+      sort = sort[1:] if descending else sort
+      if sort not in self.sorts:
+        raise ValidationError('Invalid sort: ' + args['sort'])
+    elif len(bounded) == 1:
+      sort = next(iter(bounded))
+    else:
+      sort = self.default_sort
+    if not self.indexed(equal, bounded, sort):
+      given = [arg for arg in self.args if arg in args]
+      raise ValidationError('Invalid filters: %s cannot be answered from '
+                            'an index' % ', '.join(given))
+    return equal, bounds, sort, descending
+
+  def apply(self, query):
+    """Filter and order ``query`` as the request asks."""
+    equal, bounds, sort, descending = self.parse()
+    column = lambda name: getattr(self.model, name)
+    query = query.filter(*[column(name) == value
+                           for name, value in equal.items()] +
+                         [op(column(name), value)
+                          for name, op, value in bounds])
+    return query.order_by(*[column(name).desc() if descending else
+                            column(name) for name in self.order(sort)])
+
+  def keyset(self):
+    """Return the keyset columns of the requested order and its direction."""
+    _, _, sort, descending = self.parse()
+    return [getattr(self.model, name) for name in self.order(sort)], \
+        descending
+
+
+todo_filters = Filters(Todo, equal=('name', ), ranges={
+    'since': ('timestamp', operator.ge),
+    'until': ('timestamp', operator.lt),
+    'after_id': ('id', operator.gt),
+    'before_id': ('id', operator.lt)
+}, sorts=('name', 'timestamp', 'id'), default_sort='timestamp')
@@ -1,8 +1,18 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from flask import url_for
 from flask.globals import _app_ctx_stack, _request_ctx_stack
-from werkzeug.urls import url_parse
+from werkzeug.urls import url_encode, url_parse
 from werkzeug.exceptions import NotFound
 from .errors import ValidationError
+import json
 import re
+import zlib
+
+try:
+  import xxhash
+except ImportError:  # pragma: no cover
+  xxhash = None
 
 
 url_regex = re.compile(
@@ -54,3 +64,117 @@ def convert_url(url):
   else:
     raise ValidationError('Invalid url: bad type ' + str(url))
   return url
+
+
+# substituted for the integer argument when compiling a URL template; too
+# large for a port number and not something a host name would contain
+_url_sentinel = 2718281828
+
+
+def _url_templates():
+  """Templates of the current app, keyed on the URL root of the request.
+
+  Routing, ``SERVER_NAME`` and proxy headers only affect the scheme, host
+  and script root, so the URL root identifies every variant. The cache is
+  reset if it grows too large, as the Host header comes from clients.
+  """
+  # the context stacks are read directly, proxies cost more than the lookup
+  templates = _app_ctx_stack.top.app.extensions.setdefault('url_templates',
+                                                           {})
+  if len(templates) >= 1024:
+    templates.clear()
+  reqctx = _request_ctx_stack.top
+  return templates, reqctx.request.url_root if reqctx is not None else None
+
+
+def url_template(endpoint, arg):
+  """Return a ``%`` template for external URLs of ``endpoint``.
+
+  ``url_template('api.get_todo', 'id') % 1`` equals
+  ``url_for('api.get_todo', id=1, _external=True)``, but the URL is only
+  built by the router once per application and host.
+  """
+  templates, root = _url_templates()
+  key = (endpoint, arg, root)
+  template = templates.get(key)
+  if template is None:
+    url = url_for(endpoint, _external=True, **{arg: _url_sentinel})
+    template = templates[key] = url.replace('%', '%%').replace(
+        str(_url_sentinel), '%d')
+  return template
+
+
+def external_url(endpoint, path_args=None, **query):
+  """Build ``url_for(endpoint, _external=True, **path_args, **query)``.
+
+  The path is built once per application, host and ``path_args``, and
+  only the query string is encoded on each call.
+  """
+  path_args = path_args or {}
+  templates, root = _url_templates()
+  key = (endpoint, tuple(sorted(path_args.items())), root)
+  url = templates.get(key)
+  if url is None:
+    url = templates[key] = url_for(endpoint, _external=True, **path_args)
+  query = url_encode(query)
+  return url + '?' + query if query else url
+
+
+def encode_cursor(values, direction='next'):
+  """Pack keyset ``values`` into an opaque, URL safe cursor."""
+  values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+  data = json.dumps([direction[0]] + values, separators=(',', ':'))
+  return urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+  """Unpack a cursor made by :func:`encode_cursor` for keyset ``columns``.
+
+  Returns ``(values, direction)``, converting each value back to the
+  python type of its column.
+  """
+  try:
+    data = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    data = json.loads(data.decode('utf-8'))
+    direction, values = {'n': 'next', 'p': 'prev'}[data[0]], data[1:]
+    if len(values) != len(columns):
+      raise ValueError(cursor)
+    values = [datetime.fromisoformat(v)
+              if column.type.python_type is datetime else v
+              for column, v in zip(columns, values)]
+  except (ValueError, TypeError, KeyError, IndexError):
+    raise ValidationError('Invalid cursor: ' + cursor)
+  return values, direction
+
+
+def parse_timestamp(value, name='timestamp'):
+  """Parse an ISO 8601 ``value`` given for the ``name`` argument."""
+  try:
+    return datetime.fromisoformat(value)
+  except (ValueError, TypeError):
+    raise ValidationError('Invalid %s: %s' % (name, value))
+
+
+def fast_hash(data):
+  """Non-cryptographic digest of ``data`` for use in entity tags.
+
+  Uses xxHash when it is installed and falls back to the CRC-32 and
+  Adler-32 checksums from zlib otherwise, both far cheaper than MD5.
+  """
+  if xxhash is not None:  # pragma: no cover
+    return xxhash.xxh3_128_hexdigest(data)
+  return '%08x%08x%x' % (zlib.crc32(data), zlib.adler32(data), len(data))
+
+
+def encoded_etag(etag, encoding):
+  """The ETag of the ``encoding`` compressed representation of ``etag``."""
+  return '%s-%s"' % (etag[:-1], encoding)
+
+
+def decoded_etag(etag, encodings=('gzip', 'br')):
+  """The ETag of the uncompressed representation of ``etag``."""
+  for encoding in encodings:
+    suffix = '-%s"' % encoding
+    if etag.endswith(suffix):
+      return etag[:-len(suffix)] + '"'
+  return etag
@@ -0,0 +1,99 @@
+import threading
+from collections import Counter
+from flask import current_app
+from .background import PeriodicWorker
+from .store import redis_store
+
+
+class HitBuffer:
+  """Aggregates hits per path in memory and flushes them in one batch.
+
+  The buffer is flushed every ``interval`` seconds by a background thread,
+  as soon as ``size`` hits are pending, and once more at worker shutdown.
+  """
+  def __init__(self, counter, redis, interval=5.0, size=1000):
+    self.counter = counter
+    self.redis = redis
+    self.size = size
+    self.lock = threading.Lock()
+    self.counts = Counter()
+    self.pending = 0
+    self.worker = PeriodicWorker(self.flush, interval, 'hit-count-flush')
+
+  def add(self, path):
+    with self.lock:
+      self.counts[path] += 1
+      self.pending += 1
+      full = self.pending >= self.size
+    if full:
+      self.worker.wake()
+
+  def flush(self):
+    with self.lock:
+      counts, self.counts = self.counts, Counter()
+      self.pending = 0
+    if counts:
+      self.counter.write(self.redis, counts)
+
+
+class HitCounter:
+  """Counts hits per request path in Redis.
+
+  Every path has its own ``hit-count<path>`` counter, and a sorted set
+  ranks the paths so the hottest ones can be listed. With
+  ``HIT_COUNT_BUFFERED`` enabled hits are aggregated in process memory
+  and written by :class:`HitBuffer` instead of once per request.
+  """
+  key_prefix = 'hit-count'
+  top_key = 'hit-count-top'
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('HIT_COUNT_BUFFERED', False)
+    app.config.setdefault('HIT_COUNT_FLUSH_INTERVAL', 5.0)
+    app.config.setdefault('HIT_COUNT_FLUSH_SIZE', 1000)
+
+  @property
+  def buffer(self):
+    """The current app's buffer, or ``None`` when buffering is disabled."""
+    if not current_app.config['HIT_COUNT_BUFFERED']:
+      return None
+    buffer = current_app.extensions.get('hit_counter')
+    if buffer is None:
+      buffer = current_app.extensions['hit_counter'] = HitBuffer(
+          self, redis_store.client,
+          current_app.config['HIT_COUNT_FLUSH_INTERVAL'],
+          current_app.config['HIT_COUNT_FLUSH_SIZE'])
+      buffer.worker.start()
+    return buffer
+
+  def write(self, redis, counts):
+    p = redis.pipeline()
+    for path, count in counts.items():
+      p.incrby(self.key_prefix + path, count)
+      p.zincrby(self.top_key, value=path, amount=count)
+    p.execute()
+
+  def incr(self, path):
+    buffer = self.buffer
+    if buffer is not None:
+      buffer.add(path)
+    else:
+      self.write(redis_store.client, {path: 1})
+
+  def flush(self):
+    buffer = current_app.extensions.get('hit_counter')
+    if buffer is not None:
+      buffer.flush()
+
+  def top(self, n=10):
+    """Return the ``n`` most requested paths as ``(path, hits)`` pairs."""
+    return [(path.decode('utf-8'), int(hits))
+            for path, hits in redis_store.client.zrevrange(
+                self.top_key, 0, n - 1, withscores=True)]
+
+
+hit_counter = HitCounter()
@@ -0,0 +1,139 @@
+"""Incremental import of todos from NDJSON or CSV files.
+
+Input is consumed one line at a time and written in batches through the
+bulk writer, so a file of any size is never held in memory. Parsing and
+validation can be spread across a process pool while the calling
+process remains the only writer.
+"""
+import csv
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from .bulk import bulk_writer, validate
+from .errors import ValidationError
+
+mimetypes = {
+    'application/x-ndjson': 'ndjson',
+    'application/json': 'ndjson',
+    'text/csv': 'csv'
+}
+
+
+def decode_lines(stream, encoding='utf-8'):
+  for line in stream:
+    yield line.decode(encoding)
+
+
+def records(lines, format='ndjson'):
+  """Yield ``(line number, record)`` pairs from an iterable of lines.
+
+  NDJSON records are the raw lines, left for :func:`check` to decode.
+  CSV records are dicts keyed by the header row.
+  """
+  if format == 'ndjson':
+    for number, line in enumerate(lines, 1):
+      if line.strip():
+        yield number, line
+  elif format == 'csv':
+    reader = csv.reader(lines)
+    header = next(reader, [])
+    for row in reader:
+      if row:
+        yield reader.line_num, dict(zip(header, row))
+  else:
+    raise ValidationError('Invalid format: ' + str(format))
+
+
+def check(record):
+  """Validate a record, returning ``(line number, row, error message)``."""
+  number, item = record
+  try:
+    if isinstance(item, str):
+      try:
+        item = json.loads(item)
+      except ValueError:
+        raise ValidationError('Invalid todo: malformed JSON')
+    return number, validate(item), None
+  except ValidationError as e:
+    return number, None, e.args[0]
+
+
+def check_chunk(chunk):
+  return [check(record) for record in chunk]
+
+
+def checked(records, chunk_size, workers=0):
+  """Yield the result of :func:`check` for every record, in order.
+
+  With ``workers``, chunks of records are checked in a process pool. At
+  most two chunks per worker are in flight, which bounds the memory used
+  however far the input runs ahead of the writer.
+  """
+  if not workers:
+    for record in records:
+      yield check(record)
+    return
+  records = iter(records)
+  with ProcessPoolExecutor(workers) as pool:
+    pending = deque()
+    for chunk in iter(lambda: list(islice(records, chunk_size)), []):
+      pending.append(pool.submit(check_chunk, chunk))
+      if len(pending) >= workers * 2:
+        yield from pending.popleft().result()
+    while pending:
+      yield from pending.popleft().result()
+
+
+class ImportReport:
+  """Counts of imported and rejected rows, with the first rejections."""
+  max_errors = 100
+
+  def __init__(self):
+    self.rows = 0
+    self.rejected = 0
+    self.errors = []
+    self.start = time.perf_counter()
+    self.seconds = 0.0
+
+  def reject(self, line, message):
+    self.rejected += 1
+    if len(self.errors) < self.max_errors:
+      self.errors.append({'line': line, 'message': message})
+
+  def finish(self):
+    self.seconds = time.perf_counter() - self.start
+
+  @property
+  def rate(self):
+    return self.rows / self.seconds if self.seconds else 0.0
+
+  def to_json(self):
+    return {
+        'rows': self.rows,
+        'rejected': self.rejected,
+        'errors': self.errors,
+        'seconds': round(self.seconds, 3),
+        'rows_per_second': round(self.rate, 1)
+    }
+
+
+def import_todos(lines, format='ndjson', batch_size=None, workers=0):
+  """Validate and insert the todos read from ``lines``."""
+  batch_size = batch_size or bulk_writer.chunk_size
+  report = ImportReport()
+  rows = []
+  for number, row, error in checked(records(lines, format), batch_size,
+                                    workers):
+    if error is not None:
+      report.reject(number, error)
+      continue
+    rows.append(row)
+    if len(rows) == batch_size:
+      report.rows += bulk_writer.insert_many(rows, batch_size)
+      rows = []
+  if rows:
+    report.rows += bulk_writer.insert_many(rows, batch_size)
+  report.finish()
+  return report
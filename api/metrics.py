@@ -0,0 +1,243 @@
+"""In-process latency histograms exposed in the Prometheus text format.
+
+With ``METRICS`` enabled every request is timed per endpoint, method and
+status, the decorators time their own stages (``auth``, ``rate_limit``,
+``etag``, ``serialize``, ``hit_count``) and SQL statements are counted
+and timed from SQLAlchemy engine events, their total per request being
+reported as the ``db`` stage. Observations only take a bucket
+lookup and a short lock, and nothing is recorded when it is disabled.
+"""
+import threading
+import time
+from bisect import bisect_left
+from flask import g
+from flask.globals import _app_ctx_stack, _request_ctx_stack
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+prefix = 'api_'
+
+descriptions = {
+    'request_duration_seconds': ('histogram', 'Time spent handling requests.'),
+    'stage_duration_seconds': ('histogram',
+                               'Time spent in each stage of a request.'),
+    'sql_query_duration_seconds': ('histogram', 'Time spent per SQL query.'),
+    'sql_queries_total': ('counter', 'SQL queries executed.'),
+}
+
+
+class Histogram:
+  def __init__(self, buckets):
+    self.buckets = buckets
+    self.lock = threading.Lock()
+    self.counts = [0] * (len(buckets) + 1)
+    self.sum = 0.0
+
+  def observe(self, value):
+    i = bisect_left(self.buckets, value)
+    with self.lock:
+      self.counts[i] += 1
+      self.sum += value
+
+  def snapshot(self):
+    """Return the cumulative bucket counts, the sum and the count."""
+    with self.lock:
+      counts, total = list(self.counts), self.sum
+    cumulative, running = [], 0
+    for count in counts:
+      running += count
+      cumulative.append(running)
+    return cumulative, total, running
+
+
+class Registry:
+  """Histograms and counters of one app, keyed by name and labels."""
+  def __init__(self, buckets):
+    self.buckets = tuple(sorted(buckets))
+    self.lock = threading.Lock()
+    self.histograms = {}
+    self.counters = {}
+
+  def observe(self, name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    histogram = self.histograms.get(key)
+    if histogram is None:
+      with self.lock:
+        histogram = self.histograms.setdefault(key, Histogram(self.buckets))
+    histogram.observe(value)
+
+  def inc(self, name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with self.lock:
+      self.counters[key] = self.counters.get(key, 0) + amount
+
+  def render(self, gauges=()):
+    lines = []
+    seen = set()
+
+    def header(name, kind, text):
+      if name not in seen:
+        seen.add(name)
+        lines.append('# HELP %s%s %s' % (prefix, name, text))
+        lines.append('# TYPE %s%s %s' % (prefix, name, kind))
+
+    with self.lock:
+      histograms = sorted(self.histograms.items())
+      counters = sorted(self.counters.items())
+    for (name, labels), histogram in histograms:
+      header(name, *descriptions[name])
+      cumulative, total, count = histogram.snapshot()
+      for le, value in zip(self.buckets + ('+Inf', ), cumulative):
+        lines.append('%s%s_bucket%s %d' % (prefix, name, _labels(
+            labels + (('le', le), )), value))
+      lines.append('%s%s_sum%s %r' % (prefix, name, _labels(labels), total))
+      lines.append('%s%s_count%s %d' % (prefix, name, _labels(labels), count))
+    for (name, labels), value in counters:
+      header(name, *descriptions[name])
+      lines.append('%s%s%s %d' % (prefix, name, _labels(labels), value))
+    for name, labels, value in gauges:
+      header(name, 'gauge', name.replace('_', ' ').capitalize() + '.')
+      lines.append('%s%s%s %r' % (prefix, name, _labels(labels), value))
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+  if not labels:
+    return ''
+  return '{%s}' % ','.join('%s="%s"' % (
+      name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+      for name, value in labels)
+
+
+def _registry():
+  appctx = _app_ctx_stack.top
+  return appctx.app.extensions.get('metrics') if appctx is not None else None
+
+
+def _endpoint():
+  reqctx = _request_ctx_stack.top
+  if reqctx is None:
+    return 'none'
+  return reqctx.request.endpoint or 'none'
+
+
+class _Stage:
+  def __init__(self, registry, name):
+    self.registry = registry
+    self.name = name
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.registry.observe('stage_duration_seconds',
+                          time.perf_counter() - self.start,
+                          endpoint=_endpoint(), stage=self.name)
+
+
+class _NullStage:
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    pass
+
+
+_null_stage = _NullStage()
+
+
+class Metrics:
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('METRICS', False)
+    app.config.setdefault('METRICS_BUCKETS', (
+        .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+    if not app.config['METRICS']:
+      return
+    app.extensions['metrics'] = Registry(app.config['METRICS_BUCKETS'])
+    app.before_request(_start_request)
+    app.after_request(_end_request)
+
+  @property
+  def registry(self):
+    return _registry()
+
+  def stage(self, name):
+    """Context manager timing one stage of the current request."""
+    registry = _registry()
+    if registry is None:
+      return _null_stage
+    return _Stage(registry, name)
+
+  def gauges(self):
+    """Current values of the stats kept by the other extensions."""
+    from .cache import response_cache
+    from .compression import compressor
+    from .credentials import credential_cache
+    from .models import db
+    from .rate_limit import local_limiter
+    from .store import redis_store
+    sources = [('redis_pool', redis_store.stats()),
+               ('response_cache', response_cache.stats()),
+               ('compress_cache', compressor.stats()),
+               ('credential_cache', credential_cache.cache.stats())]
+    tier = local_limiter.tier
+    if tier is not None:
+      sources.append(('rate_limit_local', tier.stats()))
+    gauges = [(component + '_' + name, (), value)
+              for component, stats in sources
+              for name, value in sorted(stats.items())
+              if isinstance(value, (int, float))]
+    for bind, stats in sorted(db.pool_stats().items()):
+      gauges.extend(('db_pool_' + name, (('bind', bind), ), value)
+                    for name, value in sorted(stats.items()))
+    return gauges
+
+  def render(self):
+    return self.registry.render(self.gauges())
+
+
+metrics = Metrics()
+
+
+def _start_request():
+  g.metrics_start = time.perf_counter()
+
+
+def _end_request(response):
+  start = g.pop('metrics_start', None)
+  if start is not None:
+    registry, endpoint = _registry(), _endpoint()
+    registry.observe('request_duration_seconds', time.perf_counter() - start,
+                     endpoint=endpoint,
+                     method=_request_ctx_stack.top.request.method,
+                     status=response.status_code)
+    registry.observe('stage_duration_seconds', g.pop('metrics_db', 0.0),
+                     endpoint=endpoint, stage='db')
+  return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+  if _registry() is not None:
+    conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+  starts = conn.info.get('metrics_start')
+  registry = _registry()
+  if not starts or registry is None:
+    return
+  elapsed = time.perf_counter() - starts.pop()
+  endpoint = _endpoint()
+  if _request_ctx_stack.top is not None:
+    g.metrics_db = g.get('metrics_db', 0.0) + elapsed
+  registry.observe('sql_query_duration_seconds', elapsed, endpoint=endpoint)
+  registry.inc('sql_queries_total', endpoint=endpoint)
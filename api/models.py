@@ -1,37 +1,55 @@
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from flask import url_for, current_app
-from flask_sqlalchemy import SQLAlchemy
+from flask import current_app
+from .credentials import credential_cache, token_generations
+from .database import RoutingSQLAlchemy
 from .errors import ValidationError
+from .helpers import url_template
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 
 class Todo(db.Model):
   __tablename__ = 'todos'
   id = db.Column(db.Integer, primary_key=True)
-  name = db.Column(db.String(64), index=True)
+  name = db.Column(db.String(64))
   task = db.Column(db.String(250))
   timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+  version = db.Column(db.Integer, nullable=False, default=1,
+                      onupdate=db.literal_column('version + 1'))
+  # each one answers a combination of filters and order of the list, see
+  # api.filters
+  __table_args__ = (
+      db.Index('ix_todos_timestamp_id', 'timestamp', 'id'),
+      db.Index('ix_todos_name_id', 'name', 'id'),
+      db.Index('ix_todos_name_timestamp_id', 'name', 'timestamp', 'id'))
+
+  json_fields = ('url', 'name', 'task', 'timestamp')
 
   def get_url(self):
-    return url_for('api.get_todo', id=self.id, _external=True)
+    return url_template('api.get_todo', 'id') % self.id
+
+  def to_json(self, fields=None):
+    # only touch the requested attributes, the others may not be loaded
+    return dict((field, self.get_url() if field == 'url' else
+                 getattr(self, field)) for field in fields or self.json_fields)
 
-  def to_json(self):
-    return {
-      'url': self.get_url(),
-      'name': self.name,
-      'task': self.task,
-      'timestamp': self.timestamp
-    }
+  @staticmethod
+  def json_columns(fields):
+    """Names of the columns :meth:`to_json` reads for ``fields``."""
+    return ['id' if field == 'url' else field for field in fields]
 
   def from_json(self, json):
     try:
-      self.name = json['name']
-      self.task = json['task']
+      name, task = json['name'], json['task']
     except KeyError as e:
       raise ValidationError('Invalid todo: missing ' + e.args[0])
+    for field, value in (('name', name), ('task', task)):
+      if not isinstance(value, str):
+        raise ValidationError('Invalid todo: %s is not a string' % field)
+    self.name = name
+    self.task = task
     return self
 
 
@@ -48,13 +66,21 @@ class User(db.Model):
   @password.setter
   def password(self, password):
     self.password_hash = generate_password_hash(password)
+    credential_cache.invalidate_user(self.id)
 
   def verify_password(self, password):
     return check_password_hash(self.password_hash, password)
 
   def generate_auth_token(self, expires_in=3600):
     s = Serializer(current_app.config['SECRET_KEY'], expires_in=expires_in)
-    return s.dumps({'id': self.id}).decode('utf-8')
+    return s.dumps({
+        'id': self.id,
+        'username': self.username,
+        'gen': token_generations.get(self.id)
+    }).decode('utf-8')
+
+  def revoke_tokens(self):
+    token_generations.bump(self.id)
 
   @staticmethod
   def verify_auth_token(token):
@@ -63,5 +89,33 @@ class User(db.Model):
       data = s.loads(token)
     except Exception:
       return None
+    if data.get('gen') != token_generations.get(data['id']):
+      return None
+    if current_app.config['STATELESS_TOKENS']:
+      return Principal(data['id'], data['username'])
     return User.query.get(data['id'])
 
+
+class Principal:
+  """A user authenticated by the claims of a signed token.
+
+  The claims are enough for most requests, so the :class:`User` row is
+  only loaded when some other attribute is accessed.
+  """
+  def __init__(self, id, username):
+    self.id = id
+    self.username = username
+    self._user = None
+
+  @property
+  def user(self):
+    if self._user is None:
+      self._user = User.query.get(self.id)
+    return self._user
+
+  def __getattr__(self, name):
+    return getattr(self.user, name)
+
+  def revoke_tokens(self):
+    token_generations.bump(self.id)
+
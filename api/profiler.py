@@ -0,0 +1,179 @@
+"""Opt-in sampling profiler for requests to the API blueprint.
+
+With ``PROFILER`` enabled, a request is profiled when it carries the
+``X-Profile`` header set to ``PROFILER_TOKEN`` or when it is picked at
+``PROFILER_SAMPLE_RATE``. While it runs, a background thread samples its
+stack every ``PROFILER_INTERVAL`` seconds, so the request itself is not
+slowed down by tracing. Each profile is written as flamegraph compatible
+collapsed stacks to ``PROFILER_DIR``, by default ``profiles`` in the
+instance folder, which keeps only the most recent ``PROFILER_RING_SIZE``
+files.
+"""
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from flask import current_app, request
+
+
+def collapse(frame):
+  """Return the stack of ``frame`` as ``module:function`` names, root first."""
+  names = []
+  while frame is not None:
+    names.append('%s:%s' % (frame.f_globals.get('__name__', '?'),
+                            frame.f_code.co_name))
+    frame = frame.f_back
+  return ';'.join(reversed(names))
+
+
+class Sampler:
+  """Samples the stacks of registered threads from a daemon thread."""
+  def __init__(self, interval):
+    self.interval = interval
+    self.lock = threading.Lock()
+    self.samples = {}
+    self.active = threading.Event()
+    self.thread = None
+
+  def start(self, ident):
+    with self.lock:
+      self.samples[ident] = Counter()
+      if self.thread is None:
+        self.thread = threading.Thread(target=self.run, name='profiler',
+                                       daemon=True)
+        self.thread.start()
+      self.active.set()
+
+  def stop(self, ident):
+    with self.lock:
+      samples = self.samples.pop(ident, Counter())
+      if not self.samples:
+        self.active.clear()
+    return samples
+
+  def sample(self):
+    with self.lock:
+      idents = list(self.samples)
+    frames = sys._current_frames()
+    stacks = [(ident, collapse(frames[ident])) for ident in idents
+              if ident in frames]
+    with self.lock:
+      for ident, stack in stacks:
+        if ident in self.samples:
+          self.samples[ident][stack] += 1
+
+  def run(self):
+    while True:
+      self.active.wait()
+      self.sample()
+      time.sleep(self.interval)
+
+
+class Ring:
+  """Directory holding at most ``size`` profiles, oldest removed first."""
+  def __init__(self, directory, size):
+    self.directory = directory
+    self.size = size
+    self.lock = threading.Lock()
+
+  def write(self, name, samples):
+    os.makedirs(self.directory, exist_ok=True)
+    path = os.path.join(self.directory, '%019d-%d-%s.folded' % (
+        time.time() * 1e9, os.getpid(), name))
+    with open(path, 'w') as f:
+      for stack, count in samples.most_common():
+        f.write('%s %d\n' % (stack, count))
+    with self.lock:
+      for old in self.files()[:-self.size]:
+        try:
+          os.remove(old)
+        except OSError:  # pragma: no cover
+          pass
+    return path
+
+  def files(self):
+    if not os.path.isdir(self.directory):
+      return []
+    return [os.path.join(self.directory, name)
+            for name in sorted(os.listdir(self.directory))
+            if name.endswith('.folded')]
+
+
+def summarize(paths, package='api'):
+  """Rank the functions of ``package`` found in the collapsed stacks.
+
+  Returns ``(function, own, total)`` tuples by decreasing ``own`` count.
+  ``total`` counts the samples the function was on the stack for, and
+  ``own`` those where it was the innermost frame of the package, which
+  includes the time spent in libraries it called.
+  """
+  own, total = Counter(), Counter()
+  prefix = package + '.'
+  for path in paths:
+    with open(path) as f:
+      for line in f:
+        stack, _, count = line.rstrip('\n').rpartition(' ')
+        frames = [frame for frame in stack.split(';')
+                  if frame.startswith(prefix)]
+        if not frames:
+          continue
+        for frame in set(frames):
+          total[frame] += int(count)
+        own[frames[-1]] += int(count)
+  return sorted(((frame, own[frame], total[frame]) for frame in total),
+                key=lambda row: (-row[1], -row[2], row[0]))
+
+
+class Profiler:
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('PROFILER', False)
+    app.config.setdefault('PROFILER_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILER_TOKEN', None)
+    app.config.setdefault('PROFILER_INTERVAL', 0.005)
+    app.config.setdefault('PROFILER_DIR', None)
+    app.config.setdefault('PROFILER_RING_SIZE', 100)
+    if app.config['PROFILER']:
+      app.extensions['profiler'] = Sampler(app.config['PROFILER_INTERVAL'])
+    directory = app.config['PROFILER_DIR'] or os.path.join(
+        app.instance_path, 'profiles')
+    app.extensions['profiler_ring'] = Ring(directory,
+                                           app.config['PROFILER_RING_SIZE'])
+
+  @property
+  def ring(self):
+    return current_app.extensions['profiler_ring']
+
+  def wanted(self):
+    config = current_app.config
+    token = request.headers.get('X-Profile')
+    if token is not None and config['PROFILER_TOKEN']:
+      return hmac.compare_digest(token.encode('utf-8'),
+                                 config['PROFILER_TOKEN'].encode('utf-8'))
+    return random.random() < config['PROFILER_SAMPLE_RATE']
+
+  def start(self):
+    """Start sampling the current request if it should be profiled."""
+    if not current_app.config['PROFILER'] or not self.wanted():
+      return
+    request.environ['api.profiler'] = threading.get_ident()
+    current_app.extensions['profiler'].start(threading.get_ident())
+
+  def finish(self):
+    """Stop sampling the current request and save its profile."""
+    ident = request.environ.pop('api.profiler', None)
+    if ident is None:
+      return None
+    samples = current_app.extensions['profiler'].stop(ident)
+    if not samples:
+      return None
+    return self.ring.write(request.endpoint or 'none', samples)
+
+
+profiler = Profiler()
@@ -0,0 +1,14 @@
+from flask import Blueprint, Response
+from .auth import auth
+from .decorators import no_cache
+from .metrics import metrics
+
+prometheus = Blueprint('prometheus', __name__)
+
+
+@prometheus.route('/metrics')
+@no_cache
+@auth.login_required
+def get_metrics():
+  return Response(metrics.render(),
+                  mimetype='text/plain; version=0.0.4; charset=utf-8')
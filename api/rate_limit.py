@@ -1,54 +1,164 @@
+import math
+import os
+import threading
 import time
-from redis import Redis
+from collections import OrderedDict
 from flask import current_app
+from .store import redis_store, emulate
 
-redis = None
+# Every script answers ``{allowed, remaining, reset}`` with ``reset`` in
+# milliseconds, so checking and consuming the budget is one atomic round
+# trip regardless of the algorithm.
 
+FIXED_WINDOW = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+  redis.call('EXPIREAT', KEYS[1], ARGV[2])
+end
+local limit = tonumber(ARGV[1])
+current = math.min(current, limit)
+local allowed = 0
+if current < limit then
+  allowed = 1
+end
+return {allowed, limit - current, tonumber(ARGV[3])}
+"""
 
-class FakeRedis:
-  """Redis mock used for testing."""
-  def __init__(self):
-    self.v = {}
-    self.last_key = None
+SLIDING_WINDOW = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+local allowed = 0
+if count < limit then
+  redis.call('ZADD', KEYS[1], now, ARGV[4])
+  count = count + 1
+  allowed = 1
+end
+redis.call('PEXPIRE', KEYS[1], window)
+local reset = now + window
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if oldest[2] then
+  reset = tonumber(oldest[2]) + window
+end
+return {allowed, limit - count, reset}
+"""
 
-  def pipeline(self):
-    return self
+TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local rate = capacity / window
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+  tokens = capacity
+  ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], window)
+return {allowed, math.floor(tokens), now + math.ceil((capacity - tokens) / rate)}
+"""
 
-  def incr(self, key):
-    if self.v.get(key, None) is None:
-      self.v[key] = 0
-    self.v[key] += 1
-    self.last_key = key
 
-  def expireat(self, key, exp_time):
-    pass
+@emulate(FIXED_WINDOW)
+def _fixed_window(redis, keys, args):
+  current = redis.incr(keys[0])
+  if current == 1:
+    redis.expireat(keys[0], int(args[1]))
+  limit = int(args[0])
+  current = min(current, limit)
+  return [int(current < limit), limit - current, int(args[2])]
 
-  def execute(self):
-    return [self.v[self.last_key]]
+
+@emulate(SLIDING_WINDOW)
+def _sliding_window(redis, keys, args):
+  limit, window, now = int(args[0]), int(args[1]), int(args[2])
+  redis.zremrangebyscore(keys[0], '-inf', now - window)
+  count = redis.zcard(keys[0])
+  allowed = 0
+  if count < limit:
+    redis.zadd(keys[0], {args[3]: now})
+    count += 1
+    allowed = 1
+  redis.pexpire(keys[0], window)
+  reset = now + window
+  oldest = redis.zrange(keys[0], 0, 0, withscores=True)
+  if oldest:
+    reset = int(oldest[0][1]) + window
+  return [allowed, limit - count, reset]
+
+
+@emulate(TOKEN_BUCKET)
+def _token_bucket(redis, keys, args):
+  capacity, window, now = int(args[0]), int(args[1]), int(args[2])
+  rate = capacity / window
+  tokens, ts = redis.hmget(keys[0], ['tokens', 'ts'])
+  if tokens is None:
+    tokens, ts = capacity, now
+  tokens = min(capacity, float(tokens) + max(0, now - int(ts)) * rate)
+  allowed = 0
+  if tokens >= 1:
+    tokens -= 1
+    allowed = 1
+  redis.hmset(keys[0], {'tokens': tokens, 'ts': now})
+  redis.pexpire(keys[0], window)
+  return [allowed, int(math.floor(tokens)),
+          now + int(math.ceil((capacity - tokens) / rate))]
+
+
+def _fixed_window_call(key_prefix, limit, per, now):
+  reset = (int(now) // per) * per + per
+  keys = [key_prefix + str(reset)]
+  args = [limit, reset + RateLimit.expiration_window, reset * 1000]
+  return keys, args
+
+
+def _sliding_window_call(key_prefix, limit, per, now):
+  now = int(now * 1000)
+  member = '%d-%s' % (now, os.urandom(6).hex())
+  return [key_prefix + 'sliding-window'], [limit, per * 1000, now, member]
+
+
+def _token_bucket_call(key_prefix, limit, per, now):
+  return [key_prefix + 'token-bucket'], [limit, per * 1000, int(now * 1000)]
+
+
+algorithms = {
+    'fixed-window': (FIXED_WINDOW, _fixed_window_call),
+    'sliding-window': (SLIDING_WINDOW, _sliding_window_call),
+    'token-bucket': (TOKEN_BUCKET, _token_bucket_call)
+}
 
 
 class RateLimit:
   expiration_window = 10
 
-  def __init__(self, key_prefix, limit, per):
-    global redis
-    if redis is None and current_app.config['USE_RATE_LIMITS']:
-      if current_app.config['TESTING']:
-        redis = FakeRedis()
-      else:  # pragma: no cover
-        redis_host = current_app.config.get("REDIS_HOST", "localhost")
-        redis_port = current_app.config.get("REDIS_PORT", 6379)
-        redis_db = current_app.config.get("REDIS_DB", 0)
-        redis = Redis(host=redis_host, port=redis_port, db=redis_db)
-
-    self.reset = (int(time.time()) // per) * per + per
-    self.key = key_prefix + str(self.reset)
+  def __init__(self, key_prefix, limit, per, algorithm='fixed-window',
+               now=None):
+    if algorithm not in algorithms:
+      raise ValueError('Unknown rate limit algorithm: ' + algorithm)
+    script, make_call = algorithms[algorithm]
+    keys, args = make_call(key_prefix, limit, per,
+                           time.time() if now is None else now)
+    allowed, remaining, reset = redis_store.script(script)(keys=keys,
+                                                           args=args)
+    self.key = keys[0]
+    self.algorithm = algorithm
     self.limit = limit
     self.per = per
-    p = redis.pipeline()
-    p.incr(self.key)
-    p.expireat(self.key, self.reset + self.expiration_window)
-    self.current = min(p.execute()[0], limit)
+    self.allowed = bool(allowed)
+    self.current = limit - int(remaining)
+    self.reset_at = int(reset) / 1000.0
+    self.reset = int(math.ceil(self.reset_at))
 
   @property
   def remaining(self):
@@ -56,4 +166,109 @@ class RateLimit:
 
   @property
   def over_limit(self):
-    return self.current >= self.limit
+    return not self.allowed
+
+
+class LocalTier:
+  """Bounded per-worker mirrors of the budgets kept by :class:`RateLimit`.
+
+  Each scope key gets a bucket holding what Redis last reported for it.
+  Under the window algorithms the bucket keeps the ``remaining`` budget
+  until the reported reset passes and is full again after it; under the
+  token bucket it refills continuously from the tokens Redis has left.
+  Requests let through are taken from the bucket, so a client that used
+  up what Redis granted it is rejected without any network I/O until
+  Redis would accept it again. Buckets are evicted in LRU order once
+  ``size`` keys are tracked. Every request that is not shed still goes
+  through Redis, so the shared budget sees every request a worker lets
+  through.
+  """
+  def __init__(self, size=1024):
+    self.size = size
+    self.lock = threading.Lock()
+    self.buckets = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def shed(self, key, limit, per, now=None):
+    """Return the reset time if ``key`` must be rejected locally."""
+    now = time.time() if now is None else now
+    with self.lock:
+      bucket = self.buckets.get(key)
+      if bucket is None:
+        # [tokens, ts, reset_at, continuous], nothing is known before the
+        # first answer from Redis
+        bucket = self.buckets[key] = [float(limit), now, None, False]
+        if len(self.buckets) > self.size:
+          self.buckets.popitem(last=False)
+          self.evictions += 1
+      else:
+        self.buckets.move_to_end(key)
+        if bucket[3]:
+          bucket[0] = min(float(limit),
+                          bucket[0] + (now - bucket[1]) * limit / per)
+        elif bucket[2] is not None and now >= bucket[2]:
+          bucket[0], bucket[2] = float(limit), None
+        bucket[1] = now
+      if bucket[0] < 1 and (bucket[3] or bucket[2] is not None):
+        self.hits += 1
+        if bucket[3]:
+          return int(now + (1 - bucket[0]) * per / limit) + 1
+        return int(math.ceil(bucket[2]))
+      bucket[0] -= 1
+      self.misses += 1
+    return None
+
+  def update(self, key, limiter, now=None):
+    """Reset the local bucket to the budget Redis reported."""
+    now = time.time() if now is None else now
+    with self.lock:
+      bucket = self.buckets.get(key)
+      if bucket is None:
+        return
+      if limiter.algorithm == 'token-bucket':
+        # the bucket is full at the reset and refills at limit / per; the
+        # reset is rounded up to the millisecond, so round it back down
+        full_in = max(0.0, limiter.reset_at - 0.001 - now)
+        bucket[0] = limiter.limit - full_in * limiter.limit / limiter.per
+        bucket[2], bucket[3] = None, True
+      else:
+        bucket[0] = float(limiter.remaining)
+        bucket[2], bucket[3] = limiter.reset_at, False
+      bucket[1] = now
+
+  def stats(self):
+    with self.lock:
+      return {
+          'hits': self.hits,
+          'misses': self.misses,
+          'evictions': self.evictions,
+          'size': len(self.buckets),
+          'capacity': self.size
+      }
+
+
+class LocalLimiter:
+  """Extension that owns the optional :class:`LocalTier` of each app."""
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('RATE_LIMIT_LOCAL_TIER', False)
+    app.config.setdefault('RATE_LIMIT_LOCAL_SIZE', 1024)
+
+  @property
+  def tier(self):
+    """The current app's tier, or ``None`` when it is disabled."""
+    if not current_app.config['RATE_LIMIT_LOCAL_TIER']:
+      return None
+    tier = current_app.extensions.get('rate_limit_local')
+    if tier is None:
+      tier = current_app.extensions['rate_limit_local'] = LocalTier(
+          current_app.config['RATE_LIMIT_LOCAL_SIZE'])
+    return tier
+
+
+local_limiter = LocalLimiter()
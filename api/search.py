@@ -0,0 +1,153 @@
+"""Full-text search over the name and task of todos.
+
+When SQLite is built with FTS5 the todos are indexed in the ``todos_fts``
+virtual table. The table is created and dropped along with ``todos``,
+and a flush listener keeps it in sync inside the transaction that
+changes the todos. A query matches todos containing every word, the last
+one as a prefix, ranked with BM25. A match in the name weighs
+``SEARCH_NAME_WEIGHT`` times more than one in the task. Other databases,
+or ``SEARCH_BACKEND = 'like'``, fall back to ``LIKE`` filters that list
+name matches first.
+"""
+import re
+import sqlite3
+from flask import current_app
+from sqlalchemy import Column, DDL, Integer, MetaData, Table, Text, and_, \
+    case, event, func, literal_column, or_, select
+from .bulk import chunks, todos
+from .errors import ValidationError
+from .events import on_flush
+from .models import db, Todo
+
+CREATE = ("CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5("
+          "name, task, tokenize='unicode61 remove_diacritics 2')")
+DROP = 'DROP TABLE IF EXISTS todos_fts'
+
+# the index is not part of the models' metadata, create_all must not
+# make it an ordinary table
+fts = Table('todos_fts', MetaData(),
+            Column('rowid', Integer, primary_key=True),
+            Column('name', Text), Column('task', Text))
+
+_words = re.compile(r'\w+', re.UNICODE)
+_fts5 = None
+
+
+def fts5_available():
+  """Whether the sqlite3 module was built with FTS5."""
+  global _fts5
+  if _fts5 is None:
+    connection = sqlite3.connect(':memory:')
+    try:
+      connection.execute('CREATE VIRTUAL TABLE t USING fts5(a)')
+      _fts5 = True
+    except sqlite3.OperationalError:
+      _fts5 = False
+    finally:
+      connection.close()
+  return _fts5
+
+
+def _indexed(ddl, target, bind, **kwargs):
+  return bind.dialect.name == 'sqlite' and fts5_available()
+
+
+event.listen(todos, 'after_create', DDL(CREATE).execute_if(callable_=_indexed))
+event.listen(todos, 'after_drop', DDL(DROP).execute_if(callable_=_indexed))
+
+
+def _like(word):
+  return '%' + re.sub(r'([\\%_])', r'\\\1', word) + '%'
+
+
+class TodoSearch:
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('SEARCH_BACKEND', 'auto')
+    app.config.setdefault('SEARCH_NAME_WEIGHT', 10.0)
+    app.config.setdefault('SEARCH_MAX_WORDS', 16)
+
+  def available(self):
+    """Whether the configuration and the database allow an FTS5 index."""
+    backend = current_app.config['SEARCH_BACKEND']
+    if backend not in ('auto', 'fts5', 'like'):
+      raise ValueError('Unknown search backend: ' + backend)
+    available = db.engine.dialect.name == 'sqlite' and fts5_available()
+    if backend == 'fts5' and not available:
+      raise ValueError('The fts5 search backend needs SQLite with FTS5')
+    return backend != 'like' and available
+
+  @property
+  def backend(self):
+    """``'fts5'`` or ``'like'``, resolved once per application.
+
+    A database created before the index existed uses ``'like'`` until
+    ``manage.py reindex`` builds the index.
+    """
+    backend = current_app.extensions.get('search_backend')
+    if backend is None:
+      # checked on the session's connection, a connection of its own
+      # could end the transaction the session has open
+      connection = db.session.connection()
+      backend = current_app.extensions['search_backend'] = 'fts5' if \
+          self.available() and connection.dialect.has_table(
+              connection, 'todos_fts') else 'like'
+    return backend
+
+  def query(self, q):
+    """Return a ``Todo`` query of the matches of ``q``, best first."""
+    words = _words.findall(q or '')
+    if not words:
+      raise ValidationError('Invalid search: q needs at least one word')
+    words = words[:current_app.config['SEARCH_MAX_WORDS']]
+    if self.backend == 'fts5':
+      match = ' '.join('"%s"' % word for word in words) + '*'
+      rank = func.bm25(literal_column('todos_fts'),
+                       current_app.config['SEARCH_NAME_WEIGHT'], 1.0)
+      return Todo.query.join(fts, fts.c.rowid == Todo.id).filter(
+          literal_column('todos_fts').op('MATCH')(match)).order_by(
+              rank, Todo.id)
+    patterns = [_like(word) for word in words]
+    in_name = and_(*[Todo.name.ilike(p, escape='\\') for p in patterns])
+    return Todo.query.filter(*[or_(Todo.name.ilike(p, escape='\\'),
+                                   Todo.task.ilike(p, escape='\\'))
+                               for p in patterns]).order_by(
+                                   case([(in_name, 0)], else_=1), Todo.id)
+
+  def rebuild(self):
+    """Recreate the index from the todos table, return the rows indexed."""
+    if not self.available():
+      return 0
+    connection = db.session.connection()
+    connection.execute(DROP)
+    connection.execute(CREATE)
+    connection.execute(fts.insert().from_select(
+        ['rowid', 'name', 'task'], select([todos.c.id, todos.c.name,
+                                           todos.c.task])))
+    connection.execute("INSERT INTO todos_fts(todos_fts) VALUES('optimize')")
+    count = connection.execute(select([func.count()]).select_from(
+        fts)).scalar()
+    db.session.commit()
+    current_app.extensions['search_backend'] = 'fts5'
+    return count
+
+
+todo_search = TodoSearch()
+
+
+@on_flush
+def _sync_index(session, changes):
+  if todo_search.backend != 'fts5':
+    return
+  connection = session.connection()
+  for chunk in chunks(sorted(changes.updated | changes.deleted), 500):
+    connection.execute(fts.delete().where(fts.c.rowid.in_(chunk)))
+  fresh = (changes.created | changes.updated) - changes.deleted
+  for chunk in chunks(sorted(fresh), 500):
+    connection.execute(fts.insert().from_select(
+        ['rowid', 'name', 'task'],
+        select([todos.c.id, todos.c.name,
+                todos.c.task]).where(todos.c.id.in_(chunk))))
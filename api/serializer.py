@@ -0,0 +1,131 @@
+"""Pluggable JSON encoding of API responses.
+
+``JSON_BACKEND`` selects ``orjson``, ``ujson`` or the standard library
+``json`` module, and ``auto`` picks the fastest one installed. Output is
+always compact UTF-8. Datetimes are encoded as HTTP dates like Flask's
+``jsonify`` does, or as ISO 8601 with ``JSON_DATETIME_FORMAT = 'iso'``.
+"""
+import json
+from datetime import date
+from flask import current_app
+from werkzeug.http import http_date
+
+try:
+  import orjson
+except ImportError:  # pragma: no cover
+  orjson = None
+
+try:
+  import ujson
+except ImportError:  # pragma: no cover
+  ujson = None
+
+
+def _encode_default(datetime_format):
+  def default(obj):
+    if isinstance(obj, date):
+      if datetime_format == 'http':
+        return http_date(obj)
+      return obj.isoformat()
+    raise TypeError('%r is not JSON serializable' % (obj, ))
+
+  return default
+
+
+class StdlibBackend:
+  name = 'json'
+
+  def __init__(self, datetime_format):
+    self.encoder = json.JSONEncoder(
+        ensure_ascii=False, separators=(',', ':'),
+        default=_encode_default(datetime_format))
+
+  def dumps(self, obj):
+    return self.encoder.encode(obj).encode('utf-8')
+
+
+class UJSONBackend:
+  name = 'ujson'
+
+  def __init__(self, datetime_format):
+    self.default = _encode_default(datetime_format)
+
+  def dumps(self, obj):
+    return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False,
+                       default=self.default).encode('utf-8')
+
+
+class ORJSONBackend:
+  name = 'orjson'
+
+  def __init__(self, datetime_format):
+    self.default = _encode_default(datetime_format)
+    # orjson writes datetimes natively in ISO 8601
+    self.option = orjson.OPT_PASSTHROUGH_DATETIME \
+        if datetime_format == 'http' else 0
+
+  def dumps(self, obj):
+    return orjson.dumps(obj, default=self.default, option=self.option)
+
+
+backends = {
+    'orjson': (orjson, ORJSONBackend),
+    'ujson': (ujson, UJSONBackend),
+    'json': (json, StdlibBackend)
+}
+
+
+def make_backend(name='auto', datetime_format='http'):
+  if datetime_format not in ('http', 'iso'):
+    raise ValueError('Unknown datetime format: ' + datetime_format)
+  if name == 'auto':
+    name = next(name for name, (module, _) in backends.items()
+                if module is not None)
+  if name not in backends:
+    raise ValueError('Unknown JSON backend: ' + name)
+  module, backend = backends[name]
+  if module is None:
+    raise ValueError('JSON backend %s is not installed' % name)
+  return backend(datetime_format)
+
+
+class Serializer:
+  def __init__(self, app=None):
+    self.constants = {}
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('JSON_BACKEND', 'auto')
+    app.config.setdefault('JSON_DATETIME_FORMAT', 'http')
+    backend = app.extensions['json_backend'] = make_backend(
+        app.config['JSON_BACKEND'], app.config['JSON_DATETIME_FORMAT'])
+    app.extensions['json_constants'] = dict(
+        (name, backend.dumps(obj)) for name, obj in self.constants.items())
+
+  @property
+  def backend(self):
+    return current_app.extensions['json_backend']
+
+  def register(self, name, obj):
+    """Have ``obj`` encoded once by every app, see :meth:`encoded`.
+
+    Must be called before the apps are created, at import time.
+    """
+    self.constants[name] = obj
+
+  def encoded(self, name):
+    """The bytes the current app encoded the constant ``name`` to."""
+    return current_app.extensions['json_constants'][name]
+
+  def dumps(self, obj):
+    """Encode ``obj`` to compact UTF-8 JSON bytes."""
+    return self.backend.dumps(obj)
+
+  def response(self, obj, status=None):
+    """Drop-in replacement for ``jsonify`` using the selected backend."""
+    return current_app.response_class(self.dumps(obj), status=status,
+                                      mimetype='application/json')
+
+
+serializer = Serializer()
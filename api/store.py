@@ -0,0 +1,445 @@
+import threading
+import time
+from flask import current_app
+
+
+class PoolStats:
+  """Checkout and wait counters shared by the real and the fake pool."""
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.checkouts = 0
+    self.waits = 0
+    self.wait_time = 0.0
+    self.max_wait = 0.0
+    self.in_use = 0
+    self.max_in_use = 0
+
+  def checkout(self, waited):
+    with self.lock:
+      self.checkouts += 1
+      self.in_use += 1
+      self.max_in_use = max(self.max_in_use, self.in_use)
+      if waited > 0.001:
+        self.waits += 1
+      self.wait_time += waited
+      self.max_wait = max(self.max_wait, waited)
+
+  def release(self):
+    with self.lock:
+      self.in_use = max(self.in_use - 1, 0)
+
+  def as_dict(self):
+    with self.lock:
+      return {
+          'checkouts': self.checkouts,
+          'waits': self.waits,
+          'wait_time': self.wait_time,
+          'max_wait': self.max_wait,
+          'in_use': self.in_use,
+          'max_in_use': self.max_in_use
+      }
+
+
+def _make_pool_class():  # pragma: no cover
+  from redis import BlockingConnectionPool
+
+  class InstrumentedConnectionPool(BlockingConnectionPool):
+    """Bounded connection pool that records checkout and wait times."""
+    def __init__(self, *args, **kwargs):
+      super().__init__(*args, **kwargs)
+      self.stats = PoolStats()
+
+    def get_connection(self, command_name, *keys, **options):
+      start = time.perf_counter()
+      connection = super().get_connection(command_name, *keys, **options)
+      self.stats.checkout(time.perf_counter() - start)
+      return connection
+
+    def release(self, connection):
+      super().release(connection)
+      self.stats.release()
+
+  return InstrumentedConnectionPool
+
+
+class FakeConnectionPool:
+  """Stand-in for the connection pool of :class:`FakeRedis`."""
+  def __init__(self, max_connections=None):
+    self.max_connections = max_connections
+    self.stats = PoolStats()
+
+
+class FakeRedis:
+  """In-process Redis stand-in used for testing.
+
+  Values are stored as bytes like a real server returns them and keys
+  honour their TTLs, so code written against the real client runs
+  unchanged against it.
+  """
+  def __init__(self, max_connections=None, clock=time.time):
+    self.connection_pool = FakeConnectionPool(max_connections)
+    self.clock = clock
+    self.lock = threading.RLock()
+    self.data = {}
+    self.expires = {}
+
+  def _command(self):
+    self.connection_pool.stats.checkout(0.0)
+    self.connection_pool.stats.release()
+
+  def _expire_key(self, name):
+    expires = self.expires.get(name)
+    if expires is not None and expires <= self.clock():
+      self.data.pop(name, None)
+      self.expires.pop(name, None)
+
+  def _get(self, name, default=None):
+    self._expire_key(name)
+    return self.data.get(name, default)
+
+  @staticmethod
+  def _encode(value):
+    if isinstance(value, bytes):
+      return value
+    if isinstance(value, float):
+      return repr(value).encode('utf-8')
+    return str(value).encode('utf-8')
+
+  def pipeline(self, transaction=True):
+    return FakePipeline(self)
+
+  def ping(self):
+    self._command()
+    return True
+
+  def get(self, name):
+    with self.lock:
+      self._command()
+      return self._get(name)
+
+  def mget(self, keys, *args):
+    with self.lock:
+      self._command()
+      return [self._get(name) for name in list(keys) + list(args)]
+
+  def set(self, name, value, ex=None, px=None, nx=False, xx=False):
+    with self.lock:
+      self._command()
+      exists = self._get(name) is not None
+      if (nx and exists) or (xx and not exists):
+        return None
+      self.data[name] = self._encode(value)
+      self.expires.pop(name, None)
+      if ex is not None:
+        self.expires[name] = self.clock() + ex
+      elif px is not None:
+        self.expires[name] = self.clock() + px / 1000.0
+      return True
+
+  def incrby(self, name, amount=1):
+    with self.lock:
+      self._command()
+      value = int(self._get(name, b'0')) + amount
+      self.data[name] = self._encode(value)
+      return value
+
+  def incr(self, name, amount=1):
+    return self.incrby(name, amount)
+
+  def expire(self, name, seconds):
+    return self.expireat(name, self.clock() + seconds)
+
+  def expireat(self, name, when):
+    with self.lock:
+      self._command()
+      if self._get(name) is None:
+        return False
+      self.expires[name] = when
+      return True
+
+  def ttl(self, name):
+    with self.lock:
+      self._command()
+      if self._get(name) is None:
+        return -2
+      expires = self.expires.get(name)
+      if expires is None:
+        return -1
+      return int(round(expires - self.clock()))
+
+  def exists(self, name):
+    with self.lock:
+      self._command()
+      return self._get(name) is not None
+
+  def delete(self, *names):
+    with self.lock:
+      self._command()
+      deleted = 0
+      for name in names:
+        if self._get(name) is not None:
+          deleted += 1
+        self.data.pop(name, None)
+        self.expires.pop(name, None)
+      return deleted
+
+  def sadd(self, name, *values):
+    with self.lock:
+      self._command()
+      members = self._get(name)
+      if members is None:
+        members = self.data[name] = set()
+      before = len(members)
+      members.update(self._encode(value) for value in values)
+      return len(members) - before
+
+  def smembers(self, name):
+    with self.lock:
+      self._command()
+      return set(self._get(name, set()))
+
+  def pexpire(self, name, milliseconds):
+    return self.expireat(name, self.clock() + milliseconds / 1000.0)
+
+  def hmget(self, name, keys, *args):
+    with self.lock:
+      self._command()
+      fields = self._get(name, {})
+      return [fields.get(self._encode(key)) for key in list(keys) + list(args)]
+
+  def hmset(self, name, mapping):
+    with self.lock:
+      self._command()
+      fields = self._get(name)
+      if fields is None:
+        fields = self.data[name] = {}
+      for key, value in mapping.items():
+        fields[self._encode(key)] = self._encode(value)
+      return True
+
+  def hgetall(self, name):
+    with self.lock:
+      self._command()
+      return dict(self._get(name, {}))
+
+  def rpush(self, name, *values):
+    with self.lock:
+      self._command()
+      items = self._get(name)
+      if items is None:
+        items = self.data[name] = []
+      items.extend(self._encode(value) for value in values)
+      return len(items)
+
+  def llen(self, name):
+    with self.lock:
+      self._command()
+      return len(self._get(name, []))
+
+  def lrange(self, name, start, end):
+    with self.lock:
+      self._command()
+      items = self._get(name, [])
+      end = len(items) if end == -1 else end + 1
+      return items[start:end]
+
+  def ltrim(self, name, start, end):
+    with self.lock:
+      self._command()
+      items = self._get(name, [])
+      end = len(items) if end == -1 else end + 1
+      items[:] = items[start:end]
+      if not items:
+        self.data.pop(name, None)
+      return True
+
+  def zadd(self, name, mapping):
+    with self.lock:
+      self._command()
+      members = self._get(name)
+      if members is None:
+        members = self.data[name] = {}
+      added = 0
+      for member, score in mapping.items():
+        member = self._encode(member)
+        added += member not in members
+        members[member] = float(score)
+      return added
+
+  def zincrby(self, name, value, amount=1):
+    with self.lock:
+      self._command()
+      members = self._get(name)
+      if members is None:
+        members = self.data[name] = {}
+      value = self._encode(value)
+      members[value] = members.get(value, 0.0) + amount
+      return members[value]
+
+  def zcard(self, name):
+    with self.lock:
+      self._command()
+      return len(self._get(name, {}))
+
+  def zscore(self, name, value):
+    with self.lock:
+      self._command()
+      return self._get(name, {}).get(self._encode(value))
+
+  def zremrangebyscore(self, name, min, max):
+    with self.lock:
+      self._command()
+      members = self._get(name, {})
+      removed = [member for member, score in members.items()
+                 if float(min) <= score <= float(max)]
+      for member in removed:
+        del members[member]
+      return len(removed)
+
+  def zrange(self, name, start, end, desc=False, withscores=False):
+    with self.lock:
+      self._command()
+      members = sorted(self._get(name, {}).items(),
+                       key=lambda item: (item[1], item[0]), reverse=desc)
+      end = len(members) if end == -1 else end + 1
+      members = members[start:end]
+      if withscores:
+        return members
+      return [member for member, _ in members]
+
+  def zrevrange(self, name, start, end, withscores=False):
+    return self.zrange(name, start, end, desc=True, withscores=withscores)
+
+  def register_script(self, script):
+    return FakeScript(self, script)
+
+  def flushdb(self):
+    with self.lock:
+      self._command()
+      self.data.clear()
+      self.expires.clear()
+      return True
+
+
+_emulations = {}
+
+
+def emulate(script):
+  """Register a Python emulation of a Lua ``script`` for FakeRedis.
+
+  The emulation is called as ``func(redis, keys, args)`` while the fake
+  server lock is held, which gives it the same atomicity as EVALSHA.
+  """
+  def decorator(func):
+    _emulations[script] = func
+    return func
+
+  return decorator
+
+
+class FakeScript:
+  """Counterpart of ``redis.client.Script`` for FakeRedis."""
+  def __init__(self, redis, script):
+    self.redis = redis
+    self.script = script
+    self.func = _emulations[script]
+
+  def __call__(self, keys=[], args=[], client=None):
+    redis = client or self.redis
+    with redis.lock:
+      return self.func(redis, list(keys), list(args))
+
+
+class FakePipeline:
+  """Buffers commands and runs them atomically against a FakeRedis."""
+  def __init__(self, redis):
+    self.redis = redis
+    self.commands = []
+
+  def __getattr__(self, name):
+    method = getattr(self.redis, name)
+
+    def queue(*args, **kwargs):
+      self.commands.append((method, args, kwargs))
+      return self
+
+    return queue
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.reset()
+
+  def __len__(self):
+    return len(self.commands)
+
+  def reset(self):
+    self.commands = []
+
+  def execute(self):
+    with self.redis.lock:
+      results = [method(*args, **kwargs)
+                 for method, args, kwargs in self.commands]
+    self.reset()
+    return results
+
+
+class RedisStore:
+  """App-scoped Redis client backed by a bounded connection pool.
+
+  The client is created once in :func:`init_app` and shared by every
+  request of the application, so Redis traffic reuses pooled connections
+  instead of opening a new one per request.
+  """
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('REDIS_HOST', 'localhost')
+    app.config.setdefault('REDIS_PORT', 6379)
+    app.config.setdefault('REDIS_DB', 0)
+    app.config.setdefault('REDIS_MAX_CONNECTIONS', 50)
+    app.config.setdefault('REDIS_POOL_TIMEOUT', 5)
+    app.config.setdefault('REDIS_SOCKET_TIMEOUT', 1)
+    app.config.setdefault('REDIS_SOCKET_CONNECT_TIMEOUT', 1)
+    if app.config['TESTING']:
+      client = FakeRedis(max_connections=app.config['REDIS_MAX_CONNECTIONS'])
+    else:  # pragma: no cover
+      from redis import Redis
+      pool = _make_pool_class()(
+          host=app.config['REDIS_HOST'],
+          port=app.config['REDIS_PORT'],
+          db=app.config['REDIS_DB'],
+          max_connections=app.config['REDIS_MAX_CONNECTIONS'],
+          timeout=app.config['REDIS_POOL_TIMEOUT'],
+          socket_timeout=app.config['REDIS_SOCKET_TIMEOUT'],
+          socket_connect_timeout=app.config['REDIS_SOCKET_CONNECT_TIMEOUT'])
+      client = Redis(connection_pool=pool)
+    app.extensions['redis'] = client
+
+  @property
+  def client(self):
+    return current_app.extensions['redis']
+
+  def script(self, source):
+    """Return ``source`` registered as a script on the app's client.
+
+    Scripts are registered once per application and invoked through
+    EVALSHA afterwards, so each call is a single atomic round trip.
+    """
+    scripts = current_app.extensions.setdefault('redis_scripts', {})
+    script = scripts.get(source)
+    if script is None:
+      script = scripts[source] = self.client.register_script(source)
+    return script
+
+  def stats(self):
+    pool = self.client.connection_pool
+    stats = pool.stats.as_dict()
+    stats['max_connections'] = pool.max_connections
+    return stats
+
+
+redis_store = RedisStore()
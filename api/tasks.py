@@ -1,4 +1,6 @@
+from contextlib import nullcontext
 from celery import Celery
+from flask import has_app_context
 
 celery = Celery()
 
@@ -6,3 +8,35 @@ celery = Celery()
 @celery.task
 def sample():
   return "something"
+
+
+worker_app = None
+
+
+def app_context():
+  """The current app context, or one for an app owned by this worker."""
+  global worker_app
+  if has_app_context():
+    return nullcontext()
+  if worker_app is None:
+    from .app import create_app
+    worker_app = create_app()
+  return worker_app.app_context()
+
+
+@celery.task
+def reconcile_counts():
+  """Correct the maintained row counts, see :mod:`api.counts`."""
+  from .counts import row_counts
+  with app_context():
+    return row_counts.reconcile()
+
+
+@celery.task
+def apply_writes(shard):
+  """Drain one write-behind shard, see :mod:`api.write_behind`."""
+  from .write_behind import write_behind
+  with app_context():
+    if write_behind.drain(shard) and write_behind.pending(shard):
+      # mutations queued while the lock was held found it taken
+      apply_writes.delay(shard)
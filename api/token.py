@@ -1,7 +1,8 @@
 from flask import Blueprint, g
 from flask_httpauth import HTTPBasicAuth
-from .models import User
+from .auth import auth, authenticate
 from .errors import unauthorized
+from .metrics import metrics
 from .decorators import no_cache, json
 
 token = Blueprint('token', __name__)
@@ -10,10 +11,9 @@ token_auth = HTTPBasicAuth()
 
 @token_auth.verify_password
 def verify_password(username_or_token, password):
-  g.user = User.query.filter_by(username=username_or_token).first()
-  if not g.user:
-    return False
-  return g.user.verify_password(password)
+  with metrics.stage('auth'):
+    g.user = authenticate(username_or_token, password)
+    return g.user is not None
 
 
 @token_auth.error_handler
@@ -27,3 +27,12 @@ def unauthorized_error():
 @json
 def request_token():
   return {'token': g.user.generate_auth_token()}
+
+
+@token.route('/revoke-token', methods=['POST'])
+@no_cache
+@auth.login_required
+@json
+def revoke_token():
+  g.user.revoke_tokens()
+  return {}
@@ -1,5 +1,6 @@
 from flask import Blueprint, g
 from ..errors import ValidationError, bad_request, not_found
+from ..profiler import profiler
 
 
 api = Blueprint('api', __name__)
@@ -20,6 +21,16 @@ def not_found_error(e):
   return not_found('item not found')
 
 
+@api.before_request
+def before_request():
+  profiler.start()
+
+
+@api.teardown_request
+def teardown_request(exc):
+  profiler.finish()
+
+
 @api.after_request
 def after_request(response):
   if hasattr(g, 'headers'):
@@ -27,4 +38,4 @@ def after_request(response):
   return response
 
 # do this last to avoid circular dependencies
-from . import todos
+from . import todos, bulk, export
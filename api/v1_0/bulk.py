@@ -0,0 +1,93 @@
+from flask import current_app, request
+from ..bulk import bulk_writer, existing_ids, validate
+from ..decorators import json
+from ..errors import ValidationError
+from ..helpers import url_template
+from ..importer import decode_lines, import_todos, mimetypes
+from ..auth import auth
+from . import api
+
+
+def bulk_items():
+  items = request.json
+  if not isinstance(items, list):
+    raise ValidationError('Invalid request: expected an array')
+  if len(items) > current_app.config['BULK_MAX_ITEMS']:
+    raise ValidationError('Invalid request: more than %d items' %
+                          current_app.config['BULK_MAX_ITEMS'])
+  return items
+
+
+def validate_all(items, with_id=False):
+  """Validate every item, returning the valid rows and per-item results."""
+  rows, results = [], []
+  for item in items:
+    try:
+      rows.append(validate(item, with_id))
+      results.append(None)
+    except ValidationError as e:
+      results.append({'status': 400, 'message': e.args[0]})
+  return rows, results
+
+
+def fill(results, statuses):
+  statuses = iter(statuses)
+  return [result or next(statuses) for result in results]
+
+
+def not_found(id):
+  return {'status': 404, 'id': id, 'message': 'item not found'}
+
+
+@api.route('/todos/bulk', methods=['POST'])
+@auth.login_required
+@json
+def bulk_new_todos():
+  rows, results = validate_all(bulk_items())
+  ids = bulk_writer.insert(rows)
+  return {'results': fill(results, [{
+      'status': 201,
+      'id': id,
+      'location': url_template('api.get_todo', 'id') % id
+  } for id in ids])}
+
+
+@api.route('/todos/bulk', methods=['PUT'])
+@auth.login_required
+@json
+def bulk_edit_todos():
+  rows, results = validate_all(bulk_items(), with_id=True)
+  found = existing_ids(row['id'] for row in rows)
+  bulk_writer.update([row for row in rows if row['id'] in found])
+  return {'results': fill(results, [{
+      'status': 200,
+      'id': row['id'],
+      'location': url_template('api.get_todo', 'id') % row['id']
+  } if row['id'] in found else not_found(row['id']) for row in rows])}
+
+
+@api.route('/todos/bulk', methods=['DELETE'])
+@auth.login_required
+@json
+def bulk_delete_todos():
+  ids, results = [], []
+  for id in bulk_items():
+    if isinstance(id, int):
+      ids.append(id)
+      results.append(None)
+    else:
+      results.append({'status': 400, 'message': 'Invalid id: ' + str(id)})
+  found = existing_ids(ids)
+  bulk_writer.delete(sorted(found))
+  return {'results': fill(results, [
+      {'status': 200, 'id': id} if id in found else not_found(id)
+      for id in ids])}
+
+
+@api.route('/todos/import', methods=['POST'])
+@auth.login_required
+@json
+def import_todos_file():
+  format = request.args.get('format') or mimetypes.get(request.mimetype,
+                                                       'ndjson')
+  return import_todos(decode_lines(request.stream), format)
@@ -0,0 +1,25 @@
+from flask import Response, request, stream_with_context
+from ..auth import auth
+from ..decorators import no_cache, read_only
+from ..errors import ValidationError
+from ..export import todo_exporter
+from ..helpers import parse_timestamp
+from . import api
+
+
+@api.route('/todos/export', methods=['GET'])
+@read_only
+@auth.login_required
+@no_cache
+def export_todos():
+  since = request.args.get('since')
+  until = request.args.get('until')
+  after_id = request.args.get('after_id')
+  if after_id is not None and not after_id.isdigit():
+    raise ValidationError('Invalid after_id: ' + after_id)
+  lines = todo_exporter.ndjson(
+      since=since and parse_timestamp(since, 'since'),
+      until=until and parse_timestamp(until, 'until'),
+      after_id=after_id and int(after_id))
+  return Response(stream_with_context(lines),
+                  mimetype='application/x-ndjson')
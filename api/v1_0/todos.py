@@ -1,23 +1,78 @@
-from flask import request
+from flask import abort, request
 from ..models import db, Todo
-from ..decorators import json, paginate, etag, rate_limit, hit_count
+from ..decorators import json, paginate, etag, rate_limit, hit_count, \
+    no_cache, read_only
 from ..auth import auth
+from ..cache import response_cache
+from ..filters import todo_filters
+from ..search import todo_search
+from ..versions import generations
+from ..write_behind import write_behind
 from . import api
 
 
+def todos_tags():
+  names = ['todos:membership']
+  # edits move todos in and out of a name filter and along a name order
+  by_name = 'name' in request.args or \
+      request.args.get('sort', '').lstrip('-') == 'name'
+  if request.args.get('expand') or request.args.get('fields') or by_name:
+    names.append('todos:content')
+  return names
+
+
+def todos_generation():
+  return '.'.join(str(g) for g in generations.get(*todos_tags()))
+
+
+def search_generation():
+  # matches and their ranking depend on the content of every todo
+  return '.'.join(str(g) for g in generations.get('todos:membership',
+                                                  'todos:content'))
+
+
+def todo_version(id):
+  version = db.session.query(Todo.version).filter_by(id=id).scalar()
+  if version is None:
+    return None
+  # SQLite reuses the id of a deleted todo, whose generation moved on
+  generation, = generations.get('todo:%d' % id)
+  return '%d.%d.%d' % (id, version, generation)
+
+
+def accepted(status_url):
+  return {'status': 'pending', 'url': status_url}, 202, \
+      {'Location': status_url}
+
+
 @api.route('/todos/', methods=['GET'])
+@read_only
 @rate_limit(limit=45, per=15)
 @auth.login_required
-@etag
-@paginate()
+@response_cache.cached(tags=todos_tags)
+@etag(validator=todos_generation)
+@paginate(keyset=todo_filters.keyset, args=todo_filters.args,
+          unfiltered=todo_filters.unfiltered)
 def get_todos():
-  return Todo.query
+  return todo_filters.apply(Todo.query)
+
+
+@api.route('/todos/search', methods=['GET'])
+@read_only
+@rate_limit(limit=45, per=15)
+@auth.login_required
+@etag(validator=search_generation)
+@paginate(args=('q', ))
+def search_todos():
+  return todo_search.query(request.args.get('q'))
 
 
 @api.route('/todos/<int:id>', methods=['GET'])
+@read_only
 @rate_limit(limit=5, per=15)
 @hit_count
-@etag
+@response_cache.cached(tags=lambda id: ['todo:%d' % id])
+@etag(validator=todo_version)
 @json
 def get_todo(id):
   return Todo.query.get_or_404(id)
@@ -28,6 +83,8 @@ def get_todo(id):
 @json
 def new_todo():
   todo = Todo().from_json(request.json)
+  if write_behind.enabled:
+    return accepted(write_behind.enqueue(todo))
   db.session.add(todo)
   db.session.commit()
   return {}, 201, {'Location': todo.get_url()}
@@ -37,6 +94,8 @@ def new_todo():
 @auth.login_required
 @json
 def edit_todo(id):
+  if write_behind.enabled:
+    return accepted(write_behind.enqueue(Todo().from_json(request.json), id))
   todo = Todo.query.get_or_404(id)
   todo.from_json(request.json)
   db.session.add(todo)
@@ -52,3 +111,14 @@ def delete_todo(id):
   db.session.delete(todo)
   db.session.commit()
   return {}
+
+
+@api.route('/todos/writes/<id>', methods=['GET'])
+@auth.login_required
+@no_cache
+@json
+def get_write(id):
+  status = write_behind.status(id)
+  if status is None:
+    abort(404)
+  return status
@@ -0,0 +1,51 @@
+import time
+from .events import on_commit
+from .store import redis_store
+
+
+class Generations:
+  """Generation counters of collections, kept in Redis.
+
+  A generation changes whenever its collection does, which makes it a
+  cheap version token for conditional requests on list endpoints. A
+  missing counter starts from the current time rather than zero, so
+  losing the Redis data can never bring back a previously issued token.
+  """
+  key_prefix = 'generation/'
+
+  def get(self, *names):
+    redis = redis_store.client
+    keys = [self.key_prefix + name for name in names]
+    values = redis.mget(keys)
+    if None in values:
+      p = redis.pipeline()
+      for key in keys:
+        p.set(key, int(time.time() * 1000), nx=True)
+      p.mget(keys)
+      values = p.execute()[-1]
+    return [int(value) for value in values]
+
+  def bump(self, *names):
+    p = redis_store.client.pipeline()
+    for name in names:
+      p.incr(self.key_prefix + name)
+    p.execute()
+
+
+generations = Generations()
+
+
+def changed_generations(changes):
+  """Names of the generations a set of :class:`Changes` moves on."""
+  names = ['todo:%d' % id for id in
+           sorted(changes.created | changes.updated | changes.deleted)]
+  if changes.created or changes.deleted:
+    names.append('todos:membership')
+  if changes.updated:
+    names.append('todos:content')
+  return names
+
+
+@on_commit
+def _bump_todos(changes):
+  generations.bump(*changed_generations(changes))
@@ -0,0 +1,11 @@
+"""Celery worker entry point, run with ``celery -A api.worker worker``.
+
+The app configures the shared Celery instance and is reused by the tasks
+that need an application context.
+"""
+from . import tasks
+from .app import create_app
+
+app = create_app()
+tasks.worker_app = app
+celery = tasks.celery
@@ -0,0 +1,219 @@
+"""Write-behind queue for todo writes.
+
+With ``WRITE_BEHIND`` enabled ``new_todo`` and ``edit_todo`` only
+validate the request, append the mutation to one of
+``WRITE_BEHIND_SHARDS`` Redis lists and answer ``202 Accepted`` with the
+URL of its status. The :func:`api.tasks.apply_writes` task drains a shard
+while holding its lock. Every mutation of a todo lands on the same shard,
+so they are applied in the order they were accepted. Each batch of up to
+``WRITE_BEHIND_BATCH_SIZE`` mutations keeps only the last edit of every
+todo and is written in a single transaction. Mutations are removed from
+the queue once their batch is committed and reported, by a script that
+also renews the lock, so ``WRITE_BEHIND_LOCK_TIMEOUT`` only has to cover
+one batch. A worker that finds its lock taken over leaves the batch in
+the queue for the new owner, which skips the mutations already reported
+as done. The report is written to Redis after the commit, so a worker
+that dies between the two leaves its batch to be applied again, and the
+todos it created are created a second time. A batch the database
+rejects is retried one mutation at a time, and the mutations that still
+fail are reported as failed and dropped from the queue.
+"""
+import json
+import os
+import zlib
+from collections import OrderedDict
+from flask import current_app, url_for
+from sqlalchemy import bindparam
+from sqlalchemy.exc import DBAPIError
+from . import events
+from .bulk import existing_ids, todos
+from .helpers import url_template
+from .models import db, Todo
+from .store import emulate, redis_store
+
+queue_key = 'write-behind/queue/'
+lock_key = 'write-behind/lock/'
+status_key = 'write-behind/status/'
+
+RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+TRIM = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+  return 0
+end
+redis.call('LTRIM', KEYS[2], ARGV[2], -1)
+redis.call('PEXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+@emulate(RELEASE)
+def _release(redis, keys, args):
+  if redis.get(keys[0]) == redis._encode(args[0]):
+    return redis.delete(keys[0])
+  return 0
+
+
+@emulate(TRIM)
+def _trim(redis, keys, args):
+  if redis.get(keys[0]) != redis._encode(args[0]):
+    return 0
+  redis.ltrim(keys[1], int(args[1]), -1)
+  redis.pexpire(keys[0], int(args[2]))
+  return 1
+
+
+class WriteBehind:
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('WRITE_BEHIND', False)
+    app.config.setdefault('WRITE_BEHIND_SHARDS', 8)
+    app.config.setdefault('WRITE_BEHIND_BATCH_SIZE', 500)
+    app.config.setdefault('WRITE_BEHIND_LOCK_TIMEOUT', 60)
+    app.config.setdefault('WRITE_BEHIND_STATUS_TTL', 3600)
+
+  @property
+  def enabled(self):
+    return current_app.config['WRITE_BEHIND']
+
+  def shard(self, key):
+    return zlib.crc32(key.encode('utf-8')) % \
+        current_app.config['WRITE_BEHIND_SHARDS']
+
+  def enqueue(self, todo, id=None):
+    """Queue the creation of ``todo``, or its edit when ``id`` is given.
+
+    Returns the URL of the status of the write.
+    """
+    from .tasks import apply_writes
+    write_id = os.urandom(12).hex()
+    shard = self.shard(write_id if id is None else 'todo:%d' % id)
+    mutation = {'id': write_id, 'todo': id, 'name': todo.name,
+                'task': todo.task}
+    p = redis_store.client.pipeline()
+    p.hmset(status_key + write_id, {'status': 'pending'})
+    p.expire(status_key + write_id,
+             current_app.config['WRITE_BEHIND_STATUS_TTL'])
+    p.rpush(queue_key + str(shard), json.dumps(mutation))
+    p.execute()
+    apply_writes.delay(shard)
+    return url_for('api.get_write', id=write_id, _external=True)
+
+  def status(self, write_id):
+    """Return the status of a write as JSON, or ``None`` if unknown."""
+    fields = redis_store.client.hgetall(status_key + write_id)
+    if not fields:
+      return None
+    status = dict((key.decode('utf-8'), value.decode('utf-8'))
+                  for key, value in fields.items())
+    if 'todo' in status:
+      status['url'] = url_template('api.get_todo', 'id') % int(
+          status.pop('todo'))
+    return status
+
+  def drain(self, shard):
+    """Apply the queued mutations of ``shard`` until it is empty.
+
+    Returns ``False`` without doing anything when another worker holds
+    the lock of the shard, or as soon as another worker took it over
+    because a batch outlived the lock, and ``True`` otherwise.
+    """
+    client = redis_store.client
+    lock, queue = lock_key + str(shard), queue_key + str(shard)
+    token = os.urandom(8).hex()
+    timeout = current_app.config['WRITE_BEHIND_LOCK_TIMEOUT']
+    if not client.set(lock, token, nx=True, ex=timeout):
+      return False
+    try:
+      size = current_app.config['WRITE_BEHIND_BATCH_SIZE']
+      while True:
+        batch = client.lrange(queue, 0, size - 1)
+        if not batch:
+          break
+        self.apply([json.loads(item.decode('utf-8')) for item in batch])
+        if not redis_store.script(TRIM)(keys=[lock, queue], args=[
+            token, len(batch), timeout * 1000]):
+          return False
+    finally:
+      redis_store.script(RELEASE)(keys=[lock], args=[token])
+    return True
+
+  def pending(self, shard):
+    return redis_store.client.llen(queue_key + str(shard))
+
+  def apply(self, mutations):
+    """Write a batch of mutations in one transaction and report them.
+
+    When the database rejects the batch its mutations are retried one at
+    a time, and those it still rejects are reported as failed, so a bad
+    write never holds up the writes queued behind it.
+    """
+    try:
+      self.write(mutations)
+    except DBAPIError:
+      db.session.rollback()
+      if len(mutations) > 1:
+        for mutation in mutations:
+          self.apply([mutation])
+      else:
+        self.report([(mutations[0]['id'], {
+            'status': 'failed',
+            'message': 'rejected by the database'
+        })])
+
+  def write(self, mutations):
+    client = redis_store.client
+    done = client.pipeline()
+    for mutation in mutations:
+      done.hmget(status_key + mutation['id'], ['status'])
+    mutations = [mutation for mutation, (status, ) in
+                 zip(mutations, done.execute()) if status != b'done']
+    creates = [mutation for mutation in mutations if mutation['todo'] is None]
+    edits = OrderedDict()
+    for mutation in mutations:
+      if mutation['todo'] is not None:
+        edits.setdefault(mutation['todo'], []).append(mutation)
+    found = existing_ids(edits)
+
+    rows = [{'name': m['name'], 'task': m['task']} for m in creates]
+    if rows:
+      db.session.bulk_insert_mappings(Todo, rows, return_defaults=True)
+    # only the last edit of a todo is written, the others are replaced
+    updates = [edits[id][-1] for id in edits if id in found]
+    if updates:
+      db.session.execute(
+          todos.update().where(todos.c.id == bindparam('_id')).values(
+              name=bindparam('_name'), task=bindparam('_task')),
+          [{'_id': m['todo'], '_name': m['name'], '_task': m['task']}
+           for m in updates])
+    events.record(db.session, created=[row['id'] for row in rows],
+                  updated=[m['todo'] for m in updates])
+    db.session.commit()
+
+    statuses = [(m['id'], {'status': 'done', 'todo': row['id']})
+                for m, row in zip(creates, rows)]
+    for id, group in edits.items():
+      status = {'status': 'done', 'todo': id} if id in found else \
+          {'status': 'failed', 'message': 'item not found'}
+      statuses.extend((m['id'], status) for m in group)
+    self.report(statuses)
+
+  def report(self, statuses):
+    p = redis_store.client.pipeline()
+    for write_id, status in statuses:
+      p.hmset(status_key + write_id, status)
+      p.expire(status_key + write_id,
+               current_app.config['WRITE_BEHIND_STATUS_TTL'])
+    p.execute()
+
+
+write_behind = WriteBehind()
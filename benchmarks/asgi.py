@@ -0,0 +1,130 @@
+"""Compare the threaded WSGI server with the ASGI app at high concurrency.
+
+An asyncio client process opens ``connections`` sockets at once and each sends
+``requests`` GETs of the todo list, one per connection, so the servers
+have to accept and hold that many concurrent clients. The WSGI app runs
+on the werkzeug threaded server, the ASGI app on uvicorn (skipped when
+uvicorn is not installed). Throughput, latency percentiles and errors are
+printed per mode. Run with ``python -m benchmarks.asgi [connections]``.
+"""
+import asyncio
+import importlib.util
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.serving import make_server
+from api.asgi import AsyncApp
+from .common import make_app, schema_hash, seed_todos, token_client
+from .suite import QuietHandler, percentile
+
+
+def free_port():
+  with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    return s.getsockname()[1]
+
+
+def serve_wsgi(app):
+  server = make_server('127.0.0.1', 0, app, threaded=True,
+                       request_handler=QuietHandler)
+  server.socket.listen(2048)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server.server_port, server.shutdown
+
+
+def serve_asgi(app):
+  import uvicorn
+  port = free_port()
+  server = uvicorn.Server(uvicorn.Config(
+      AsyncApp(app, app.config['ASGI_WORKERS']), host='127.0.0.1', port=port,
+      log_level='warning', backlog=2048))
+  threading.Thread(target=server.run, daemon=True).start()
+  while not server.started:
+    time.sleep(0.01)
+
+  def stop():
+    server.should_exit = True
+
+  return port, stop
+
+
+async def fetch(port, request):
+  start = time.perf_counter()
+  reader, writer = await asyncio.open_connection('127.0.0.1', port)
+  try:
+    writer.write(request)
+    response = await reader.read()
+  finally:
+    writer.close()
+  if not response.startswith(b'HTTP/1.1 200') and \
+      not response.startswith(b'HTTP/1.0 200'):
+    raise IOError(response[:40])
+  return (time.perf_counter() - start) * 1000
+
+
+async def drive(port, request, connections, requests):
+  timings = []
+  errors = 0
+  start = time.perf_counter()
+  for _ in range(requests):
+    results = await asyncio.gather(*[fetch(port, request)
+                                     for _ in range(connections)],
+                                   return_exceptions=True)
+    for result in results:
+      if isinstance(result, Exception):
+        errors += 1
+      else:
+        timings.append(result)
+  elapsed = time.perf_counter() - start
+  timings.sort()
+  return {
+      'throughput': len(timings) / elapsed,
+      'p50_ms': percentile(timings, 50),
+      'p99_ms': percentile(timings, 99),
+      'errors': errors
+  }
+
+
+def load(port, request, connections, requests):
+  return asyncio.run(drive(port, request, connections, requests))
+
+
+def main(connections=1000, requests=3, rows=1000):
+  connections, requests = int(connections), int(requests)
+  path = os.path.join(tempfile.gettempdir(), 'flask-sample-asgi-%s-%d.sqlite'
+                      % (schema_hash(), int(rows)))
+  app = make_app(path, ASGI_WORKERS=32)
+  with app.app_context():
+    seed_todos(int(rows))
+    auth = token_client(app).auth
+  request = ('GET /api/v1.0/todos/?per_page=20 HTTP/1.1\r\n'
+             'Host: 127.0.0.1\r\nAuthorization: %s\r\n'
+             'Connection: close\r\n\r\n' % auth).encode('latin-1')
+  servers = [('wsgi-threaded', serve_wsgi)]
+  if importlib.util.find_spec('uvicorn') is not None:
+    servers.append(('asgi-uvicorn', serve_asgi))
+  else:
+    print('uvicorn is not installed, skipping the ASGI mode')
+  print('%-14s %12s %10s %10s %8s' % ('mode', 'requests/s', 'p50 ms',
+                                      'p99 ms', 'errors'))
+  for name, serve in servers:
+    port, stop = serve(app)
+    try:
+      # the client runs in its own process so it does not compete with
+      # the server threads for the GIL
+      with ProcessPoolExecutor(1) as client:
+        result = client.submit(load, port, request, connections,
+                               requests).result()
+    finally:
+      stop()
+    print('%-14s %12.0f %10.1f %10.1f %8d' % (
+        name, result['throughput'], result['p50_ms'], result['p99_ms'],
+        result['errors']))
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
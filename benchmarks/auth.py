@@ -0,0 +1,28 @@
+"""Measure the per-request cost of Basic authentication.
+
+Compares username/password requests with the credential cache disabled
+and enabled. Run with ``python -m benchmarks.auth``.
+"""
+import sys
+from tests.test_client import TestClient
+from .common import make_app, token_client, timeit
+
+
+def main(requests=200):
+  requests = int(requests)
+  print('%-24s %12s' % ('password auth', 'ms/request'))
+  for name, ttl in (('without cache', 0), ('with cache', 60)):
+    app = make_app(USE_TOKEN_AUTH=False, AUTH_CACHE_TTL=ttl)
+    with app.app_context():
+      token_client(app)
+      client = TestClient(app, 'bench', 'bench')
+
+      def run():
+        for _ in range(requests):
+          client.get('/api/v1.0/todos/?per_page=1')
+
+      print('%-24s %12.3f' % (name, timeit(run, 5) / requests))
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
@@ -0,0 +1,48 @@
+"""Measure importing todos one request per row versus in bulk.
+
+Each mode starts from an empty database file and reports rows per
+second. Run with ``python -m benchmarks.bulk [rows]``.
+"""
+import os
+import sys
+import tempfile
+import time
+from .common import make_app, token_client
+
+
+def run(name, rows, import_rows):
+  fd, path = tempfile.mkstemp(suffix='.sqlite')
+  os.close(fd)
+  try:
+    app = make_app(path)
+    with app.app_context():
+      client = token_client(app)
+      todos = [{'name': 'todo %d' % i, 'task': 'task %d' % i}
+               for i in range(rows)]
+      start = time.perf_counter()
+      import_rows(client, todos)
+      elapsed = time.perf_counter() - start
+    print('%-24s %10.3f %12.0f' % (name, elapsed, rows / elapsed))
+  finally:
+    os.remove(path)
+
+
+def one_by_one(client, todos):
+  for todo in todos:
+    client.post('/api/v1.0/todos/', data=todo)
+
+
+def bulk(client, todos, size=10000):
+  for i in range(0, len(todos), size):
+    client.post('/api/v1.0/todos/bulk', data=todos[i:i + size])
+
+
+def main(rows=10000):
+  rows = int(rows)
+  print('%-24s %10s %12s' % ('import %d todos' % rows, 'seconds', 'rows/s'))
+  run('one request per row', rows, one_by_one)
+  run('bulk endpoint', rows, bulk)
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
@@ -0,0 +1,84 @@
+"""Helpers shared by the benchmark scripts."""
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateTable
+from api.app import create_app
+from api.counts import row_counts
+from api.helpers import fast_hash
+from api.models import db, Todo, User
+from tests.test_client import TestClient
+
+
+class BenchConfig:
+  TESTING = True
+  SECRET_KEY = 'secret'
+  USE_TOKEN_AUTH = True
+  USE_RATE_LIMITS = False
+  SQLALCHEMY_TRACK_MODIFICATIONS = False
+  CELERY_RESULT_BACKEND = 'cache+memory://'
+  BROKER_URL = 'memory://'
+
+
+def schema_hash():
+  ddl = ''.join(str(CreateTable(table).compile(dialect=sqlite.dialect()))
+                for table in db.metadata.sorted_tables)
+  return fast_hash(ddl.encode('utf-8'))[:12]
+
+
+def make_app(path=None, **settings):
+  """Create an app on a SQLite file, reusing it if it already exists.
+
+  The file name includes a hash of the schema, so a database seeded by an
+  older version of the models is never reused.
+  """
+  if path is None:
+    path = os.path.join(tempfile.gettempdir(),
+                        'flask-sample-bench-%s.sqlite' % schema_hash())
+  config = type('Config', (BenchConfig, ), dict(
+      settings, SQLALCHEMY_DATABASE_URI='sqlite:///' + path))
+  app = create_app(config)
+  with app.app_context():
+    db.create_all()
+  return app
+
+
+def seed_todos(count, chunk=50000):
+  """Grow the todos table to ``count`` rows with a bulk insert."""
+  existing = Todo.query.count()
+  if existing >= count:
+    return count
+  start = datetime(2018, 1, 1)
+  insert = Todo.__table__.insert()
+  for first in range(existing, count, chunk):
+    db.session.execute(insert, [{
+        'name': 'todo %d' % i,
+        'task': 'task number %d' % i,
+        'timestamp': start + timedelta(seconds=i)
+    } for i in range(first, min(first + chunk, count))])
+    db.session.commit()
+  # the inserts bypass the change events that maintain the row count
+  row_counts.reconcile()
+  return count
+
+
+def token_client(app, username='bench', password='bench'):
+  user = User.query.filter_by(username=username).first()
+  if user is None:
+    user = User(username=username, password=password)
+    db.session.add(user)
+    db.session.commit()
+  return TestClient(app, user.generate_auth_token(), '')
+
+
+def timeit(func, repeat=20):
+  """Return the median wall time of ``func`` in milliseconds."""
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    timings.append((time.perf_counter() - start) * 1000)
+  timings.sort()
+  return timings[len(timings) // 2]
@@ -0,0 +1,43 @@
+"""Latency of GET /todos/ with and without the maintained row count.
+
+Run with ``python -m benchmarks.counts [rows ...]``. Each size is seeded
+once into a SQLite file of its own in the temporary directory. The second
+page is requested, since a short first page is never counted. The
+filtered list bounds the timestamp to all but the first todo, which is
+counted in full unless approximate counts are enabled.
+"""
+import os
+import sys
+import tempfile
+from .common import make_app, schema_hash, seed_todos, token_client, timeit
+
+modes = (('COUNT(*)', {'ROW_COUNTS': False}),
+         ('row count', {}),
+         ('approximate', {'ROW_COUNTS_APPROXIMATE': True}))
+urls = (('unfiltered', '/api/v1.0/todos/?page=2'),
+        ('filtered', '/api/v1.0/todos/?page=2&since=2018-01-01T00:00:01'))
+
+
+def main(*sizes):
+  sizes = [int(size) for size in sizes or (100000, 1000000)]
+  print('%-10s %-12s %12s %12s %12s' % (('rows', 'list') + tuple(
+      name + ' ms' for name, _ in modes)))
+  for rows in sizes:
+    path = os.path.join(tempfile.gettempdir(),
+                        'flask-sample-bench-counts-%d-%s.sqlite' % (
+                            rows, schema_hash()))
+    timings = {}
+    for name, settings in modes:
+      app = make_app(path, **settings)
+      with app.app_context():
+        seed_todos(rows)
+        client = token_client(app)
+        for label, url in urls:
+          timings[label, name] = timeit(lambda: client.get(url))
+    for label, _ in urls:
+      print('%-10d %-12s %12.2f %12.2f %12.2f' % ((rows, label) + tuple(
+          timings[label, name] for name, _ in modes)))
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
@@ -0,0 +1,51 @@
+"""Compare rendering a page of todos with and without ``expand``.
+
+Without expansion a client needs the list request plus one GET per item;
+with ``expand=1`` or ``fields=`` the page arrives in a single request.
+Run with ``python -m benchmarks.expand [rows] [per_page]``.
+"""
+import sys
+from sqlalchemy import event
+from api.models import db
+from .common import make_app, seed_todos, token_client, timeit
+
+
+class QueryCounter:
+  def __init__(self, engine):
+    self.count = 0
+    event.listen(engine, 'before_cursor_execute', self.on_execute)
+
+  def on_execute(self, *args):
+    self.count += 1
+
+
+def render_with_links(client, url):
+  rv, json = client.get(url)
+  for item_url in json['urls']:
+    client.get(item_url.replace('http://localhost', ''))
+
+
+def main(rows=10000, per_page=10):
+  rows, per_page = int(rows), int(per_page)
+  app = make_app()
+  with app.app_context():
+    seed_todos(rows)
+    client = token_client(app)
+    counter = QueryCounter(db.engine)
+    base = '/api/v1.0/todos/?cursor=&per_page=%d' % per_page
+    cases = [
+        ('urls + %d item GETs' % per_page,
+         lambda: render_with_links(client, base)),
+        ('expand=1', lambda: client.get(base + '&expand=1')),
+        ('fields=name', lambda: client.get(base + '&fields=name'))
+    ]
+    print('%-24s %10s %10s' % ('page render', 'median ms', 'queries'))
+    for name, func in cases:
+      counter.count = 0
+      func()
+      queries = counter.count
+      print('%-24s %10.2f %10d' % (name, timeit(func), queries))
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
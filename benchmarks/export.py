@@ -0,0 +1,48 @@
+"""Measure throughput and memory of the streaming NDJSON export.
+
+Exports the first 10k, 100k and all rows of a seeded table and reports
+rows per second and the peak memory allocated while streaming, which
+should stay flat as the export grows. Run with
+``python -m benchmarks.export [rows]``.
+"""
+import sys
+import time
+import tracemalloc
+from .common import make_app, seed_todos, token_client
+
+
+def export(app, headers, count):
+  client = app.test_client()
+  rv = client.get('/api/v1.0/todos/export',
+                  headers=headers, buffered=False)
+  rows = size = 0
+  for chunk in rv.response:
+    rows += 1
+    size += len(chunk)
+    if rows == count:
+      break
+  rv.close()
+  return rows, size
+
+
+def main(rows=1000000):
+  rows = int(rows)
+  app = make_app()
+  with app.app_context():
+    seed_todos(rows)
+    headers = {'Authorization': token_client(app).auth}
+  print('%-12s %10s %12s %12s' % ('rows', 'seconds', 'rows/s', 'peak KiB'))
+  for count in (10000, 100000, rows):
+    count = min(count, rows)
+    tracemalloc.start()
+    start = time.perf_counter()
+    exported, _ = export(app, headers, count)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('%-12d %10.2f %12.0f %12d' % (exported, elapsed, exported / elapsed,
+                                         peak // 1024))
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
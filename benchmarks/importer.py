@@ -0,0 +1,35 @@
+"""Measure importing an NDJSON file with and without a process pool.
+
+Each run starts from an empty database file. Run with
+``python -m benchmarks.importer [rows]``.
+"""
+import os
+import sys
+import tempfile
+from api.importer import import_todos
+from .common import make_app
+
+
+def main(rows=100000):
+  rows = int(rows)
+  fd, source = tempfile.mkstemp(suffix='.ndjson')
+  with os.fdopen(fd, 'w') as f:
+    for i in range(rows):
+      f.write('{"name": "todo %d", "task": "task number %d"}\n' % (i, i))
+  print('%-24s %10s %12s' % ('import %d todos' % rows, 'seconds', 'rows/s'))
+  try:
+    for workers in (0, 2, 4):
+      fd, path = tempfile.mkstemp(suffix='.sqlite')
+      os.close(fd)
+      app = make_app(path)
+      with app.app_context(), open(source) as f:
+        report = import_todos(f, workers=workers)
+      os.remove(path)
+      print('%-24s %10.3f %12.0f' % ('%d workers' % workers, report.seconds,
+                                     report.rate))
+  finally:
+    os.remove(source)
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
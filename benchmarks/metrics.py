@@ -0,0 +1,41 @@
+"""Measure the overhead of request instrumentation.
+
+Times the same endpoints with ``METRICS`` disabled and enabled, plus a
+single histogram observation. Run with ``python -m benchmarks.metrics``.
+"""
+import sys
+from api.metrics import Registry
+from .common import make_app, seed_todos, token_client, timeit
+
+urls = ('/api/v1.0/todos/1', '/api/v1.0/todos/?cursor=&expand=1')
+
+
+def main(requests=500):
+  requests = int(requests)
+  registry = Registry((.001, .01, .1, 1))
+  print('%-32s %10.3f' % ('observe (us)', timeit(lambda: [
+      registry.observe('request_duration_seconds', 0.002, endpoint='x')
+      for _ in range(10000)], 5) / 10))
+  print('%-32s %10s %10s %10s' % ('us/request', 'disabled', 'enabled',
+                                  'overhead'))
+  apps = [make_app(RESPONSE_CACHE=False, METRICS=enabled)
+          for enabled in (False, True)]
+  with apps[0].app_context():
+    seed_todos(1000)
+  for url in urls:
+    row = []
+    for app in apps:
+      with app.app_context():
+        client = token_client(app)
+
+        def run():
+          for _ in range(requests):
+            client.get(url)
+
+        row.append(timeit(run, 5) * 1000 / requests)
+    print('%-32s %10.1f %10.1f %9.1f%%' % (
+        url[9:], row[0], row[1], (row[1] - row[0]) * 100 / row[0]))
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
@@ -0,0 +1,36 @@
+"""Compare offset and cursor pagination of GET /todos/ on a large table.
+
+Run with ``python -m benchmarks.pagination [rows]``; the table is seeded
+once into a SQLite file in the temporary directory and reused.
+"""
+import sys
+from api.models import db, Todo
+from api.helpers import encode_cursor
+from .common import make_app, seed_todos, token_client, timeit
+
+PER_PAGE = 10
+
+
+def main(rows=1000000):
+  rows = int(rows)
+  app = make_app()
+  with app.app_context():
+    seed_todos(rows)
+    client = token_client(app)
+    print('%-28s %10s' % ('request', 'median ms'))
+    for page in (1, 10000):
+      url = '/api/v1.0/todos/?page=%d&per_page=%d' % (page, PER_PAGE)
+      print('%-28s %10.2f' % ('offset page %d' % page,
+                              timeit(lambda: client.get(url))))
+      row = db.session.query(Todo.timestamp, Todo.id).order_by(
+          Todo.timestamp, Todo.id).offset((page - 1) * PER_PAGE - 1).first()
+      cursor = encode_cursor(list(row)) if page > 1 else ''
+      url = '/api/v1.0/todos/?cursor=%s&per_page=%d' % (cursor, PER_PAGE)
+      print('%-28s %10.2f' % ('cursor page %d' % page,
+                              timeit(lambda: client.get(url))))
+      print('%-28s %10.2f' % ('cursor page %d with count' % page,
+                              timeit(lambda: client.get(url + '&count=1'))))
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
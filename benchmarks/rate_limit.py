@@ -0,0 +1,94 @@
+"""Compare the scripted rate limiters with the legacy incr/expireat pipeline.
+
+Run with ``python -m benchmarks.rate_limit [config_module]``. The default
+``test_config`` runs against the in-process Redis stand-in; pass a config
+pointing at a real server to measure network round trips.
+"""
+import bisect
+import sys
+import time
+from api.app import create_app
+from api.rate_limit import RateLimit, algorithms
+from api.store import redis_store
+
+LIMIT = 45
+PER = 15
+
+
+class LegacyRateLimit:
+  """The fixed-window pipeline the scripted limiters replaced."""
+  expiration_window = 10
+
+  def __init__(self, key_prefix, limit, per, now):
+    self.reset = (int(now) // per) * per + per
+    key = key_prefix + str(self.reset)
+    p = redis_store.client.pipeline()
+    p.incr(key)
+    p.expireat(key, self.reset + self.expiration_window)
+    self.current = min(p.execute()[0], limit)
+    self.over_limit = self.current >= limit
+
+
+def make_limiter(algorithm):
+  if algorithm == 'legacy':
+    return lambda key, now: LegacyRateLimit(key, LIMIT, PER, now)
+  return lambda key, now: RateLimit(key, LIMIT, PER, algorithm, now=now)
+
+
+def throughput(limiter, requests=20000, clients=100):
+  start = time.perf_counter()
+  for i in range(requests):
+    limiter('bench/%d/' % (i % clients), time.time())
+  return requests / (time.perf_counter() - start)
+
+
+def worst_window(allowed):
+  """Largest number of allowed requests inside any PER second span."""
+  allowed.sort()
+  return max(bisect.bisect_left(allowed, t + PER) - i
+             for i, t in enumerate(allowed)) if allowed else 0
+
+
+def accuracy(limiter, key, pattern, app):
+  clock = [0.0]
+  app.extensions['redis'].clock = lambda: clock[0]
+  allowed = []
+  for now in pattern:
+    clock[0] = now
+    if not limiter(key, now).over_limit:
+      allowed.append(now)
+  app.extensions['redis'].clock = time.time
+  return worst_window(allowed) / float(LIMIT)
+
+
+def patterns(windows=10, start=1500000000):
+  steady = [start + i * PER / (4.0 * LIMIT)
+            for i in range(4 * LIMIT * windows)]
+  edges = []
+  for w in range(1, windows):
+    boundary = start + w * PER
+    edges += [boundary - 0.5 + i * 0.001 for i in range(LIMIT)]
+    edges += [boundary + 0.5 + i * 0.001 for i in range(LIMIT)]
+  return {'steady': steady, 'edges': edges}
+
+
+def main(config_module='test_config'):
+  app = create_app(config_module)
+  with app.app_context():
+    print('%-15s %12s %10s %10s' % ('algorithm', 'requests/s', 'steady',
+                                    'edges'))
+    for algorithm in ['legacy'] + sorted(algorithms):
+      limiter = make_limiter(algorithm)
+      rate = throughput(limiter)
+      results = {}
+      for name, pattern in patterns().items():
+        key = 'accuracy/%s/%s/' % (algorithm, name)
+        results[name] = accuracy(limiter, key, pattern, app)
+      print('%-15s %12.0f %9.2fx %9.2fx' % (
+          algorithm, rate, results['steady'], results['edges']))
+    print('accuracy is the worst observed requests per %ds span divided by '
+          'the limit (1.00x is exact)' % PER)
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
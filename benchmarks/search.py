@@ -0,0 +1,51 @@
+"""Latency of GET /todos/search with the FTS5 index and with LIKE.
+
+Run with ``python -m benchmarks.search [rows]``. The table is seeded once
+into a SQLite file in the temporary directory and the index is built on
+the first run. Seeded todos are named ``todo <n>`` with the task
+``task number <n>``, so the queries range from a single match to every
+row of the table.
+"""
+import sys
+import time
+from urllib.parse import urlencode
+from sqlalchemy import func
+from api.models import db, Todo
+from api.search import fts, fts5_available, todo_search
+from .common import make_app, seed_todos, token_client, timeit
+
+queries = ('number 123456', '99999', 'todo 5', 'task')
+
+
+def main(rows=1000000):
+  rows = int(rows)
+  if not fts5_available():
+    sys.exit('SQLite was built without FTS5')
+  app = make_app()
+  with app.app_context():
+    seed_todos(rows)
+    client = token_client(app)
+    # seeding bypasses the unit of work, and so the index
+    indexed = todo_search.backend == 'fts5' and db.session.query(
+        func.count()).select_from(fts).scalar() == Todo.query.count()
+    if not indexed:
+      start = time.perf_counter()
+      count = todo_search.rebuild()
+      print('indexed %d todos in %.1f s' % (count,
+                                              time.perf_counter() - start))
+  like = make_app(SEARCH_BACKEND='like')
+  with like.app_context():
+    like_client = token_client(like)
+  print('%-16s %10s %12s %12s' % ('query', 'matches', 'fts5 ms', 'like ms'))
+  for q in queries:
+    url = '/api/v1.0/todos/search?' + urlencode({'q': q, 'per_page': 10})
+    with app.app_context():
+      matches = client.get(url)[1]['meta']['total']
+      fts5 = timeit(lambda: client.get(url), repeat=5)
+    with like.app_context():
+      slow = timeit(lambda: like_client.get(url), repeat=3)
+    print('%-16s %10d %12.2f %12.2f' % (q, matches, fts5, slow))
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
@@ -0,0 +1,61 @@
+"""Compare JSON backends on raw encoding and on each endpoint.
+
+The ``flask`` row encodes with ``flask.jsonify`` as every response did
+before the serializer was pluggable. Endpoints run with the response
+cache disabled so every request is rendered. Run with
+``python -m benchmarks.serializer``.
+"""
+import sys
+from flask import jsonify
+from api.models import Todo
+from api.serializer import backends, serializer
+from .common import make_app, seed_todos, token_client, timeit
+
+endpoints = (
+    ('item', '/api/v1.0/todos/1', {}),
+    ('list', '/api/v1.0/todos/?per_page=10', {}),
+    ('list expand', '/api/v1.0/todos/?expand=1&per_page=10', {}),
+    ('not modified', '/api/v1.0/todos/1', {'If-None-Match': None}),
+)
+
+
+def main(requests=200):
+  requests = int(requests)
+  names = [name for name, (module, _) in backends.items() if module]
+  print('%-16s %10s' % ('us/call', 'flask') +
+        ''.join(' %10s' % name for name in names))
+  apps = dict((name, make_app(JSON_BACKEND=name, RESPONSE_CACHE=False))
+              for name in names)
+
+  with apps[names[0]].test_request_context():
+    seed_todos(1000)
+    page = {'items': [todo.to_json() for todo in Todo.query.limit(100)]}
+  row = []
+  for name in ['flask'] + names:
+    app = apps.get(name, apps[names[0]])
+    with app.test_request_context():
+      encode = (lambda: jsonify(page)) if name == 'flask' else \
+          (lambda: serializer.response(page))
+      row.append(timeit(lambda: [encode() for _ in range(requests)], 5) *
+                 1000 / requests)
+  print('%-16s' % 'encode 100' + ''.join(' %10.1f' % t for t in row))
+
+  for label, url, headers in endpoints:
+    row = []
+    for name in names:
+      app = apps[name]
+      with app.app_context():
+        client = token_client(app)
+        if 'If-None-Match' in headers:
+          headers = {'If-None-Match': client.get(url)[0].headers['ETag']}
+
+        def run():
+          for _ in range(requests):
+            client.get(url, headers=headers)
+
+        row.append(timeit(run, 5) * 1000 / requests)
+    print('%-16s %10s' % (label, '') + ''.join(' %10.1f' % t for t in row))
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
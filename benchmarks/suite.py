@@ -0,0 +1,247 @@
+"""Reproducible load benchmark of every todo endpoint.
+
+For each table size the suite seeds a SQLite file, then drives the list,
+get, create, edit, delete and request-token endpoints through the WSGI
+app in-process and through a local HTTP server, with ``concurrency``
+client threads. Latency percentiles and throughput are reported as JSON
+and can be compared against a stored baseline. Redis-backed features run
+against the in-process stand-in. Run with ``python manage.py bench`` or
+``python -m benchmarks.suite``.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import WSGIRequestHandler, make_server
+from api.bulk import bulk_writer
+from api.models import db, Todo
+from .common import make_app, schema_hash, seed_todos, token_client
+
+modes = ('inprocess', 'server')
+compared = ('p50_ms', 'p95_ms')
+
+
+def percentile(values, p):
+  """Nearest-rank percentile of the sorted ``values``."""
+  if not values:
+    return 0.0
+  return values[max(0, int(math.ceil(p / 100.0 * len(values))) - 1)]
+
+
+class InProcess:
+  """Sends requests straight to the WSGI app with Werkzeug's client."""
+  def __init__(self, app):
+    self.app = app
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    pass
+
+  def client(self):
+    client = self.app.test_client()
+
+    def send(method, url, body, headers):
+      return client.open(url, method=method, data=body,
+                         headers=headers).status_code
+
+    return send
+
+
+class QuietHandler(WSGIRequestHandler):
+  def log_request(self, *args, **kwargs):
+    pass
+
+
+class LocalServer:
+  """Serves the app on a free local port for the duration of a run."""
+  def __init__(self, app):
+    self.app = app
+
+  def __enter__(self):
+    self.server = make_server('127.0.0.1', 0, self.app, threaded=True,
+                              request_handler=QuietHandler)
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def client(self):
+    port = self.server.server_port
+
+    def send(method, url, body, headers):
+      connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+      try:
+        connection.request(method, url, body, headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+      finally:
+        connection.close()
+
+    return send
+
+
+def drive(transport, requests, concurrency):
+  """Send ``requests`` from ``concurrency`` threads and time each one."""
+  def worker(requests):
+    send = transport.client()
+    latencies, errors = [], 0
+    for method, url, body, headers in requests:
+      start = time.perf_counter()
+      try:
+        status = send(method, url, body, headers)
+      except Exception:
+        status = 599
+      latencies.append(time.perf_counter() - start)
+      errors += status >= 400
+    return latencies, errors
+
+  start = time.perf_counter()
+  with ThreadPoolExecutor(concurrency) as pool:
+    results = list(pool.map(worker, [requests[i::concurrency]
+                                     for i in range(concurrency)]))
+  seconds = time.perf_counter() - start
+  latencies = sorted(t for latencies, _ in results for t in latencies)
+  return {
+      'requests': len(latencies),
+      'errors': sum(errors for _, errors in results),
+      'seconds': round(seconds, 4),
+      'throughput': round(len(latencies) / seconds, 1),
+      'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+      'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+      'p99_ms': round(percentile(latencies, 99) * 1000, 3)
+  }
+
+
+def scenarios(rows, count, token, basic, deletable):
+  """Build the requests of every scenario, the same ones on every run."""
+  rng = random.Random(rows)
+  json_headers = dict(token, **{'Content-Type': 'application/json'})
+  body = json.dumps({'name': 'bench', 'task': 'benchmark task'})
+  todo = '/api/v1.0/todos/%d'
+  return [
+      ('list', [('GET', '/api/v1.0/todos/', None, token)] * count),
+      ('list-cursor', [('GET', '/api/v1.0/todos/?cursor=', None, token)] *
+       count),
+      ('get', [('GET', todo % rng.randint(1, rows), None, token)
+               for _ in range(count)]),
+      ('create', [('POST', '/api/v1.0/todos/', body, json_headers)] * count),
+      ('edit', [('PUT', todo % rng.randint(1, rows), body, json_headers)
+                for _ in range(count)]),
+      ('delete', [('DELETE', todo % id, None, token) for id in deletable]),
+      ('request-token', [('GET', '/auth/request-token', None, basic)] *
+       count),
+  ]
+
+
+def run(rows=(1000, ), requests=200, concurrency=4, modes=modes):
+  report = {
+      'meta': {
+          'rows': list(rows),
+          'requests': requests,
+          'concurrency': concurrency,
+          'modes': list(modes),
+          'python': platform.python_version(),
+          'timestamp': int(time.time())
+      },
+      'results': {}
+  }
+  for size in rows:
+    path = os.path.join(tempfile.gettempdir(), 'flask-sample-suite-%s-%d'
+                        '.sqlite' % (schema_hash(), size))
+    app = make_app(path)
+    for mode in modes:
+      with app.test_request_context():
+        # restore the seeded table, earlier runs created and deleted rows
+        extra = [id for id, in db.session.query(Todo.id).filter(
+            Todo.id > size)]
+        bulk_writer.delete(extra)
+        seed_todos(size)
+        token = {'Authorization': token_client(app).auth}
+        basic = {'Authorization': 'Basic ' + b64encode(
+            b'bench:bench').decode('ascii')}
+        deletable = bulk_writer.insert([
+            {'name': 'delete me', 'task': 'sth'}] * requests)
+      transport = (InProcess if mode == 'inprocess' else LocalServer)(app)
+      with transport:
+        for name, requests_ in scenarios(size, requests, token, basic,
+                                         deletable):
+          report['results']['%s/%d/%s' % (mode, size, name)] = drive(
+              transport, requests_, concurrency)
+  return report
+
+
+def compare(report, baseline, threshold=0.2):
+  """Return the results worse than ``baseline`` by more than ``threshold``.
+
+  Latency percentiles regress when they grow, and throughput when it
+  drops, by more than the threshold fraction.
+  """
+  regressions = []
+  for key, result in sorted(report['results'].items()):
+    base = baseline.get('results', {}).get(key)
+    if base is None:
+      continue
+    for metric in compared:
+      if base[metric] and result[metric] > base[metric] * (1 + threshold):
+        regressions.append((key, metric, base[metric], result[metric]))
+    if result['throughput'] < base['throughput'] / (1 + threshold):
+      regressions.append((key, 'throughput', base['throughput'],
+                          result['throughput']))
+  return regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  add_arguments(parser.add_argument)
+  args = parser.parse_args(argv)
+  return bench(**vars(args))
+
+
+def add_arguments(add):
+  add('--rows', default='1000', help='comma separated table sizes')
+  add('--requests', type=int, default=200, help='requests per scenario')
+  add('--concurrency', type=int, default=4, help='client threads')
+  add('--mode', choices=modes + ('both', ), default='both')
+  add('--output', help='write the JSON report to this file')
+  add('--baseline', help='compare against this JSON report')
+  add('--threshold', type=float, default=0.2,
+      help='allowed regression as a fraction of the baseline')
+
+
+def bench(rows, requests, concurrency, mode, output=None, baseline=None,
+          threshold=0.2):
+  """Run the suite and return 1 on regressions against ``baseline``."""
+  report = run([int(size) for size in rows.split(',')], requests,
+               concurrency, modes if mode == 'both' else (mode, ))
+  text = json.dumps(report, indent=2, sort_keys=True)
+  if output:
+    with open(output, 'w') as f:
+      f.write(text + '\n')
+  else:
+    print(text)
+  if baseline:
+    with open(baseline) as f:
+      regressions = compare(report, json.load(f), threshold)
+    for key, metric, before, after in regressions:
+      sys.stderr.write('regression: %s %s %s -> %s\n' % (key, metric, before,
+                                                         after))
+    return 1 if regressions else 0
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,42 @@
+"""Measure building item and page links with url_for and with templates.
+
+Times the URLs of a full page built both ways, then the list endpoint
+with ``per_page`` at its maximum. Run with ``python -m benchmarks.urls``.
+"""
+import sys
+from flask import url_for
+from api.helpers import url_template
+from api.models import Todo
+from .common import make_app, seed_todos, token_client, timeit
+
+
+def main(requests=200):
+  requests = int(requests)
+  app = make_app(RESPONSE_CACHE=False)
+  with app.test_request_context('/api/v1.0/todos/'):
+    seed_todos(1000)
+    per_page = 10 * len(Todo.json_fields)
+    ids = [id for id, in Todo.query.with_entities(Todo.id).limit(per_page)]
+    print('%-32s %12s' % ('%d links' % per_page, 'us/page'))
+    for name, build in (
+        ('url_for', lambda: [url_for('api.get_todo', id=id, _external=True)
+                             for id in ids]),
+        ('template', lambda: [url_template('api.get_todo', 'id') % id
+                              for id in ids])):
+      print('%-32s %12.1f' % (name, timeit(
+          lambda: [build() for _ in range(requests)], 5) * 1000 / requests))
+
+  with app.app_context():
+    client = token_client(app)
+    url = '/api/v1.0/todos/?cursor=&fields=url&per_page=%d' % per_page
+
+    def run():
+      for _ in range(requests):
+        client.get(url)
+
+    print('%-32s %12.1f' % ('GET ' + url[9:], timeit(run, 5) * 1000 /
+                            requests))
+
+
+if __name__ == '__main__':
+  main(*sys.argv[1:])
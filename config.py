@@ -4,5 +4,71 @@ SQLALCHEMY_DATABASE_URI = 'sqlite:///api.sqlite'
 USE_TOKEN_AUTH = False
 USE_RATE_LIMITS = True
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+SQLALCHEMY_POOL_SIZE = 10
+SQLALCHEMY_MAX_OVERFLOW = 20
+SQLALCHEMY_POOL_TIMEOUT = 5
+SQLALCHEMY_POOL_RECYCLE = 1800
+SQLALCHEMY_POOL_PRE_PING = True
+SQLALCHEMY_REPLICAS = []
+SQLALCHEMY_REPLICA_STICKY = 5
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 BROKER_URL = 'redis://localhost:6379/0'
+REDIS_HOST = 'localhost'
+REDIS_PORT = 6379
+REDIS_DB = 0
+REDIS_MAX_CONNECTIONS = 50
+REDIS_POOL_TIMEOUT = 5
+REDIS_SOCKET_TIMEOUT = 1
+REDIS_SOCKET_CONNECT_TIMEOUT = 1
+RATE_LIMIT_ALGORITHM = 'fixed-window'
+RATE_LIMIT_LOCAL_TIER = False
+RATE_LIMIT_LOCAL_SIZE = 1024
+HIT_COUNT_BUFFERED = False
+HIT_COUNT_FLUSH_INTERVAL = 5.0
+HIT_COUNT_FLUSH_SIZE = 1000
+RESPONSE_CACHE = True
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+RESPONSE_CACHE_REDIS = False
+RESPONSE_CACHE_TTL = 300
+AUTH_CACHE_TTL = 60
+AUTH_CACHE_SIZE = 4096
+STATELESS_TOKENS = True
+TOKEN_GENERATION_TTL = 5
+BULK_MAX_ITEMS = 10000
+BULK_CHUNK_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+JSON_BACKEND = 'auto'
+JSON_DATETIME_FORMAT = 'http'
+METRICS = False
+PROFILER = False
+PROFILER_SAMPLE_RATE = 0.0
+PROFILER_TOKEN = None
+PROFILER_INTERVAL = 0.005
+PROFILER_DIR = None
+PROFILER_RING_SIZE = 100
+ASGI_WORKERS = 32
+WRITE_BEHIND = False
+WRITE_BEHIND_SHARDS = 8
+WRITE_BEHIND_BATCH_SIZE = 500
+WRITE_BEHIND_LOCK_TIMEOUT = 60
+WRITE_BEHIND_STATUS_TTL = 3600
+SEARCH_BACKEND = 'auto'
+SEARCH_NAME_WEIGHT = 10.0
+SEARCH_MAX_WORDS = 16
+ROW_COUNTS = True
+ROW_COUNTS_APPROXIMATE = False
+ROW_COUNTS_APPROXIMATE_LIMIT = 1000
+COMPRESS = True
+COMPRESS_MIMETYPES = ['application/json']
+COMPRESS_MIN_SIZE = 500
+COMPRESS_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 5
+COMPRESS_CACHE_SIZE = 1024
+COMPRESS_CACHE_MAX_BYTES = 8 * 1024 * 1024
+CELERYBEAT_SCHEDULE = {
+    'reconcile-counts': {
+        'task': 'api.tasks.reconcile_counts',
+        'schedule': 3600.0
+    }
+}
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
-from flask_script import Manager
+import sys
+from flask_script import Command, Manager, Option
 from api.app import create_app
 from api.models import db, User
 
@@ -30,6 +31,98 @@ def adduser(username):
   print('User {0} was registered successfully.'.format(username))
 
 
+@manager.command
+def hottest(count=10):
+  """List the most requested todo paths.
+
+  Buffered hits live in the web workers, so up to
+  ``HIT_COUNT_FLUSH_INTERVAL`` seconds of them may not be counted yet.
+  """
+  from api.hit_counter import hit_counter
+  for path, hits in hit_counter.top(int(count)):
+    print('{0:>10} {1}'.format(hits, path))
+
+
+@manager.command
+def hotspots(count=20):
+  """List the hottest api functions in the saved request profiles."""
+  from api.profiler import profiler, summarize
+  paths = profiler.ring.files()
+  rows = summarize(paths)
+  total = sum(own for _, own, _ in rows) or 1
+  print('{0} profiles, {1} samples in the api package'.format(
+      len(paths), sum(own for _, own, _ in rows)))
+  print('{0:>8} {1:>8} {2:>7}  {3}'.format('own', 'total', 'own%', 'function'))
+  for function, own, cumulative in rows[:int(count)]:
+    print('{0:>8} {1:>8} {2:>6.1f}%  {3}'.format(own, cumulative,
+                                                 100.0 * own / total,
+                                                 function))
+
+
+@manager.option('--host', default='127.0.0.1')
+@manager.option('--port', default=5000, type=int)
+def runasgi(host, port):
+  """Serve the API through the ASGI app with uvicorn."""
+  try:
+    import uvicorn
+  except ImportError:
+    sys.exit('Error: the ASGI mode needs uvicorn (pip install uvicorn).')
+  uvicorn.run('api.asgi:create_asgi_app', factory=True, host=host, port=port)
+
+
+@manager.command
+def reindex():
+  """Rebuild the full-text search index of the todos."""
+  from api.search import todo_search
+  count = todo_search.rebuild()
+  if todo_search.backend == 'fts5':
+    print('Indexed {0} todos.'.format(count))
+  else:
+    print('Search uses LIKE queries, there is no index to rebuild.')
+
+
+class Import(Command):
+  """Import todos from an NDJSON or CSV file."""
+  option_list = (
+      Option('path'),
+      Option('--format', dest='format', choices=('ndjson', 'csv')),
+      Option('--batch-size', dest='batch_size', type=int),
+      Option('--workers', dest='workers', type=int, default=0),
+  )
+
+  def run(self, path, format, batch_size, workers):
+    from api.importer import import_todos
+    db.create_all()
+    format = format or ('csv' if path.endswith('.csv') else 'ndjson')
+    with open(path, newline='', encoding='utf-8') as f:
+      report = import_todos(f, format, batch_size, workers)
+    for error in report.errors:
+      print('line {0}: {1}'.format(error['line'], error['message']))
+    print('Imported {0} todos in {1:.2f}s ({2:.0f} rows/s), '
+          'rejected {3}.'.format(report.rows, report.seconds, report.rate,
+                                 report.rejected))
+
+
+manager.add_command('import', Import())
+
+
+class Bench(Command):
+  """Benchmark every endpoint and report latency percentiles as JSON."""
+  def get_options(self):
+    from benchmarks.suite import add_arguments
+    options = []
+    add_arguments(lambda *args, **kwargs: options.append(
+        Option(*args, **kwargs)))
+    return options
+
+  def run(self, **options):
+    from benchmarks.suite import bench
+    sys.exit(bench(**options))
+
+
+manager.add_command('bench', Bench())
+
+
 @manager.command
 def test():
   from subprocess import call
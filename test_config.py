@@ -6,3 +6,5 @@ USE_RATE_LIMITS = False
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 CELERY_RESULT_BACKEND = 'db+sqlite:///results.sqlite'
 BROKER_URL = 'memory://'
+REDIS_MAX_CONNECTIONS = 10
+RESPONSE_CACHE = True
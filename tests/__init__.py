@@ -1 +1,9 @@
+import test_config
+from api.app import create_app
 
+
+def make_app(**overrides):
+  """Create an app from ``test_config`` with some settings overridden."""
+  config = dict((name, getattr(test_config, name))
+                for name in dir(test_config) if name.isupper())
+  return create_app(type('Config', (), dict(config, **overrides)))
@@ -0,0 +1,182 @@
+import asyncio
+import unittest
+from base64 import b64encode
+from json import dumps, loads
+from api.asgi import RequestBody, create_asgi_app
+from api.models import db, User
+
+
+class TestASGI(unittest.TestCase):
+  def setUp(self):
+    self.asgi = create_asgi_app('test_config')
+    self.app = self.asgi.app
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.drop_all()
+    db.create_all()
+    u = User(username='mamad', password='jafar')
+    db.session.add(u)
+    db.session.commit()
+    self.auth = b'Basic ' + b64encode((u.generate_auth_token() + ':').encode())
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+    self.asgi.executor.shutdown()
+
+  def request(self, method, path, body=b'', query=b'', headers=()):
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'query_string': query,
+        'headers': [(b'host', b'localhost'), (b'authorization', self.auth),
+                    (b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode())] +
+        list(headers),
+        'server': ('localhost', 80),
+        'client': ('127.0.0.1', 1234)
+    }
+    # deliver the body in two parts to exercise ``more_body``
+    incoming = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+                {'type': 'http.request', 'body': body[3:]}]
+    sent = []
+
+    async def receive():
+      if incoming:
+        return incoming.pop(0)
+      # the client stays connected until the response is sent
+      await asyncio.get_running_loop().create_future()
+
+    async def send(message):
+      sent.append(message)
+
+    asyncio.run(self.asgi(scope, receive, send))
+    self.assertEqual(sent[0]['type'], 'http.response.start')
+    self.assertFalse(sent[-1].get('more_body'))
+    return (sent[0]['status'], dict(sent[0]['headers']),
+            b''.join(m.get('body', b'') for m in sent[1:]))
+
+  def test_crud(self):
+    status, headers, body = self.request(
+        'POST', '/api/v1.0/todos/',
+        dumps({'name': 'asgi', 'task': 'serve it'}).encode())
+    self.assertEqual(status, 201)
+    self.assertTrue(headers[b'location'].endswith(b'/api/v1.0/todos/1'))
+
+    status, headers, body = self.request('GET', '/api/v1.0/todos/',
+                                         query=b'per_page=5')
+    self.assertEqual(status, 200)
+    self.assertEqual(loads(body.decode())['urls'],
+                     ['http://localhost/api/v1.0/todos/1'])
+
+    status, headers, _ = self.request('GET', '/api/v1.0/todos/1')
+    self.assertEqual(status, 200)
+    status, _, body = self.request(
+        'GET', '/api/v1.0/todos/1',
+        headers=[(b'if-none-match', headers[b'etag'])])
+    self.assertEqual(status, 304)
+    self.assertEqual(body, b'')
+
+  def test_auth_required(self):
+    self.auth = b'Basic ' + b64encode(b'mamad:wrong')
+    status, _, _ = self.request('GET', '/api/v1.0/todos/')
+    self.assertEqual(status, 401)
+
+  def test_streaming_export(self):
+    for i in range(5):
+      self.request('POST', '/api/v1.0/todos/',
+                   dumps({'name': 't%d' % i, 'task': 'x'}).encode())
+    self.app.config['EXPORT_BATCH_SIZE'] = 2
+    status, headers, body = self.request('GET', '/api/v1.0/todos/export')
+    self.assertEqual(status, 200)
+    self.assertEqual(headers[b'content-type'], b'application/x-ndjson')
+    lines = body.splitlines()
+    self.assertEqual([loads(line.decode())['name'] for line in lines],
+                     ['t0', 't1', 't2', 't3', 't4'])
+
+  def test_streaming_import(self):
+    lines = [dumps({'name': 't%d' % i, 'task': 'x'}).encode() + b'\n'
+             for i in range(30)]
+    incoming = [{'type': 'http.request', 'body': line, 'more_body': True}
+                for line in lines] + [{'type': 'http.request'}]
+    reads = []
+    fill = RequestBody.fill
+
+    def counting_fill(body):
+      reads.append(None)
+      return fill(body)
+
+    ahead = []
+
+    async def receive():
+      if incoming:
+        ahead.append(len(lines) + 1 - len(incoming) - len(reads))
+        return incoming.pop(0)
+      await asyncio.get_running_loop().create_future()
+
+    sent = []
+
+    async def send(message):
+      sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST',
+             'path': '/api/v1.0/todos/import', 'headers': [
+                 (b'authorization', self.auth),
+                 (b'content-type', b'application/x-ndjson')]}
+    RequestBody.fill = counting_fill
+    try:
+      asyncio.run(self.asgi(scope, receive, send))
+    finally:
+      RequestBody.fill = fill
+    self.assertEqual(sent[0]['status'], 200)
+    self.assertEqual(loads(b''.join(m.get('body', b'')
+                                    for m in sent[1:]).decode())['rows'], 30)
+    # the body is read as it arrives, never more than a queue ahead
+    self.assertLessEqual(max(ahead), self.asgi.buffer + 2)
+
+  def test_disconnect(self):
+    for i in range(50):
+      self.request('POST', '/api/v1.0/todos/',
+                    dumps({'name': 't%d' % i, 'task': 'x'}).encode())
+    self.app.config['EXPORT_BATCH_SIZE'] = 1
+    sent = []
+    gone = None
+
+    async def receive():
+      nonlocal gone
+      if gone is None:
+        gone = asyncio.get_running_loop().create_future()
+        return {'type': 'http.request'}
+      await gone
+      return {'type': 'http.disconnect'}
+
+    async def send(message):
+      sent.append(message)
+      if len(sent) == 3 and gone is not None:
+        gone.set_result(None)
+
+    scope = {'type': 'http', 'method': 'GET',
+             'path': '/api/v1.0/todos/export',
+             'headers': [(b'authorization', self.auth)]}
+    asyncio.run(self.asgi(scope, receive, send))
+    # the export stopped soon after the client left
+    self.assertLess(len(sent), 3 + self.asgi.buffer + 2)
+    self.assertTrue(sent[-1].get('more_body'))
+
+  def test_lifespan(self):
+    incoming = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+      return incoming.pop(0)
+
+    async def send(message):
+      sent.append(message['type'])
+
+    asyncio.run(self.asgi({'type': 'lifespan'}, receive, send))
+    self.assertEqual(sent, ['lifespan.startup.complete',
+                            'lifespan.shutdown.complete'])
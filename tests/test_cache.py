@@ -0,0 +1,118 @@
+import unittest
+from sqlalchemy import event
+from .test_client import TestClient
+from api.app import create_app
+from api.cache import CacheEntry, LRUCache, response_cache
+from api.models import db, User
+
+
+class TestResponseCache(unittest.TestCase):
+  default_username = 'mamad'
+  default_password = 'jafar'
+
+  def setUp(self):
+    self.app = create_app('test_config')
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.drop_all()
+    db.create_all()
+    u = User(username=self.default_username, password=self.default_password)
+    db.session.add(u)
+    db.session.commit()
+    self.client = TestClient(self.app, u.generate_auth_token(), '')
+    self.queries = []
+    event.listen(db.engine, 'before_cursor_execute', self.on_execute)
+
+  def tearDown(self):
+    event.remove(db.engine, 'before_cursor_execute', self.on_execute)
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+  def on_execute(self, conn, cursor, statement, *args):
+    self.queries.append(statement)
+
+  def todo_queries(self):
+    queries = [q for q in self.queries if 'FROM todos' in q]
+    self.queries = []
+    return queries
+
+  def test_lru(self):
+    cache = LRUCache(max_entries=2, max_bytes=10)
+    cache.set('a', CacheEntry(200, [], b'1234', '"a"', ['x']))
+    cache.set('b', CacheEntry(200, [], b'1234', '"b"', ['y']))
+    self.assertTrue(cache.get('a') is not None)
+    cache.set('c', CacheEntry(200, [], b'1234', '"c"', ['y']))
+    self.assertTrue(cache.get('b') is None)
+    self.assertEqual(cache.stats()['bytes'], 8)
+    cache.set('d', CacheEntry(200, [], b'1234567', '"d"', ['y']))
+    self.assertEqual(list(cache.entries), ['d'])
+    cache.invalidate(['y'])
+    stats = cache.stats()
+    self.assertEqual(stats['entries'], 0)
+    self.assertEqual(stats['evictions'], 3)
+    self.assertEqual(stats['invalidations'], 1)
+    self.assertEqual(stats['hit_ratio'], 0.5)
+
+  def test_entry_roundtrip(self):
+    entry = CacheEntry(200, [('ETag', '"x"')], b'{\n}', '"x"', ['todo:1'])
+    copy = CacheEntry.loads(entry.dumps())
+    self.assertEqual(copy.headers, entry.headers)
+    self.assertEqual(copy.body, entry.body)
+    self.assertEqual(copy.tags, entry.tags)
+
+  def exercise(self):
+    rv, _ = self.client.post('/api/v1.0/todos/',
+                             data={'name': 'one', 'task': 'sth'})
+    one_url = rv.headers['Location']
+    rv, json = self.client.get(one_url)
+    etag = rv.headers['ETag']
+    self.todo_queries()
+
+    # served from the cache without touching the database
+    rv, cached = self.client.get(one_url)
+    self.assertEqual(cached, json)
+    self.assertEqual(rv.headers['ETag'], etag)
+    self.assertEqual(self.todo_queries(), [])
+    rv, _ = self.client.get(one_url, headers={'If-None-Match': etag})
+    self.assertTrue(rv.status_code == 304)
+
+    rv, json = self.client.get('/api/v1.0/todos/?expand=1')
+    self.todo_queries()
+    rv, _ = self.client.get('/api/v1.0/todos/?expand=1')
+    self.assertEqual(self.todo_queries(), [])
+
+    # writes invalidate the item and the list pages that show it
+    rv, _ = self.client.put(one_url, data={'name': 'one', 'task': 'other'})
+    self.todo_queries()
+    rv, json = self.client.get(one_url)
+    self.assertEqual(json['task'], 'other')
+    rv, json = self.client.get('/api/v1.0/todos/?expand=1')
+    self.assertEqual([item['task'] for item in json['items']
+                      if item['url'] == one_url], ['other'])
+    self.assertTrue(self.todo_queries())
+    self.client.delete(one_url)
+    rv, json = self.client.get('/api/v1.0/todos/?expand=1')
+    self.assertFalse(one_url in json['urls'])
+    rv, _ = self.client.get(one_url)
+    self.assertTrue(rv.status_code == 404)
+
+  def test_local(self):
+    self.exercise()
+    stats = response_cache.stats()
+    self.assertEqual(stats['hits'], 3)
+    self.assertFalse('redis_hits' in stats)
+
+  def test_redis(self):
+    self.app.config['RESPONSE_CACHE_REDIS'] = True
+    rv, _ = self.client.post('/api/v1.0/todos/',
+                             data={'name': 'one', 'task': 'sth'})
+    one_url = rv.headers['Location']
+    rv, json = self.client.get(one_url)
+    self.app.extensions['response_cache'] = LRUCache()
+    self.todo_queries()
+    rv, cached = self.client.get(one_url)
+    self.assertEqual(cached, json)
+    self.assertEqual(self.todo_queries(), [])
+    self.assertEqual(response_cache.stats()['redis_hits'], 1)
+    self.exercise()
@@ -0,0 +1,123 @@
+import gzip
+import json
+import unittest
+from base64 import b64encode
+from . import make_app
+from api.compression import brotli, compressor
+from api.models import db, Todo, User
+
+
+class TestCompression(unittest.TestCase):
+  def setUp(self):
+    self.app = make_app(COMPRESS=True, COMPRESS_MIN_SIZE=200,
+                        RESPONSE_CACHE=True)
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.drop_all()
+    db.create_all()
+    u = User(username='mamad', password='jafar')
+    db.session.add(u)
+    for i in range(12):
+      db.session.add(Todo(name='todo %d' % i, task='something to do'))
+    db.session.commit()
+    self.auth = 'Basic ' + b64encode(
+        (u.generate_auth_token() + ':').encode('utf-8')).decode('utf-8')
+    self.client = self.app.test_client()
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+  def get(self, url, **headers):
+    headers = dict(headers, Authorization=self.auth)
+    return self.client.get(url, headers=[(name.replace('_', '-'), value)
+                                         for name, value in headers.items()])
+
+  def test_negotiation(self):
+    url = '/api/v1.0/todos/?expand=1'
+    plain = self.get(url)
+    self.assertNotIn('Content-Encoding', plain.headers)
+    self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+    rv = self.get(url, Accept_Encoding='gzip, deflate')
+    self.assertEqual(rv.headers['Content-Encoding'], 'gzip')
+    self.assertIn('Accept-Encoding', rv.headers['Vary'])
+    self.assertEqual(int(rv.headers['Content-Length']), len(rv.data))
+    self.assertLess(len(rv.data), len(plain.data))
+    self.assertEqual(gzip.decompress(rv.data), plain.data)
+    self.assertEqual(rv.headers['ETag'],
+                     plain.headers['ETag'][:-1] + '-gzip"')
+
+    rv = self.get(url, Accept_Encoding='gzip;q=0, identity')
+    self.assertNotIn('Content-Encoding', rv.headers)
+    if brotli is None:
+      rv = self.get(url, Accept_Encoding='br')
+      self.assertNotIn('Content-Encoding', rv.headers)
+
+    # small bodies are not worth compressing
+    rv = self.get('/api/v1.0/todos/1', Accept_Encoding='gzip')
+    self.assertNotIn('Content-Encoding', rv.headers)
+    self.assertLess(len(rv.data), 200)
+
+    # and neither are bodies of other types
+    self.app.config['COMPRESS_MIMETYPES'] = ['text/html']
+    rv = self.get(url, Accept_Encoding='gzip')
+    self.assertNotIn('Content-Encoding', rv.headers)
+    self.assertNotIn('Vary', rv.headers)
+
+  @unittest.skipIf(brotli is None, 'brotli is not installed')
+  def test_brotli(self):
+    url = '/api/v1.0/todos/?expand=1'
+    rv = self.get(url, Accept_Encoding='gzip, br')
+    self.assertEqual(rv.headers['Content-Encoding'], 'br')
+    self.assertTrue(rv.headers['ETag'].endswith('-br"'))
+    self.assertEqual(json.loads(brotli.decompress(rv.data))['meta']['total'],
+                     12)
+    rv = self.get(url, Accept_Encoding='gzip, br;q=0.5')
+    self.assertEqual(rv.headers['Content-Encoding'], 'gzip')
+
+  def test_conditional(self):
+    url = '/api/v1.0/todos/?expand=1'
+    rv = self.get(url, Accept_Encoding='gzip')
+    etag = rv.headers['ETag']
+    rv = self.get(url, Accept_Encoding='gzip', If_None_Match=etag)
+    self.assertEqual(rv.status_code, 304)
+    self.assertIn('Accept-Encoding', rv.headers['Vary'])
+    # the tag of either representation validates the other
+    rv = self.get(url, If_None_Match=etag)
+    self.assertEqual(rv.status_code, 304)
+    self.client.put('/api/v1.0/todos/1', headers={
+        'Authorization': self.auth, 'Content-Type': 'application/json'},
+        data=json.dumps({'name': 'changed', 'task': 'sth'}))
+    rv = self.get(url, Accept_Encoding='gzip', If_None_Match=etag)
+    self.assertEqual(rv.status_code, 200)
+    self.assertNotEqual(rv.headers['ETag'], etag)
+
+  def test_compressed_once(self):
+    calls = []
+    compress = compressor.compress
+
+    def counting(data, encoding):
+      calls.append(encoding)
+      return compress(data, encoding)
+
+    compressor.compress = counting
+    try:
+      url = '/api/v1.0/todos/?expand=1'
+      bodies = set(self.get(url, Accept_Encoding='gzip').data
+                   for _ in range(3))
+      self.assertEqual(len(bodies), 1)
+      self.assertEqual(calls, ['gzip'])
+      self.assertEqual(compressor.stats()['hits'], 2)
+      self.get(url + '&per_page=5', Accept_Encoding='gzip')
+      self.assertEqual(calls, ['gzip', 'gzip'])
+    finally:
+      compressor.compress = compress
+
+  def test_errors(self):
+    rv = self.get('/api/v1.0/todos/?fields=' + ','.join(
+        'unknown%d' % i for i in range(40)), Accept_Encoding='gzip')
+    self.assertEqual(rv.status_code, 400)
+    self.assertEqual(rv.headers['Content-Encoding'], 'gzip')
+    self.assertIn('unknown39', json.loads(gzip.decompress(rv.data))['message'])
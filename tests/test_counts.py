@@ -0,0 +1,110 @@
+import unittest
+from sqlalchemy import event
+from . import make_app
+from .test_client import TestClient
+from api.bulk import bulk_writer, todos
+from api.counts import counters, row_counts
+from api.models import db, Todo, User
+from api.tasks import reconcile_counts
+
+
+class CountsCase(unittest.TestCase):
+  settings = {}
+
+  def setUp(self):
+    self.app = make_app(**self.settings)
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.drop_all()
+    db.create_all()
+    u = User(username='mamad', password='jafar')
+    db.session.add(u)
+    db.session.commit()
+    self.client = TestClient(self.app, u.generate_auth_token(), '')
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+  def get(self, url):
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+      statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+      rv, json = self.client.get(url)
+    finally:
+      event.remove(db.engine, 'before_cursor_execute', listener)
+    self.assertEqual(rv.status_code, 200)
+    counted = [s for s in statements if 'count(' in s and 'FROM todos' in s]
+    return json['meta'], counted
+
+
+class TestRowCounts(CountsCase):
+  def test_maintained(self):
+    for i in range(12):
+      self.client.post('/api/v1.0/todos/', data={'name': 'todo %d' % i,
+                                                 'task': 'sth'})
+    ids = bulk_writer.insert([{'name': 'bulk', 'task': 'sth'}] * 3)
+    bulk_writer.delete(ids[:2])
+    self.client.delete('/api/v1.0/todos/1')
+    db.session.add(Todo(name='rolled back', task='sth'))
+    db.session.flush()
+    db.session.rollback()
+    self.assertEqual(row_counts.get(todos), 12)
+    self.assertEqual(Todo.query.count(), 12)
+
+    # the unfiltered list reads the counter, filtered ones still count
+    meta, counted = self.get('/api/v1.0/todos/?page=2')
+    self.assertEqual((meta['total'], meta['pages']), (12, 2))
+    self.assertEqual(counted, [])
+    meta, counted = self.get('/api/v1.0/todos/?cursor=&count=1')
+    self.assertEqual((meta['total'], counted), (12, []))
+    meta, counted = self.get('/api/v1.0/todos/?per_page=2&after_id=3')
+    self.assertEqual(meta['total'], 10)
+    self.assertEqual(len(counted), 1)
+    self.assertNotIn('approximate', meta)
+
+  def test_reconcile(self):
+    for i in range(3):
+      db.session.add(Todo(name='todo %d' % i, task='sth'))
+    db.session.commit()
+    db.session.execute(todos.insert().values(name='raw', task='sth'))
+    db.session.commit()
+    self.assertEqual(row_counts.get(todos), 3)
+    self.assertEqual(reconcile_counts.apply().get(), {'todos': 1})
+    self.assertEqual(row_counts.get(todos), 4)
+    self.assertEqual(row_counts.reconcile(), {'todos': 0})
+
+    # without a counter the total is counted until one is reconciled
+    db.session.execute(counters.delete())
+    db.session.commit()
+    meta, counted = self.get('/api/v1.0/todos/?per_page=2')
+    self.assertEqual((meta['total'], len(counted)), (4, 1))
+    self.assertEqual(row_counts.reconcile(), {'todos': 4})
+    self.assertEqual(row_counts.get(todos), 4)
+
+
+class TestApproximateCounts(CountsCase):
+  settings = {'ROW_COUNTS_APPROXIMATE': True,
+              'ROW_COUNTS_APPROXIMATE_LIMIT': 5}
+
+  def test_approximate(self):
+    bulk_writer.insert([{'name': 'same', 'task': 'sth'}] * 30)
+    meta, _ = self.get('/api/v1.0/todos/?name=same')
+    self.assertEqual((meta['total'], meta['approximate']), (15, True))
+    self.assertIsNotNone(meta['next'])
+    meta, _ = self.get('/api/v1.0/todos/?name=same&page=2')
+    self.assertEqual(meta['total'], 25)
+    meta, _ = self.get('/api/v1.0/todos/?name=same&page=3')
+    self.assertEqual(meta['total'], 30)
+    self.assertNotIn('approximate', meta)
+    self.assertIsNone(meta['next'])
+
+    # the unfiltered total is always exact
+    meta, _ = self.get('/api/v1.0/todos/')
+    self.assertEqual(meta['total'], 30)
+    self.assertNotIn('approximate', meta)
@@ -0,0 +1,106 @@
+import unittest
+from . import make_app
+from .test_client import TestClient
+from api.cache import response_cache
+from api.database import sticky_key
+from api.models import db, Todo, User
+from api.store import redis_store
+
+
+class TestReplicaRouting(unittest.TestCase):
+  def setUp(self):
+    # each in-memory database is private to its engine, so the replicas
+    # only hold what the tests copy to them
+    self.app = make_app(RESPONSE_CACHE=False, SQLALCHEMY_POOL_PRE_PING=True,
+                        SQLALCHEMY_REPLICAS=['sqlite://', 'sqlite://'])
+    with self.app.app_context():
+      db.create_all()
+      u = User(username='mamad', password='jafar')
+      v = User(username='other', password='secret')
+      db.session.add_all([u, v])
+      db.session.commit()
+      for bind in self.app.config['SQLALCHEMY_REPLICA_BINDS']:
+        engine = db.get_engine(bind=bind)
+        db.metadata.create_all(engine)
+        engine.execute(Todo.__table__.insert(),
+                       name='replicated', task='on the replica')
+      self.client = TestClient(self.app, u.generate_auth_token(), '')
+      self.other = TestClient(self.app, v.generate_auth_token(), '')
+
+  def tearDown(self):
+    with self.app.app_context():
+      db.drop_all()
+      redis_store.client.flushdb()
+
+  def test_reads_go_to_replica(self):
+    rv, json = self.client.get('/api/v1.0/todos/1')
+    self.assertEqual(rv.status_code, 200)
+    self.assertEqual(json['name'], 'replicated')
+    rv, json = self.client.get('/api/v1.0/todos/')
+    self.assertEqual(len(json['urls']), 1)
+    with self.app.app_context():
+      self.assertEqual(Todo.query.count(), 0)
+
+  def test_read_your_writes(self):
+    rv, _ = self.client.post('/api/v1.0/todos/',
+                             data={'name': 'mine', 'task': 'on the primary'})
+    self.assertEqual(rv.status_code, 201)
+    with self.app.app_context():
+      self.assertEqual(Todo.query.get(1).name, 'mine')
+
+    # the writer reads from the primary for a while, other clients do not
+    rv, json = self.client.get('/api/v1.0/todos/1')
+    self.assertEqual(json['name'], 'mine')
+    rv, json = self.other.get('/api/v1.0/todos/1')
+    self.assertEqual(json['name'], 'replicated')
+
+    with self.app.app_context():
+      client = redis_store.client
+      keys = [key for key in client.data if key.startswith(sticky_key)]
+      self.assertEqual(len(keys), 1)
+      self.assertEqual(client.ttl(keys[0]),
+                       self.app.config['SQLALCHEMY_REPLICA_STICKY'])
+      client.delete(*keys)
+    rv, json = self.client.get('/api/v1.0/todos/1')
+    self.assertEqual(json['name'], 'replicated')
+
+  def test_lagging_replica(self):
+    self.app.config['RESPONSE_CACHE'] = True
+    rv, _ = self.client.post('/api/v1.0/todos/',
+                             data={'name': 'mine', 'task': 'on the primary'})
+    self.assertEqual(rv.status_code, 201)
+
+    # the replicas have not caught up, what they render is not cached and
+    # not tagged with the generations the write moved on
+    stale = {}
+    for url in ('/api/v1.0/todos/1', '/api/v1.0/todos/?expand=1'):
+      rv, json = self.other.get(url)
+      self.assertIn('replicated', str(json))
+      stale[url] = rv.headers['ETag']
+    with self.app.app_context():
+      self.assertEqual(response_cache.stats()['entries'], 0)
+      for bind in self.app.config['SQLALCHEMY_REPLICA_BINDS']:
+        db.get_engine(bind=bind).execute(
+            Todo.__table__.update().values(name='mine',
+                                           task='on the primary'))
+    for url, etag in stale.items():
+      rv, json = self.other.get(url, headers={'If-None-Match': etag})
+      self.assertEqual(rv.status_code, 200)
+      self.assertNotIn('replicated', str(json))
+
+    # a render from the primary is cached and serves the other clients
+    rv, json = self.client.get('/api/v1.0/todos/1')
+    with self.app.app_context():
+      self.assertEqual(response_cache.stats()['entries'], 1)
+    rv, _ = self.other.get('/api/v1.0/todos/1',
+                           headers={'If-None-Match': rv.headers['ETag']})
+    self.assertEqual(rv.status_code, 304)
+
+  def test_pool_stats(self):
+    self.client.get('/api/v1.0/todos/1')
+    with self.app.app_context():
+      self.assertTrue(db.engine.pool._pre_ping)
+      stats = db.pool_stats()
+    self.assertEqual(sorted(stats), ['primary', 'replica-0', 'replica-1'])
+    self.assertEqual(stats['primary']['in_use'], 0)
+    self.assertTrue(sum(s['checkouts'] for s in stats.values()) >= 3)
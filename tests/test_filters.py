@@ -0,0 +1,122 @@
+import itertools
+import unittest
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+from sqlalchemy import event
+from .test_client import TestClient
+from api.app import create_app
+from api.errors import ValidationError
+from api.filters import todo_filters
+from api.models import db, Todo, User
+
+
+class TestFilters(unittest.TestCase):
+  def setUp(self):
+    self.app = create_app('test_config')
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.drop_all()
+    db.create_all()
+    u = User(username='mamad', password='jafar')
+    db.session.add(u)
+    start = datetime(2020, 1, 1)
+    for i in range(6):
+      db.session.add(Todo(name='odd' if i % 2 else 'even', task=str(i),
+                          timestamp=start + timedelta(days=5 - i)))
+    db.session.commit()
+    self.client = TestClient(self.app, u.generate_auth_token(), '')
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+  def ids(self, **args):
+    rv, json = self.client.get('/api/v1.0/todos/?' + urlencode(args))
+    self.assertEqual(rv.status_code, 200)
+    return self.ids_of(json), json
+
+  def ids_of(self, json):
+    return [int(url.rsplit('/', 1)[1]) for url in json['urls']]
+
+  def test_filter_and_sort(self):
+    # the default order is by timestamp, the newest todo came first
+    self.assertEqual(self.ids()[0], [6, 5, 4, 3, 2, 1])
+    self.assertEqual(self.ids(sort='-id')[0], [6, 5, 4, 3, 2, 1])
+    self.assertEqual(self.ids(name='odd')[0], [6, 4, 2])
+    self.assertEqual(self.ids(name='odd', sort='id')[0], [2, 4, 6])
+    self.assertEqual(self.ids(sort='name')[0], [1, 3, 5, 2, 4, 6])
+    self.assertEqual(self.ids(since='2020-01-02', until='2020-01-05')[0],
+                     [5, 4, 3])
+    self.assertEqual(self.ids(name='even', since='2020-01-03')[0], [3, 1])
+    self.assertEqual(self.ids(after_id=2, before_id=5, sort='-id')[0],
+                     [4, 3])
+
+    ids, json = self.ids(name='odd', sort='-timestamp', per_page=2)
+    self.assertEqual(ids, [2, 4])
+    self.assertIn('name=odd', json['meta']['next'])
+    self.assertIn('sort=-timestamp', json['meta']['next'])
+
+  def test_descending_cursor(self):
+    ids, json = self.ids(sort='-id', cursor='', per_page=4)
+    self.assertEqual(ids, [6, 5, 4, 3])
+    rv, json = self.client.get(json['meta']['next'])
+    self.assertEqual(self.ids_of(json), [2, 1])
+    self.assertIsNone(json['meta']['next'])
+    rv, json = self.client.get(json['meta']['prev'])
+    self.assertEqual(self.ids_of(json), [6, 5, 4, 3])
+
+  def test_full_scans_rejected(self):
+    for args in ({'sort': 'task'}, {'sort': 'name', 'since': '2020-01-01'},
+                 {'since': '2020-01-01', 'after_id': 1},
+                 {'after_id': 1, 'sort': 'timestamp'},
+                 {'name': 'odd', 'after_id': 1, 'sort': 'timestamp'},
+                 {'since': 'yesterday'}, {'after_id': '-1'}):
+      with self.assertRaises(ValidationError):
+        self.client.get('/api/v1.0/todos/?' + urlencode(args))
+
+  def test_explain(self):
+    # every combination that is accepted is answered from an index
+    values = {'name': 'odd', 'since': '2020-01-02', 'until': '2020-01-05',
+              'after_id': '1', 'before_id': '5'}
+    sorts = [None] + [prefix + sort for sort in todo_filters.sorts
+                      for prefix in ('', '-')]
+    combinations = 0
+    for size in range(len(values) + 1):
+      for names in itertools.combinations(sorted(values), size):
+        for sort, paging in itertools.product(sorts, ({}, {'cursor': ''})):
+          args = dict(((name, values[name]) for name in names), **paging)
+          if sort is not None:
+            args['sort'] = sort
+          try:
+            todo_filters.parse(args)
+          except ValidationError:
+            continue
+          combinations += 1
+          for statement, params in self.statements(args):
+            plan = self.explain(statement, params)
+            self.assertNotIn('TEMP B-TREE', plan, (args, plan))
+            if names:
+              self.assertNotRegex(plan, r'SCAN todos(?! USING)',
+                                  (args, plan))
+    self.assertEqual(combinations, 112)
+
+  def statements(self, args):
+    statements = []
+
+    def listener(conn, cursor, statement, parameters, *_):
+      if 'FROM todos' in statement:
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+      self.ids(**args)
+    finally:
+      event.remove(db.engine, 'before_cursor_execute', listener)
+    self.assertTrue(statements)
+    return statements
+
+  def explain(self, statement, params):
+    cursor = db.session.connection().connection.cursor()
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, params)
+    return '\n'.join(row[-1] for row in cursor.fetchall())
@@ -0,0 +1,78 @@
+import unittest
+from . import make_app
+from .test_client import TestClient
+from api.app import create_app
+from api.metrics import Registry, metrics
+from api.models import db, User
+
+
+class TestMetrics(unittest.TestCase):
+  def setUp(self):
+    self.app = make_app(METRICS=True)
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.drop_all()
+    db.create_all()
+    u = User(username='mamad', password='jafar')
+    db.session.add(u)
+    db.session.commit()
+    self.client = TestClient(self.app, u.generate_auth_token(), '')
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+  def test_histogram(self):
+    registry = Registry([0.1, 0.5])
+    for value in (0.05, 0.1, 0.3, 2):
+      registry.observe('request_duration_seconds', value, endpoint='x')
+    registry.inc('sql_queries_total', 3, endpoint='x')
+    text = registry.render([('cache_hits', (), 7)])
+    self.assertIn('api_request_duration_seconds_bucket{endpoint="x",le="0.1"}'
+                  ' 2', text)
+    self.assertIn('api_request_duration_seconds_bucket{endpoint="x",le="0.5"}'
+                  ' 3', text)
+    self.assertIn('api_request_duration_seconds_bucket{endpoint="x",le="+Inf"}'
+                  ' 4', text)
+    self.assertIn('api_request_duration_seconds_count{endpoint="x"} 4', text)
+    self.assertIn('# TYPE api_sql_queries_total counter', text)
+    self.assertIn('api_sql_queries_total{endpoint="x"} 3', text)
+    self.assertIn('api_cache_hits 7', text)
+
+  def test_endpoint(self):
+    rv, json = self.client.post('/api/v1.0/todos/',
+                                data={'name': 'one', 'task': 'sth'})
+    rv, _ = self.client.get(rv.headers['Location'])
+    self.assertTrue(rv.status_code == 200)
+    rv, _ = self.client.get('/api/v1.0/todos/')
+    self.assertTrue(rv.status_code == 200)
+
+    rv, _ = self.client.get('/metrics')
+    self.assertTrue(rv.status_code == 200)
+    self.assertEqual(rv.mimetype, 'text/plain')
+    text = rv.data.decode('utf-8')
+    self.assertIn('api_request_duration_seconds_count{endpoint="api.get_todos"'
+                  ',method="GET",status="200"} 1', text)
+    self.assertIn('api_request_duration_seconds_count{endpoint="api.new_todo"'
+                  ',method="POST",status="201"} 1', text)
+    for stage in ('etag', 'serialize', 'hit_count', 'db'):
+      self.assertIn('api_stage_duration_seconds_count{endpoint="api.get_todo"'
+                    ',stage="%s"} 1' % stage, text)
+    self.assertIn('api_stage_duration_seconds_count{endpoint="api.get_todos"'
+                  ',stage="auth"} 1', text)
+    self.assertIn('api_sql_queries_total{endpoint="api.get_todo"}', text)
+    self.assertIn('api_response_cache_misses', text)
+    self.assertIn('api_redis_pool_checkouts', text)
+
+    rv, _ = TestClient(self.app, 'bad', 'token').get('/metrics')
+    self.assertTrue(rv.status_code == 401)
+
+  def test_disabled(self):
+    app = create_app('test_config')
+    with app.app_context():
+      self.assertTrue(metrics.registry is None)
+      with metrics.stage('auth'):
+        pass
+      rv = app.test_client().get('/metrics')
+      self.assertTrue(rv.status_code == 404)
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from collections import Counter
+from . import make_app
+from api.profiler import Ring, profiler, summarize
+
+
+def spin(seconds):
+  end = time.perf_counter() + seconds
+  while time.perf_counter() < end:
+    pass
+
+
+class TestProfiler(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.app = make_app(PROFILER=True, PROFILER_TOKEN='secret',
+                        PROFILER_INTERVAL=0.001, PROFILER_DIR=self.directory,
+                        PROFILER_RING_SIZE=3)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_profile_request(self):
+    with self.app.test_request_context(headers={'X-Profile': 'secret'}):
+      profiler.start()
+      spin(0.1)
+      path = profiler.finish()
+    with open(path) as f:
+      stacks = f.read()
+    self.assertIn('tests.test_profiler:spin', stacks)
+    rows = summarize([path], package='tests')
+    self.assertEqual(rows[0][0], 'tests.test_profiler:spin')
+
+    # other requests are not profiled unless sampled
+    for headers in ({}, {'X-Profile': 'wrong'}):
+      with self.app.test_request_context(headers=headers):
+        profiler.start()
+        spin(0.01)
+        self.assertTrue(profiler.finish() is None)
+    self.app.config['PROFILER_SAMPLE_RATE'] = 1.0
+    with self.app.test_request_context():
+      profiler.start()
+      spin(0.05)
+      self.assertTrue(profiler.finish() is not None)
+
+  def test_ring(self):
+    ring = Ring(self.directory, 3)
+    paths = [ring.write('api.get_todo', Counter({'a;b': i + 1}))
+             for i in range(5)]
+    self.assertEqual(ring.files(), paths[2:])
+    with open(paths[-1]) as f:
+      self.assertEqual(f.read(), 'a;b 5\n')
+
+    # by default profiles go to the instance folder, not the cwd
+    app = make_app(PROFILER_DIR=None)
+    self.assertEqual(app.extensions['profiler_ring'].directory,
+                     os.path.join(app.instance_path, 'profiles'))
+
+  def test_summarize(self):
+    path = os.path.join(self.directory, 'x.folded')
+    with open(path, 'w') as f:
+      f.write('flask:dispatch;api.decorators:wrapped;api.models:to_json 3\n'
+              'flask:dispatch;api.decorators:wrapped;sqlalchemy:execute 5\n'
+              'flask:dispatch 2\n')
+    self.assertEqual(summarize([path]), [
+        ('api.decorators:wrapped', 5, 8),
+        ('api.models:to_json', 3, 3)])
@@ -0,0 +1,115 @@
+import unittest
+from api.app import create_app
+from api.models import db
+from api.rate_limit import LocalTier, RateLimit, local_limiter
+from api.store import redis_store
+from .test_client import TestClient
+
+
+class TestRateLimit(unittest.TestCase):
+  def setUp(self):
+    self.app = create_app('test_config')
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    self.now = 1000.0
+    self.app.extensions['redis'].clock = lambda: self.now
+    db.create_all()
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+  def consume(self, algorithm, count, now, limit=3, per=10):
+    self.now = now
+    return [RateLimit('test/', limit, per, algorithm, now=now)
+            for _ in range(count)]
+
+  def test_fixed_window(self):
+    limiters = self.consume('fixed-window', 3, 1000.0)
+    self.assertEqual([l.over_limit for l in limiters], [False, False, True])
+    self.assertEqual([l.remaining for l in limiters], [2, 1, 0])
+    self.assertEqual(limiters[0].reset, 1010)
+
+  def test_sliding_window(self):
+    limiters = self.consume('sliding-window', 4, 1000.0)
+    self.assertEqual([l.over_limit for l in limiters],
+                     [False, False, False, True])
+    self.assertEqual(limiters[-1].remaining, 0)
+    self.assertEqual(limiters[-1].reset, 1010)
+    # the window slides instead of resetting on a boundary
+    self.assertTrue(self.consume('sliding-window', 1, 1009.9)[0].over_limit)
+    self.assertFalse(self.consume('sliding-window', 1, 1010.1)[0].over_limit)
+
+  def test_token_bucket(self):
+    limiters = self.consume('token-bucket', 4, 1000.0)
+    self.assertEqual([l.over_limit for l in limiters],
+                     [False, False, False, True])
+    # one token is refilled every per / limit seconds
+    limiter = self.consume('token-bucket', 1, 1003.4)[0]
+    self.assertFalse(limiter.over_limit)
+    self.assertEqual(limiter.remaining, 0)
+    self.assertTrue(self.consume('token-bucket', 1, 1003.5)[0].over_limit)
+
+  def test_unknown_algorithm(self):
+    with self.assertRaises(ValueError):
+      RateLimit('test/', 3, 10, 'leaky')
+
+  def through(self, tier, algorithm, now, limit=3, per=10, key='a'):
+    """Check a request against ``tier`` and then Redis, like the decorator.
+
+    Returns ``'shed'``, ``'rejected'`` or ``'allowed'``.
+    """
+    if tier.shed(key, limit, per, now=now) is not None:
+      return 'shed'
+    self.now = now
+    limiter = RateLimit('test/' + key, limit, per, algorithm, now=now)
+    tier.update(key, limiter, now=now)
+    return 'rejected' if limiter.over_limit else 'allowed'
+
+  def test_local_tier(self):
+    tier = LocalTier(size=2)
+    results = [self.through(tier, 'fixed-window', 1000.0) for _ in range(4)]
+    self.assertEqual(results, ['allowed', 'allowed', 'rejected', 'shed'])
+    # the over-limit key is shed without Redis until its window resets
+    self.assertEqual(tier.shed('a', 3, 10, now=1008.0), 1010)
+    self.assertEqual(self.through(tier, 'fixed-window', 1010.0), 'allowed')
+
+    self.through(tier, 'fixed-window', 1010.0, key='b')
+    self.through(tier, 'fixed-window', 1010.0, key='c')
+    self.assertEqual(tier.stats(), {'hits': 2, 'misses': 6, 'evictions': 1,
+                                    'size': 2, 'capacity': 2})
+
+  def test_local_tier_window_boundary(self):
+    # a burst just before the end of a window does not shed the next one
+    tier = LocalTier()
+    times = [1004.0, 1004.1, 1004.2, 1004.3, 1004.4,
+             1005.1, 1005.2, 1005.3, 1005.4]
+    results = [self.through(tier, 'fixed-window', now, limit=5, per=15)
+               for now in times]
+    self.assertEqual(results, ['allowed'] * 4 + ['rejected'] +
+                     ['allowed'] * 4)
+
+    # the token bucket lets a request through as soon as Redis would
+    tier = LocalTier()
+    results = [self.through(tier, 'token-bucket', 2000.0, key='t')
+               for _ in range(5)]
+    self.assertEqual(results, ['allowed'] * 3 + ['shed'] * 2)
+    self.assertEqual(self.through(tier, 'token-bucket', 2003.0, key='t'),
+                     'shed')
+    self.assertEqual(self.through(tier, 'token-bucket', 2003.4, key='t'),
+                     'allowed')
+
+  def test_local_tier_decorator(self):
+    self.app.config['USE_RATE_LIMITS'] = True
+    self.app.config['RATE_LIMIT_LOCAL_TIER'] = True
+    client = TestClient(self.app, 'abc', 'def')
+    for _ in range(5):
+      rv, _ = client.get('/api/v1.0/todos/1')
+    self.assertEqual(rv.status_code, 429)
+    checkouts = redis_store.stats()['checkouts']
+    rv, _ = client.get('/api/v1.0/todos/1')
+    self.assertEqual(rv.status_code, 429)
+    self.assertEqual(rv.headers['X-RateLimit-Remaining'], '0')
+    self.assertEqual(redis_store.stats()['checkouts'], checkouts)
+    self.assertEqual(local_limiter.tier.stats()['hits'], 1)
@@ -0,0 +1,77 @@
+import unittest
+from urllib.parse import urlencode
+from . import make_app
+from .test_client import TestClient
+from api.bulk import bulk_writer
+from api.errors import ValidationError
+from api.models import db, User
+from api.search import fts5_available, todo_search
+
+
+class SearchCase(unittest.TestCase):
+  backend = 'auto'
+
+  def setUp(self):
+    self.app = make_app(SEARCH_BACKEND=self.backend)
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.drop_all()
+    db.create_all()
+    u = User(username='mamad', password='jafar')
+    db.session.add(u)
+    db.session.commit()
+    self.client = TestClient(self.app, u.generate_auth_token(), '')
+    for name, task in (('buy milk', 'at the shop'),
+                       ('call mom', 'ask about the milkman'),
+                       ('walk', 'buy milk on the way')):
+      rv, _ = self.client.post('/api/v1.0/todos/',
+                               data={'name': name, 'task': task})
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+  def search(self, q, **args):
+    rv, json = self.client.get('/api/v1.0/todos/search?' +
+                               urlencode(dict(args, q=q)))
+    self.assertEqual(rv.status_code, 200)
+    return [int(url.rsplit('/', 1)[1]) for url in json['urls']], json
+
+  def test_search(self):
+    # name matches rank first, the last word matches as a prefix
+    ids = self.search('milk')[0]
+    self.assertEqual(ids[0], 1)
+    self.assertEqual(sorted(ids), [1, 2, 3])
+    self.assertEqual(self.search('buy milk')[0], [1, 3])
+    self.assertEqual(self.search('nothing')[0], [])
+
+    ids, json = self.search('milk', per_page=1)
+    self.assertEqual(json['meta']['total'], 3)
+    self.assertIn('q=milk', json['meta']['next'])
+    with self.assertRaises(ValidationError):
+      self.client.get('/api/v1.0/todos/search?q=%20%3F')
+
+  def test_index_sync(self):
+    self.client.put('/api/v1.0/todos/1', data={'name': 'buy bread',
+                                                'task': 'at the shop'})
+    self.client.delete('/api/v1.0/todos/3')
+    self.assertEqual(self.search('bread')[0], [1])
+    self.assertEqual(self.search('milk')[0], [2])
+    ids = bulk_writer.insert([{'name': 'more bread', 'task': 'x'}])
+    self.assertEqual(sorted(self.search('bread')[0]), [1] + ids)
+
+
+@unittest.skipUnless(fts5_available(), 'SQLite was built without FTS5')
+class TestFTS5Search(SearchCase):
+  def test_rebuild(self):
+    self.assertEqual(todo_search.backend, 'fts5')
+    db.session.execute('DELETE FROM todos_fts')
+    db.session.commit()
+    self.assertEqual(self.search('milk')[0], [])
+    self.assertEqual(todo_search.rebuild(), 3)
+    self.assertEqual(len(self.search('milk')[0]), 3)
+
+
+class TestLikeSearch(SearchCase):
+  backend = 'like'
@@ -0,0 +1,66 @@
+import unittest
+from datetime import datetime
+from flask import json
+from . import make_app
+from api.app import create_app
+from api.errors import error_body, not_modified, too_many_requests
+from api.serializer import backends, make_backend, serializer
+
+
+class TestSerializer(unittest.TestCase):
+  def setUp(self):
+    self.app = create_app('test_config')
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+
+  def tearDown(self):
+    self.ctx.pop()
+
+  def test_backends(self):
+    data = {'name': 'café', 'url': 'http://localhost/api/v1.0/todos/1',
+            'timestamp': datetime(2018, 9, 13, 8, 43, 26), 'ids': [1, 2.5]}
+    expected = b'{"name":"caf\xc3\xa9","url":"http://localhost/api/v1.0/' \
+        b'todos/1","timestamp":"Thu, 13 Sep 2018 08:43:26 GMT",' \
+        b'"ids":[1,2.5]}'
+    for name, (module, _) in backends.items():
+      if module is None:
+        continue  # pragma: no cover
+      backend = make_backend(name)
+      self.assertEqual(backend.name, name)
+      self.assertEqual(backend.dumps(data), expected)
+      self.assertEqual(make_backend(name, 'iso').dumps(data['timestamp']),
+                       b'"2018-09-13T08:43:26"')
+      with self.assertRaises(TypeError):
+        backend.dumps({'x': object()})
+    with self.assertRaises(ValueError):
+      make_backend('simplejson')
+    with self.assertRaises(ValueError):
+      make_backend('json', 'rfc822')
+
+  def test_responses(self):
+    rv = serializer.response({'a': [1]}, 201)
+    self.assertEqual(rv.status_code, 201)
+    self.assertEqual(rv.mimetype, 'application/json')
+    self.assertEqual(rv.data, b'{"a":[1]}')
+
+    # constant error bodies are encoded once and shared between responses
+    rv = not_modified()
+    self.assertEqual(rv.status_code, 304)
+    self.assertEqual(json.loads(rv.data),
+                     {'status': 304, 'error': 'not modified'})
+    self.assertTrue(not_modified().response[0] is
+                    not_modified().response[0])
+    rv = too_many_requests()
+    self.assertEqual(json.loads(rv.data)['message'],
+                     'You have exceeded your request rate')
+    self.assertTrue(rv.response[0] is too_many_requests().response[0])
+    # every app encodes them with its own backend when it is created
+    app = make_app(JSON_BACKEND='json')
+    self.assertEqual(sorted(app.extensions['json_constants']),
+                     ['error/304', 'error/412', 'error/429'])
+    self.assertEqual(error_body(400, 'bad request', 'café'),
+                     serializer.dumps({'status': 400, 'error': 'bad request',
+                                       'message': 'café'}))
+    rv = too_many_requests('limit exceeded')
+    self.assertEqual(rv.status_code, 429)
+    self.assertEqual(json.loads(rv.data)['message'], 'limit exceeded')
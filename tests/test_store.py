@@ -0,0 +1,44 @@
+import unittest
+from api.app import create_app
+from api.store import FakeRedis, redis_store
+
+
+class TestRedisStore(unittest.TestCase):
+  def setUp(self):
+    self.app = create_app('test_config')
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+
+  def tearDown(self):
+    self.ctx.pop()
+
+  def test_shared_client(self):
+    client = redis_store.client
+    self.assertTrue(isinstance(client, FakeRedis))
+    self.assertTrue(redis_store.client is client)
+    client.incr('a')
+    client.get('a')
+    stats = redis_store.stats()
+    self.assertEqual(stats['checkouts'], 2)
+    self.assertEqual(stats['in_use'], 0)
+    self.assertEqual(stats['max_connections'], 10)
+
+  def test_pipeline(self):
+    p = redis_store.client.pipeline()
+    p.incr('counter')
+    p.incrby('counter', 4)
+    p.expire('counter', 10)
+    self.assertEqual(p.execute(), [1, 5, True])
+    self.assertEqual(redis_store.client.get('counter'), b'5')
+    self.assertEqual(redis_store.client.ttl('counter'), 10)
+
+  def test_ttl(self):
+    now = [1000.0]
+    redis = FakeRedis(clock=lambda: now[0])
+    redis.set('key', 'value', ex=5)
+    self.assertEqual(redis.get('key'), b'value')
+    now[0] += 5
+    self.assertEqual(redis.get('key'), None)
+    self.assertEqual(redis.ttl('key'), -2)
+    redis.set('key', 'value')
+    self.assertEqual(redis.ttl('key'), -1)
@@ -1,10 +1,19 @@
 import unittest
+from datetime import datetime
+from json import loads
+from flask import url_for
+from sqlalchemy import event
 from werkzeug.exceptions import BadRequest
 from .test_client import TestClient
+from api import events
 from api.app import create_app
-from api.models import db, User
+from api.models import db, Todo, User
 from api.errors import ValidationError
-from api.helpers import convert_url
+from api.helpers import convert_url, external_url, url_template
+from api.credentials import credential_cache
+from api.hit_counter import hit_counter
+from api.importer import import_todos
+from api.store import redis_store
 
 
 class TestTokenAPI(unittest.TestCase):
@@ -40,6 +49,62 @@ class TestTokenAPI(unittest.TestCase):
     rv, json = good_client.get('/api/v1.0/todos/')
     self.assertTrue(rv.status_code == 200)
 
+  def test_password_cache(self):
+    self.app.config['USE_TOKEN_AUTH'] = False
+    cache = credential_cache.cache
+    client = TestClient(self.app, self.default_username,
+                        self.default_password)
+    rv, _ = client.get('/api/v1.0/todos/')
+    self.assertTrue(rv.status_code == 200)
+    rv, _ = client.get('/api/v1.0/todos/')
+    self.assertTrue(rv.status_code == 200)
+    self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'entries': 1})
+    self.assertFalse(any(self.default_password.encode('utf-8') in digest
+                         for digest in cache.entries))
+
+    # wrong passwords are never cached
+    bad_client = TestClient(self.app, self.default_username, 'wrong')
+    rv, _ = bad_client.get('/api/v1.0/todos/')
+    self.assertTrue(rv.status_code == 401)
+    self.assertEqual(cache.stats()['entries'], 1)
+
+    # changing the password drops the cached verification
+    u = User.query.get(1)
+    u.password = 'new'
+    db.session.commit()
+    self.assertEqual(cache.stats()['entries'], 0)
+    rv, _ = client.get('/api/v1.0/todos/')
+    self.assertTrue(rv.status_code == 401)
+
+  def test_stateless_token(self):
+    queries = []
+    listener = lambda *args: queries.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    rv, _ = self.client.get('/api/v1.0/todos/')
+    event.remove(db.engine, 'before_cursor_execute', listener)
+    self.assertTrue(rv.status_code == 200)
+    self.assertFalse([q for q in queries if 'FROM users' in q])
+
+    u = User.query.get(1)
+    principal = User.verify_auth_token(u.generate_auth_token())
+    self.assertEqual(principal.username, self.default_username)
+    self.assertTrue(principal.verify_password(self.default_password))
+
+    self.app.config['STATELESS_TOKENS'] = False
+    self.assertTrue(User.verify_auth_token(u.generate_auth_token()) is u)
+
+  def test_revoke_token(self):
+    rv, _ = self.client.post('/auth/revoke-token', data={})
+    self.assertTrue(rv.status_code == 200)
+    rv, _ = self.client.get('/api/v1.0/todos/')
+    self.assertTrue(rv.status_code == 401)
+
+    # new tokens are not affected
+    u = User.query.get(1)
+    client = TestClient(self.app, u.generate_auth_token(), '')
+    rv, _ = client.get('/api/v1.0/todos/')
+    self.assertTrue(rv.status_code == 200)
+
   def test_bad_auth(self):
     bad_client = TestClient(self.app, 'abc', 'def')
     rv, _ = bad_client.get('/api/v1.0/todos/')
@@ -140,6 +205,95 @@ class TestTokenAPI(unittest.TestCase):
     self.assertTrue(five_url in json['urls'])
     self.assertTrue(len(json['urls']) == 1)
 
+  def test_cursor_pagination(self):
+    urls = []
+    for name in ('one', 'two', 'three', 'four', 'five'):
+      rv, json = self.client.post(
+          '/api/v1.0/todos/', data={
+              'name': name,
+              'task': 'sth'
+          })
+      self.assertTrue(rv.status_code == 201)
+      urls.append(rv.headers['Location'])
+
+    # walk forward
+    rv, json = self.client.get('/api/v1.0/todos/?cursor=&per_page=2')
+    self.assertTrue(rv.status_code == 200)
+    self.assertEqual(json['urls'], urls[:2])
+    self.assertTrue(json['meta']['prev'] is None)
+    self.assertFalse('total' in json['meta'])
+    rv, json = self.client.get(
+        json['meta']['next'].replace('http://localhost', ''))
+    self.assertEqual(json['urls'], urls[2:4])
+    rv, json = self.client.get(
+        json['meta']['next'].replace('http://localhost', ''))
+    self.assertEqual(json['urls'], urls[4:])
+    self.assertTrue(json['meta']['next'] is None)
+
+    # and back again
+    rv, json = self.client.get(
+        json['meta']['prev'].replace('http://localhost', ''))
+    self.assertEqual(json['urls'], urls[2:4])
+    rv, json = self.client.get(
+        json['meta']['prev'].replace('http://localhost', ''))
+    self.assertEqual(json['urls'], urls[:2])
+    self.assertTrue(json['meta']['prev'] is None)
+    self.assertTrue(json['meta']['next'] is not None)
+
+    # the total is only counted on request
+    rv, json = self.client.get('/api/v1.0/todos/?cursor=&count=1')
+    self.assertEqual(json['meta']['total'], 5)
+    self.assertTrue('count=1' in json['meta']['first'])
+
+    self.assertRaises(ValidationError, lambda:
+                      self.client.get('/api/v1.0/todos/?cursor=garbage'))
+
+  def test_invalid_per_page(self):
+    for i in range(12):
+      db.session.add(Todo(name='todo %d' % i, task='sth'))
+    db.session.commit()
+    for per_page in (-1, 0):
+      for mode in ('', '&cursor='):
+        rv, _ = self.client.get('/api/v1.0/todos/?per_page=%d%s' %
+                                (per_page, mode))
+        self.assertEqual(rv.status_code, 404)
+
+  def test_expand(self):
+    for i in range(12):
+      rv, json = self.client.post(
+          '/api/v1.0/todos/', data={
+              'name': 'todo %d' % i,
+              'task': 'sth'
+          })
+      self.assertTrue(rv.status_code == 201)
+
+    rv, json = self.client.get('/api/v1.0/todos/?expand=1')
+    self.assertTrue(rv.status_code == 200)
+    self.assertEqual(len(json['items']), 10)
+    self.assertEqual(json['items'][0]['name'], 'todo 0')
+    self.assertEqual(json['items'][0]['url'], json['urls'][0])
+    self.assertEqual(set(json['items'][0]),
+                     set(['url', 'name', 'task', 'timestamp']))
+    self.assertTrue('expand=1' in json['meta']['next'])
+
+    # narrow projections allow larger pages
+    rv, json = self.client.get('/api/v1.0/todos/?fields=name&per_page=20')
+    self.assertTrue(rv.status_code == 200)
+    self.assertEqual(len(json['items']), 12)
+    self.assertEqual(set(json['items'][0]), set(['url', 'name']))
+    self.assertEqual(json['meta']['per_page'], 20)
+
+    rv, json = self.client.get(
+        '/api/v1.0/todos/?cursor=&fields=task&per_page=5')
+    self.assertEqual(set(json['items'][0]), set(['url', 'task']))
+    self.assertTrue('fields=task' in json['meta']['next'])
+
+    rv, json = self.client.get('/api/v1.0/todos/')
+    self.assertFalse('items' in json)
+
+    self.assertRaises(ValidationError, lambda:
+                      self.client.get('/api/v1.0/todos/?fields=password'))
+
   def test_cache_control(self):
     client = TestClient(self.app, self.default_username, self.default_password)
     rv, json = client.get('/auth/request-token')
@@ -211,11 +365,240 @@ class TestTokenAPI(unittest.TestCase):
     rv, json = self.client.get(one_url, headers={'If-None-Match': one_etag})
     self.assertTrue(rv.status_code == 200)
 
+    # a new todo that reuses the id of a deleted one has a new etag
+    rv, json = self.client.get(two_url)
+    two_etag = rv.headers['ETag']
+    rv, json = self.client.delete(two_url)
+    self.assertTrue(rv.status_code == 200)
+    rv, json = self.client.post(
+        '/api/v1.0/todos/', data={
+            'name': 'three',
+            'task': 'sth'
+        })
+    self.assertEqual(rv.headers['Location'], two_url)
+    rv, json = self.client.get(two_url, headers={'If-None-Match': two_etag})
+    self.assertTrue(rv.status_code == 200)
+    self.assertEqual(json['name'], 'three')
+    self.assertNotEqual(rv.headers['ETag'], two_etag)
+
+  def test_buffered_hit_count(self):
+    self.app.config['HIT_COUNT_BUFFERED'] = True
+    for name in ('one', 'two'):
+      rv, _ = self.client.post(
+          '/api/v1.0/todos/', data={
+              'name': name,
+              'task': 'sth'
+          })
+    one_url = '/api/v1.0/todos/1'
+    two_url = '/api/v1.0/todos/2'
+    for url in (one_url, two_url, two_url):
+      rv, _ = self.client.get(url)
+      self.assertTrue(rv.status_code == 200)
+    self.assertEqual(redis_store.client.get('hit-count' + two_url), None)
+
+    hit_counter.flush()
+    self.assertEqual(redis_store.client.get('hit-count' + two_url), b'2')
+    self.assertEqual(hit_counter.top(), [(two_url, 2), (one_url, 1)])
+    self.assertEqual(hit_counter.top(1), [(two_url, 2)])
+    hit_counter.buffer.worker.stop()
+
+  def test_collection_etag(self):
+    rv, _ = self.client.post(
+        '/api/v1.0/todos/', data={
+            'name': 'one',
+            'task': 'sth'
+        })
+    one_url = rv.headers['Location']
+    rv, _ = self.client.get('/api/v1.0/todos/')
+    self.assertTrue(rv.status_code == 200)
+    urls_etag = rv.headers['ETag']
+    rv, _ = self.client.get('/api/v1.0/todos/?expand=1')
+    expanded_etag = rv.headers['ETag']
+    self.assertNotEqual(urls_etag, expanded_etag)
+
+    # conditional requests are answered without running the query
+    queries = []
+    listener = lambda *args: queries.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    rv, _ = self.client.get('/api/v1.0/todos/',
+                            headers={'If-None-Match': urls_etag})
+    event.remove(db.engine, 'before_cursor_execute', listener)
+    self.assertTrue(rv.status_code == 304)
+    self.assertFalse([q for q in queries if 'FROM todos' in q])
+
+    # edits only change the expanded representation
+    rv, _ = self.client.put(one_url, data={'name': 'one', 'task': 'other'})
+    rv, _ = self.client.get('/api/v1.0/todos/',
+                            headers={'If-None-Match': urls_etag})
+    self.assertTrue(rv.status_code == 304)
+    rv, _ = self.client.get('/api/v1.0/todos/?expand=1',
+                            headers={'If-None-Match': expanded_etag})
+    self.assertTrue(rv.status_code == 200)
+
+    # new items change every representation
+    rv, _ = self.client.post(
+        '/api/v1.0/todos/', data={
+            'name': 'two',
+            'task': 'sth'
+        })
+    rv, _ = self.client.get('/api/v1.0/todos/',
+                            headers={'If-None-Match': urls_etag})
+    self.assertTrue(rv.status_code == 200)
+    self.assertNotEqual(rv.headers['ETag'], urls_etag)
+
+  def test_bulk(self):
+    self.app.config['BULK_CHUNK_SIZE'] = 2
+    rv, json = self.client.get('/api/v1.0/todos/')
+    self.assertTrue(json['urls'] == [])
+
+    rv, json = self.client.post('/api/v1.0/todos/bulk', data=[
+        {'name': 'one', 'task': 'sth'},
+        {'name': 'two'},
+        {'name': 'three', 'task': 'sth'},
+        {'name': 'four', 'task': 'sth'}
+    ])
+    self.assertTrue(rv.status_code == 200)
+    self.assertEqual([r['status'] for r in json['results']],
+                     [201, 400, 201, 201])
+    self.assertEqual(json['results'][1]['message'],
+                     'Invalid todo: missing task')
+    one_url = json['results'][0]['location']
+    rv, json = self.client.get(one_url)
+    self.assertTrue(json['name'] == 'one')
+
+    # the collection cache was invalidated
+    rv, json = self.client.get('/api/v1.0/todos/')
+    self.assertTrue(len(json['urls']) == 3)
+
+    rv, json = self.client.put('/api/v1.0/todos/bulk', data=[
+        {'id': 1, 'name': 'one', 'task': 'done'},
+        {'id': 42, 'name': 'lost', 'task': 'sth'},
+        {'name': 'no id', 'task': 'sth'}
+    ])
+    self.assertEqual([r['status'] for r in json['results']], [200, 404, 400])
+    rv, json = self.client.get(one_url)
+    self.assertTrue(json['task'] == 'done')
+
+    rv, json = self.client.send('/api/v1.0/todos/bulk', 'DELETE',
+                                [1, 3, 42, 'x'])
+    self.assertEqual([r['status'] for r in json['results']],
+                     [200, 200, 404, 400])
+    rv, json = self.client.get('/api/v1.0/todos/')
+    self.assertTrue(len(json['urls']) == 1)
+    rv, json = self.client.get(one_url)
+    self.assertTrue(rv.status_code == 404)
+
+    self.app.config['BULK_MAX_ITEMS'] = 1
+    self.assertRaises(ValidationError, lambda: self.client.post(
+        '/api/v1.0/todos/bulk', data=[{'name': 'a', 'task': 'b'}] * 2))
+    self.assertRaises(ValidationError, lambda: self.client.post(
+        '/api/v1.0/todos/bulk', data={'name': 'a', 'task': 'b'}))
+
+  def test_export(self):
+    self.app.config['EXPORT_BATCH_SIZE'] = 2
+    rv, json = self.client.post('/api/v1.0/todos/bulk', data=[
+        {'name': 'todo %d' % i, 'task': 'sth'} for i in range(5)])
+    Todo.query.filter_by(id=5).update(
+        {'timestamp': datetime(2030, 1, 1)})
+    db.session.commit()
+
+    def export(url):
+      rv, _ = self.client.get(url)
+      self.assertTrue(rv.status_code == 200)
+      self.assertEqual(rv.mimetype, 'application/x-ndjson')
+      return [loads(line) for line in rv.data.decode('utf-8').splitlines()]
+
+    rows = export('/api/v1.0/todos/export')
+    self.assertEqual([row['id'] for row in rows], [1, 2, 3, 4, 5])
+    self.assertEqual(rows[0]['name'], 'todo 0')
+    self.assertEqual(rows[0]['url'], json['results'][0]['location'])
+    rows = export('/api/v1.0/todos/export?after_id=2')
+    self.assertEqual([row['id'] for row in rows], [3, 4, 5])
+    rows = export('/api/v1.0/todos/export?since=2029-01-01')
+    self.assertEqual([row['id'] for row in rows], [5])
+    rows = export('/api/v1.0/todos/export?until=2029-01-01&after_id=3')
+    self.assertEqual([row['id'] for row in rows], [4])
+    self.assertRaises(ValidationError, lambda: self.client.get(
+        '/api/v1.0/todos/export?since=yesterday'))
+    self.assertRaises(ValidationError, lambda: self.client.get(
+        '/api/v1.0/todos/export?after_id=x'))
+
+  def test_import(self):
+    self.app.config['BULK_CHUNK_SIZE'] = 2
+    client = self.app.test_client()
+    headers = {'Authorization': self.client.auth}
+
+    rv = client.post('/api/v1.0/todos/import', headers=headers,
+                     content_type='application/x-ndjson',
+                     data='{"name": "a", "task": "b"}\nnot json\n\n'
+                     '{"name": "c"}\n{"name": "d", "task": "e"}\n')
+    self.assertTrue(rv.status_code == 200)
+    report = loads(rv.data.decode('utf-8'))
+    self.assertEqual(report['rows'], 2)
+    self.assertEqual(report['rejected'], 2)
+    self.assertEqual(report['errors'], [
+        {'line': 2, 'message': 'Invalid todo: malformed JSON'},
+        {'line': 4, 'message': 'Invalid todo: missing task'}])
+
+    rv = client.post('/api/v1.0/todos/import', headers=headers,
+                     content_type='text/csv',
+                     data='name,task\nx,y\n"multi\nline",z\nonly\n')
+    report = loads(rv.data.decode('utf-8'))
+    self.assertEqual((report['rows'], report['rejected']), (2, 1))
+    self.assertEqual(report['errors'][0]['line'], 5)
+
+    # the collection cache was invalidated
+    rv, json = self.client.get('/api/v1.0/todos/?expand=1')
+    self.assertEqual([item['name'] for item in json['items']],
+                     ['a', 'd', 'x', 'multi\nline'])
+
+    # validation in a process pool keeps the input order
+    lines = ['{"name": "p%d", "task": "t"}' % i for i in range(10)]
+    report = import_todos(lines, batch_size=3, workers=2)
+    self.assertEqual((report.rows, report.rejected), (10, 0))
+    self.assertEqual([todo.name for todo in Todo.query.order_by(Todo.id)][4:],
+                     ['p%d' % i for i in range(10)])
+
+    # the ids reported to the listeners are the ones inserted
+    created = []
+    listener = events.on_flush(
+        lambda session, changes: created.extend(changes.created))
+    try:
+      import_todos(['{"name": "r%d", "task": "t"}' % i for i in range(5)],
+                   batch_size=2)
+    finally:
+      events.flush_listeners.remove(listener)
+    self.assertEqual(sorted(created), [todo.id for todo in Todo.query.filter(
+        Todo.name.like('r%')).order_by(Todo.id)])
+
+    rv = client.post('/api/v1.0/todos/import?format=xml', headers=headers,
+                     data='x')
+    self.assertTrue(rv.status_code == 400)
+
   def test_helpers(self):
     self.assertEqual(convert_url('www.google.com'), 'http://www.google.com')
     with self.assertRaises(ValidationError):
       convert_url('bad url')
 
+  def test_url_templates(self):
+    for base_url in ('http://localhost/', 'https://example.com:8443/app/'):
+      with self.app.test_request_context('/', base_url=base_url):
+        self.assertEqual(url_template('api.get_todo', 'id') % 7,
+                         url_for('api.get_todo', id=7, _external=True))
+        self.assertEqual(
+            external_url('api.get_todos', page=2, fields='name,url'),
+            url_for('api.get_todos', page=2, fields='name,url',
+                    _external=True))
+        self.assertEqual(external_url('api.get_todo', {'id': 3}),
+                         url_for('api.get_todo', id=3, _external=True))
+    self.assertEqual(len(self.app.extensions['url_templates']), 6)
+
+    # outside of requests links follow SERVER_NAME
+    self.app.config['SERVER_NAME'] = 'api.example.com'
+    with self.app.app_context():
+      self.assertEqual(url_template('api.get_todo', 'id') % 7,
+                       'http://api.example.com/api/v1.0/todos/7')
+
   def test_todos(self):
     # get collection
     rv, json = self.client.get('/api/v1.0/todos/')
@@ -236,6 +619,8 @@ class TestTokenAPI(unittest.TestCase):
     self.assertTrue(rv.status_code == 200)
     self.assertTrue(json['name'] == 'buy')
     self.assertTrue(json['url'] == buy_url)
+    self.assertEqual(
+        redis_store.client.get('hit-count/api/v1.0/todos/1'), b'1')
 
     # create new
     rv, json = self.client.post(
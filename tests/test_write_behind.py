@@ -0,0 +1,146 @@
+import json
+import unittest
+from sqlalchemy import event
+from . import make_app
+from .test_client import TestClient
+from api.errors import ValidationError
+from api.models import db, Todo, User
+from api.store import redis_store
+from api.tasks import apply_writes
+from api.write_behind import lock_key, queue_key, write_behind
+
+
+class WriteBehindCase(unittest.TestCase):
+  eager = True
+
+  def setUp(self):
+    self.app = make_app(WRITE_BEHIND=True, CELERY_ALWAYS_EAGER=self.eager)
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.drop_all()
+    db.create_all()
+    u = User(username='mamad', password='jafar')
+    db.session.add(u)
+    db.session.commit()
+    self.client = TestClient(self.app, u.generate_auth_token(), '')
+
+  def tearDown(self):
+    redis_store.client.flushdb()
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+
+class TestWriteBehind(WriteBehindCase):
+  def test_eager(self):
+    rv, json = self.client.post('/api/v1.0/todos/',
+                                data={'name': 'one', 'task': 'sth'})
+    self.assertEqual(rv.status_code, 202)
+    self.assertEqual(json['status'], 'pending')
+    rv, json = self.client.get(rv.headers['Location'])
+    self.assertEqual(rv.status_code, 200)
+    self.assertEqual(json['status'], 'done')
+    self.assertTrue(json['url'].endswith('/api/v1.0/todos/1'))
+
+    rv, json = self.client.put(json['url'], data={'name': 'two',
+                                                  'task': 'sth'})
+    self.assertEqual(rv.status_code, 202)
+    rv, json = self.client.get(json['url'])
+    self.assertEqual(json['status'], 'done')
+    self.assertEqual(Todo.query.get(1).name, 'two')
+
+    rv, json = self.client.put('/api/v1.0/todos/42',
+                               data={'name': 'x', 'task': 'y'})
+    rv, json = self.client.get(rv.headers['Location'])
+    self.assertEqual(json, {'status': 'failed', 'message': 'item not found'})
+
+    with self.assertRaises(ValidationError):
+      self.client.post('/api/v1.0/todos/', data={'name': 'no task'})
+    with self.assertRaises(ValidationError):
+      self.client.post('/api/v1.0/todos/', data={'name': ['not', 'a string'],
+                                                 'task': 'sth'})
+    rv, _ = self.client.get('/api/v1.0/todos/writes/unknown')
+    self.assertEqual(rv.status_code, 404)
+
+
+class TestWriteBehindWorker(WriteBehindCase):
+  eager = False
+
+  def test_coalesced_batch(self):
+    db.session.add(Todo(name='one', task='sth'))
+    db.session.commit()
+    urls = []
+    for i in range(3):
+      rv, json = self.client.put('/api/v1.0/todos/1',
+                                 data={'name': 'edit %d' % i, 'task': 'sth'})
+      self.assertEqual(rv.status_code, 202)
+      urls.append(rv.headers['Location'])
+    rv, json = self.client.get(urls[0])
+    self.assertEqual(json['status'], 'pending')
+
+    # edits of one todo share a shard, which only one worker drains
+    shard = write_behind.shard('todo:1')
+    self.assertEqual(write_behind.pending(shard), 3)
+    redis_store.client.set(lock_key + str(shard), 'other worker')
+    self.assertFalse(write_behind.drain(shard))
+    redis_store.client.delete(lock_key + str(shard))
+
+    commits = []
+
+    def count(session):
+      commits.append(session)
+
+    event.listen(db.session, 'after_commit', count)
+    try:
+      apply_writes.apply(args=(shard, ))
+    finally:
+      event.remove(db.session, 'after_commit', count)
+    self.assertEqual(len(commits), 1)
+    self.assertEqual(write_behind.pending(shard), 0)
+    db.session.expire_all()
+    todo = Todo.query.get(1)
+    self.assertEqual((todo.name, todo.version), ('edit 2', 2))
+    for url in urls:
+      rv, json = self.client.get(url)
+      self.assertEqual(json['status'], 'done')
+
+  def test_lock_taken_over(self):
+    for i in range(3):
+      self.client.put('/api/v1.0/todos/1', data={'name': 'edit %d' % i,
+                                                 'task': 'sth'})
+    shard = write_behind.shard('todo:1')
+    apply = write_behind.apply
+
+    def slow_apply(mutations):
+      # the lock expires during the batch and another worker takes it
+      redis_store.client.set(lock_key + str(shard), 'other worker')
+      apply(mutations)
+
+    write_behind.apply = slow_apply
+    try:
+      self.assertFalse(write_behind.drain(shard))
+    finally:
+      write_behind.apply = apply
+    # the batch stays queued for the new owner, and its lock is kept
+    self.assertEqual(write_behind.pending(shard), 3)
+    self.assertEqual(redis_store.client.get(lock_key + str(shard)),
+                     b'other worker')
+
+  def test_rejected_mutation(self):
+    shard = write_behind.shard('todo:1')
+    # a mutation the database refuses, queued ahead of a valid one
+    redis_store.client.rpush(queue_key + str(shard), json.dumps({
+        'id': 'bad', 'todo': None, 'name': ['not', 'a string'],
+        'task': 'sth'}))
+    rv, _ = self.client.put('/api/v1.0/todos/1', data={'name': 'one',
+                                                       'task': 'sth'})
+    db.session.add(Todo(name='before', task='sth'))
+    db.session.commit()
+    self.assertTrue(write_behind.drain(shard))
+    self.assertEqual(write_behind.pending(shard), 0)
+    self.assertEqual(write_behind.status('bad'), {
+        'status': 'failed', 'message': 'rejected by the database'})
+    rv, status = self.client.get(rv.headers['Location'])
+    self.assertEqual(status['status'], 'done')
+    db.session.expire_all()
+    self.assertEqual(Todo.query.get(1).name, 'one')